@@ -1,12 +1,28 @@
+import os
+import json
 import time
+import uuid
+import itertools
 import logging
+import contextvars
 from datetime import datetime
-from flask import Blueprint, request, jsonify
-from database import db
+from flask import Blueprint, request, jsonify, Response, stream_with_context, g, send_file, current_app
+from database import db, analytics_session, pool_status
 from models import Question, SystemStats, DocumentIndex, UserFeedback
 from data_processor import DataProcessor
 from vector_store import VectorStore
-from openai_client import OpenAIClient
+from openai_client import get_openai_client, LatencyBudget, connection_stats, prompt_cache_stats
+from indexing_job import start_indexing_job, get_current_job
+from local_index import parse_filters
+from model_router import ModelRouter
+from batch_qa import parse_batch, answer_batch
+from rate_limiter import AdmissionController, RATE_LIMIT_ENABLED
+from warm_cache import WarmCache, WARM_CACHE_ENABLED
+from log_config import request_id_var, logging_stats
+from profiler import (is_admin, request_profiles, sampling_profiler, MIN_SAMPLING_INTERVAL_MS,
+                      MAX_SAMPLING_INTERVAL_MS, MAX_PROFILE_NEXT)
+from question_log import query_questions, archive_summary
+from request_graph import RequestGraph, stage_executor, stage_stats
 import base64
 
 logger = logging.getLogger(__name__)
@@ -14,14 +30,103 @@ logger = logging.getLogger(__name__)
 # Create blueprint
 api_bp = Blueprint('api', __name__)
 
+# Wall-clock budget for one /api/ request, shared by all upstream calls it makes
+REQUEST_LATENCY_BUDGET = float(os.environ.get("REQUEST_LATENCY_BUDGET", "30"))
+
+# Documents indexed automatically when the collection is empty (0 = all)
+INITIAL_INDEX_LIMIT = int(os.environ.get("INITIAL_INDEX_LIMIT", "50"))
+
 # Initialize components
 data_processor = None
 vector_store = None
 openai_client = None
+model_router = None
+warm_cache = None
+
+# Rate limiting and load shedding for the endpoints that call upstream models
+admission = AdmissionController() if RATE_LIMIT_ENABLED else None
+ADMISSION_CONTROLLED = {'api.answer_question', 'api.answer_batch_questions'}
+
+@api_bp.before_request
+def assign_request_id():
+    """Tag every log line of this request with its id (taken from X-Request-ID when the proxy sets one)"""
+    request_id = request.headers.get('X-Request-ID', '')[:64]
+    if not request_id.replace('-', '').isalnum():
+        request_id = uuid.uuid4().hex[:16]
+    g.request_id = request_id
+    request_id_var.set(request_id)
+
+@api_bp.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '-')
+    return response
+
+@api_bp.before_request
+def admit_request():
+    """Reject over-limit clients and shed load before any expensive work starts"""
+    if admission is None or request.endpoint not in ADMISSION_CONTROLLED:
+        return None
+    
+    # A batch costs one token per question
+    cost = 1.0
+    if request.endpoint == 'api.answer_batch_questions':
+        cost = max(1.0, float(sum(1 for line in request.get_data().splitlines() if line.strip())))
+    
+    rejection = admission.admit(
+        request.remote_addr,
+        request.headers.get('X-API-Key'),
+        request.headers.get('X-Request-Start'),
+        cost
+    )
+    if rejection:
+        logger.warning(f"Rejected request from {request.remote_addr}: {rejection['reason']}")
+        response = jsonify({'error': 'Too many requests, please retry later.', 'reason': rejection['reason']})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(rejection['retry_after'])
+        return response
+    
+    g.admitted_at = time.time()
+    return None
+
+@api_bp.teardown_request
+def release_request(exc):
+    """Release the in-flight slot taken by admit_request"""
+    admitted_at = g.pop('admitted_at', None)
+    if admitted_at is not None:
+        admission.release(time.time() - admitted_at)
+    request_id_var.set('-')
+
+@api_bp.before_request
+def start_request_profile():
+    """Capture a cProfile of this request when an admin asks via X-Profile or POST /api/admin/profiler"""
+    if request.endpoint is None or request.endpoint.startswith('api.admin_'):
+        return None
+    requested = request.headers.get('X-Profile') == '1' and is_admin(request.headers.get('X-Admin-Token'))
+    if not requested and not request_profiles.take_next():
+        return None
+    profile = request_profiles.start()
+    if profile is not None:
+        g.profile = profile
+        g.profile_id = f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{g.get('request_id', '-')}"
+        g.profile_started = time.time()
+    return None
+
+@api_bp.after_request
+def add_profile_header(response):
+    if 'profile_id' in g:
+        response.headers['X-Profile-Id'] = g.profile_id
+    return response
+
+@api_bp.teardown_request
+def finish_request_profile(exc):
+    """Save the capture once the response (including a streamed body) is complete"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        request_profiles.finish(profile, g.profile_id, request.endpoint, time.time() - g.profile_started)
 
 def initialize_system():
     """Initialize the RAG system"""
-    global data_processor, vector_store, openai_client
+    global data_processor, vector_store, openai_client, model_router, warm_cache
     
     if data_processor is None:
         logger.info("Initializing TDS Virtual TA system...")
@@ -29,7 +134,14 @@ def initialize_system():
         # Initialize components
         data_processor = DataProcessor()
         vector_store = VectorStore()
-        openai_client = OpenAIClient()
+        openai_client = get_openai_client()
+        model_router = ModelRouter(openai_client)
+        if WARM_CACHE_ENABLED:
+            warm_cache = WarmCache.load()
+            if warm_cache is not None and warm_cache.embedder != vector_store.embedder.name:
+                logger.error(f"Ignoring warm cache built with {warm_cache.embedder}; "
+                             f"queries are embedded with {vector_store.embedder.name}")
+                warm_cache = None
         
         # Load data
         logger.info("Loading data...")
@@ -37,32 +149,40 @@ def initialize_system():
         
         # Check if vector store already has documents
         existing_count = vector_store.collection.count()
-        if existing_count == 0:
+        snapshot = vector_store.snapshots.current()
+        if snapshot is not None:
+            logger.info(f"Serving from snapshot {snapshot.version}, skipping indexing")
+        elif existing_count == 0:
             logger.info("Indexing documents in background...")
             # Start with a smaller dataset to handle AI Pipe token limits
-            documents = data_processor.get_all_documents(limit=50)
-            
-            # Initialize with basic documents first for immediate functionality
-            import threading
-            def background_indexing():
-                try:
-                    vector_store.index_documents(documents)
-                    logger.info("Background indexing completed!")
-                except Exception as e:
-                    logger.error(f"Background indexing failed: {e}")
-            
-            # Start background indexing
-            thread = threading.Thread(target=background_indexing, daemon=True)
-            thread.start()
+            documents = data_processor.get_all_documents(limit=INITIAL_INDEX_LIMIT or None)
+            start_indexing_job(vector_store, documents)
         else:
             logger.info(f"Found {existing_count} existing documents, skipping indexing")
         
         logger.info("System initialization complete!")
 
+def log_question(app, **fields):
+    """Store a question record on a stage worker, off the response path"""
+    def store():
+        with app.app_context():
+            try:
+                question_record = Question(**fields)
+                db.session.add(question_record)
+                db.session.commit()
+                logger.debug(f"Stored question record with ID: {question_record.id}")
+            except Exception as db_error:
+                logger.error(f"Error storing question in database: {db_error}")
+                db.session.rollback()
+    
+    stage_executor.submit(contextvars.copy_context().run, store)
+
 @api_bp.route('/api/', methods=['POST'])
 def answer_question():
     """Main API endpoint for answering questions"""
     start_time = time.time()
+    budget = LatencyBudget(REQUEST_LATENCY_BUDGET)
+    app = current_app._get_current_object()
     
     try:
         # Initialize system if needed
@@ -79,29 +199,92 @@ def answer_question():
             
         image_base64 = data.get('image')
         
-        # Validate base64 image if provided
+        # Optional structured retrieval filters (document type, date range, topic id)
+        try:
+            filters = parse_filters(data.get('filters'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filters: {e}'}), 400
+        
+        # Validate base64 image if provided, before any paid upstream call is made
         if image_base64:
             try:
-                # Validate base64 format
                 base64.b64decode(image_base64)
             except Exception:
                 return jsonify({'error': 'Invalid base64 image data'}), 400
         
-        logger.info(f"Processing question: {question[:100]}...")
-        
-        # Search for relevant documents
-        relevant_docs = vector_store.search(question, n_results=5)
+        logger.info(f"Processing question ({len(question)} chars)")
+        logger.debug(f"Question: {question[:100]}")
+        
+        # Frequent questions are answered from the warm cache: exact text first, then nearest intent
+        use_warm_cache = warm_cache is not None and not image_base64 and not filters
+        cached = warm_cache.lookup_text(question) if use_warm_cache else None
+        
+        # Everything else runs as a graph of stages: the query embedding and the snapshot's lexical
+        # lookup start together; retrieval waits for the embedding only and takes the lexical hits
+        # if they are ready by their deadline.
+        graph = None
+        relevant_docs = []
+        result = None
+        if cached is None:
+            graph = RequestGraph(budget)
+            
+            def embed():
+                query_embedding = vector_store.embedder.embed([question], budget=budget)[0]
+                return query_embedding if any(query_embedding) else None
+            graph.add('embedding', embed)
+            
+            if vector_store.snapshots.current() is not None:
+                graph.add('lexical', lambda: vector_store.lexical_lookup(question, filters))
+            
+            def retrieve():
+                query_embedding = graph.result('embedding')
+                if use_warm_cache and query_embedding is not None:
+                    hit = warm_cache.lookup(query_embedding)
+                    if hit is not None:
+                        return {'cached': hit, 'docs': []}
+                lexical_hits = None
+                if 'lexical' in graph.stages:
+                    lexical_hits = graph.result('lexical', default=None) or (None, [])
+                if query_embedding is None:
+                    # The embedding stage already went through its retries; don't embed again here
+                    return {'cached': None, 'docs': vector_store.lexical_search(question, lexical_hits, n_results=5)}
+                docs = vector_store.search(question, n_results=5, budget=budget, filters=filters,
+                                           query_embedding=query_embedding, lexical_hits=lexical_hits)
+                return {'cached': None, 'docs': docs}
+            graph.add('retrieval', retrieve, deps=['embedding'])
+            
+            def generate():
+                retrieved = graph.result('retrieval')
+                if retrieved['cached'] is not None or not retrieved['docs']:
+                    return None
+                return model_router.answer(question, retrieved['docs'], image_base64, budget=budget)
+            graph.add('generation', generate, deps=['retrieval'])
+            
+            try:
+                result = graph.result('generation')
+                retrieved = graph.result('retrieval')
+            finally:
+                # Recorded for failed requests too, so failing stages show up in /api/stats
+                timings = graph.timings('generation')
+                stage_stats.record(timings)
+            cached = retrieved['cached']
+            relevant_docs = retrieved['docs']
         
         # Prepare response data
         answer_text = None
         links = []
         relevant_docs_count = len(relevant_docs) if relevant_docs else 0
         
-        if not relevant_docs:
+        if cached is not None:
+            logger.info(f"Answered from warm cache (intent: {cached['question'][:60]})")
+            answer_text = cached['answer']
+            links = cached['links']
+            # The documents the cached answer came from, so cache-served rows count in analytics and
+            # towards the next warm cache build (entries from older builds don't record it)
+            relevant_docs_count = cached.get('relevant_docs_count') or max(1, len(links))
+        elif not relevant_docs:
             answer_text = 'I couldn\'t find relevant information in the TDS course materials to answer your question. Please try rephrasing your question or contact the teaching assistants directly.'
         else:
-            # Generate answer using OpenAI
-            result = openai_client.generate_answer(question, relevant_docs, image_base64)
             answer_text = result['answer']
             links = result['links']
         
@@ -111,69 +294,117 @@ def answer_question():
             logger.warning(f"Response took {elapsed_time:.2f} seconds")
         
         # Store question and response in database
-        try:
-            user_ip = request.environ.get('REMOTE_ADDR', 'unknown')
-            user_agent = request.headers.get('User-Agent', '')
-            
-            question_record = Question(
-                question_text=question,
-                has_image=bool(image_base64),
-                answer_text=answer_text,
-                response_time=elapsed_time,
-                relevant_docs_count=relevant_docs_count,
-                links_provided=links,
-                user_ip=user_ip,
-                user_agent=user_agent
-            )
-            
-            db.session.add(question_record)
-            db.session.commit()
-            logger.info(f"Stored question record with ID: {question_record.id}")
-            
-        except Exception as db_error:
-            logger.error(f"Error storing question in database: {db_error}")
-            db.session.rollback()
+        log_question(
+            app,
+            question_text=question,
+            has_image=bool(image_base64),
+            answer_text=answer_text,
+            response_time=elapsed_time,
+            relevant_docs_count=relevant_docs_count,
+            links_provided=links,
+            user_ip=request.environ.get('REMOTE_ADDR', 'unknown'),
+            user_agent=request.headers.get('User-Agent', '')
+        )
         
         logger.info(f"Question answered in {elapsed_time:.2f} seconds")
         
-        return jsonify({
+        response = jsonify({
             'answer': answer_text,
             'links': links,
             'response_time': round(elapsed_time, 2)
         })
+        if graph is not None:
+            response.headers['Server-Timing'] = graph.server_timing(timings)
+            logger.info(f"Critical path: {' > '.join(timings['critical_path'])} ({timings['total_ms']}ms)")
+        return response
         
     except Exception as e:
         logger.error(f"Error processing question: {e}")
         
         # Try to store failed request in database
         try:
-            elapsed_time = time.time() - start_time
-            user_ip = request.environ.get('REMOTE_ADDR', 'unknown')
-            user_agent = request.headers.get('User-Agent', '')
-            
-            question_record = Question(
+            log_question(
+                app,
                 question_text=data.get('question', 'ERROR') if 'data' in locals() else 'PARSE_ERROR',
                 has_image=bool(data.get('image')) if 'data' in locals() else False,
                 answer_text=f"ERROR: {str(e)}",
-                response_time=elapsed_time,
+                response_time=time.time() - start_time,
                 relevant_docs_count=0,
                 links_provided=[],
-                user_ip=user_ip,
-                user_agent=user_agent
+                user_ip=request.environ.get('REMOTE_ADDR', 'unknown'),
+                user_agent=request.headers.get('User-Agent', '')
             )
-            
-            db.session.add(question_record)
-            db.session.commit()
-            
         except Exception as db_error:
             logger.error(f"Error storing failed request: {db_error}")
-            db.session.rollback()
         
         return jsonify({
             'error': 'An internal error occurred while processing your question.',
             'details': str(e)
         }), 500
 
+@api_bp.route('/api/batch', methods=['POST'])
+def answer_batch_questions():
+    """Answer a JSONL batch of questions, streaming JSONL results back in input order"""
+    try:
+        initialize_system()
+        items = parse_batch(request.get_data(as_text=True).splitlines())
+    except ValueError as e:
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error initializing batch: {e}")
+        return jsonify({
+            'error': 'An internal error occurred while processing the batch.',
+            'details': str(e)
+        }), 500
+    
+    logger.info(f"Processing batch of {len(items)} questions")
+    user_ip = request.environ.get('REMOTE_ADDR', 'unknown')
+    user_agent = request.headers.get('User-Agent', '')
+    results = answer_batch(items, vector_store, model_router)
+    
+    # Retrieval for the whole batch runs before the first result; fail the request if it breaks
+    try:
+        first = next(results)
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}")
+        return jsonify({
+            'error': 'An internal error occurred while processing the batch.',
+            'details': str(e)
+        }), 500
+    
+    def generate():
+        rows = []
+        try:
+            for record in itertools.chain([first], results):
+                rows.append(record)
+                yield json.dumps(record) + '\n'
+        finally:
+            # Stop queued answers if the client went away, then store what was answered
+            results.close()
+            store_batch_rows(rows)
+    
+    def store_batch_rows(rows):
+        """One bulk insert for the whole batch instead of a commit per question"""
+        try:
+            db.session.bulk_insert_mappings(Question, [{
+                'question_text': record['question'],
+                'has_image': bool(items[record['index']]['image']),
+                'answer_text': record['answer'] if record.get('answer') is not None else f"ERROR: {record.get('error')}",
+                'response_time': record['response_time'],
+                'relevant_docs_count': record['relevant_docs_count'],
+                'links_provided': record['links'],
+                'created_at': datetime.utcnow(),
+                'user_ip': user_ip,
+                'user_agent': user_agent
+            } for record in rows])
+            db.session.commit()
+            logger.info(f"Stored {len(rows)} batch question records")
+        except Exception as db_error:
+            logger.error(f"Error storing batch questions in database: {db_error}")
+            db.session.rollback()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @api_bp.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -201,33 +432,46 @@ def get_stats():
         discourse_posts_count = len(data_processor.discourse_posts)
         total_indexed = vector_store.collection.count()
         
-        # Get database statistics
-        total_questions = db.session.query(Question).count()
-        successful_responses = db.session.query(Question).filter(
-            ~Question.answer_text.like('ERROR:%')
-        ).count()
-        failed_responses = total_questions - successful_responses
-        
-        # Calculate average response time
-        avg_response_time = db.session.query(db.func.avg(Question.response_time)).scalar() or 0.0
-        
-        # Get questions with images count
-        questions_with_images = db.session.query(Question).filter(
-            Question.has_image == True
-        ).count()
-        
-        # Get recent activity (last 24 hours)
+        # Get database statistics (analytics pool, kept off the question-answering path)
         from datetime import timedelta
-        recent_cutoff = datetime.utcnow() - timedelta(hours=24)
-        recent_questions = db.session.query(Question).filter(
-            Question.created_at >= recent_cutoff
-        ).count()
+        with analytics_session() as session:
+            total_questions = session.query(Question).count()
+            successful_responses = session.query(Question).filter(
+                ~Question.answer_text.like('ERROR:%')
+            ).count()
+            failed_responses = total_questions - successful_responses
+        
+            # Calculate average response time
+            avg_response_time = session.query(db.func.avg(Question.response_time)).scalar() or 0.0
+        
+            # Get questions with images count
+            questions_with_images = session.query(Question).filter(
+                Question.has_image == True
+            ).count()
+        
+            # Get recent activity (last 24 hours)
+            recent_cutoff = datetime.utcnow() - timedelta(hours=24)
+            recent_questions = session.query(Question).filter(
+                Question.created_at >= recent_cutoff
+            ).count()
         
         return jsonify({
             'system_status': 'ready',
             'course_content_documents': course_content_count,
             'discourse_posts': discourse_posts_count,
             'indexed_documents': total_indexed,
+            'deduplication': data_processor.deduplicator.report(),
+            'openai_connections': connection_stats.snapshot(),
+            'routing': model_router.stats(),
+            'prompt_cache': prompt_cache_stats.snapshot(),
+            'admission': admission.stats() if admission else {'enabled': False},
+            'warm_cache': warm_cache.stats() if warm_cache else {'entries': 0},
+            'snapshot': vector_store.snapshots.stats(),
+            'shards': vector_store.shards.stats(),
+            'database_pools': pool_status(),
+            'logging': logging_stats(),
+            'question_archive': archive_summary(),
+            'request_stages': stage_stats.snapshot(),
             'database_stats': {
                 'total_questions': total_questions,
                 'successful_responses': successful_responses,
@@ -242,34 +486,99 @@ def get_stats():
         logger.error(f"Error getting stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+def positive_int(value):
+    """None for a missing option, otherwise a positive int; raises ValueError for anything else"""
+    if value is None:
+        return None
+    # Whole numbers only: bool is an int subclass and int() would truncate floats
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit() \
+            or int(value) <= 0:
+        raise ValueError(f"expected a positive integer, got {value!r}")
+    return int(value)
+
+@api_bp.route('/api/index', methods=['POST'])
+def start_index():
+    """Start a background (re)indexing job (admin only)"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        limit = positive_int(data.get('limit'))
+        batch_size = positive_int(data.get('batch_size'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid indexing options: {e}'}), 400
+    
+    try:
+        initialize_system()
+        
+        documents = data_processor.get_all_documents(limit=limit)
+        job = start_indexing_job(vector_store, documents, batch_size)
+        if job is None:
+            return jsonify({'error': 'An indexing job is already running'}), 409
+        
+        return jsonify({'message': 'Indexing job started', 'status': job.status()}), 202
+        
+    except Exception as e:
+        logger.error(f"Error starting indexing job: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/api/index/status', methods=['GET'])
+def index_status():
+    """Progress and ETA of the current indexing job"""
+    job = get_current_job()
+    indexed_documents = vector_store.collection.count() if vector_store else None
+    
+    if job is None:
+        return jsonify({'state': 'idle', 'indexed_documents': indexed_documents})
+    
+    status = job.status()
+    status['indexed_documents'] = indexed_documents
+    return jsonify(status)
+
+@api_bp.route('/api/index/cancel', methods=['POST'])
+def cancel_index():
+    """Cancel the running indexing job after its current batch (admin only)"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    job = get_current_job()
+    if job is None or not job.is_running():
+        return jsonify({'error': 'No indexing job is running'}), 404
+    
+    job.cancel()
+    return jsonify({'message': 'Cancellation requested', 'status': job.status()}), 202
+
 @api_bp.route('/api/questions', methods=['GET'])
 def get_questions():
-    """Get recent questions and responses"""
+    """Get recent questions and responses (?archive=true pages on into archived months)"""
     try:
         # Get query parameters
         limit = request.args.get('limit', 50, type=int)
         offset = request.args.get('offset', 0, type=int)
+        include_archive = request.args.get('archive', 'false').lower() == 'true'
         
         # Limit to reasonable values
         limit = min(limit, 100)
         
         # Query recent questions
-        questions = db.session.query(Question).order_by(
-            Question.created_at.desc()
-        ).offset(offset).limit(limit).all()
+        with analytics_session() as session:
+            questions = query_questions(session, limit=limit, offset=offset, include_archive=include_archive)
         
         # Format response
         results = []
         for q in questions:
             results.append({
-                'id': q.id,
-                'question': q.question_text[:200] + '...' if len(q.question_text) > 200 else q.question_text,
-                'has_image': q.has_image,
-                'response_time': q.response_time,
-                'relevant_docs_count': q.relevant_docs_count,
-                'links_count': len(q.links_provided) if q.links_provided else 0,
-                'created_at': q.created_at.isoformat(),
-                'success': not q.answer_text.startswith('ERROR:') if q.answer_text else False
+                'id': q['id'],
+                'question': q['question_text'][:200] + '...' if len(q['question_text']) > 200 else q['question_text'],
+                'has_image': q['has_image'],
+                'response_time': q['response_time'],
+                'relevant_docs_count': q['relevant_docs_count'],
+                'links_count': len(q['links_provided']) if q['links_provided'] else 0,
+                'created_at': q['created_at'].isoformat(),
+                'success': not q['answer_text'].startswith('ERROR:') if q['answer_text'] else False
             })
         
         return jsonify({
@@ -283,6 +592,75 @@ def get_questions():
         logger.error(f"Error getting questions: {e}")
         return jsonify({'error': str(e)}), 500
 
+def admin_denied():
+    """403 response unless the request carries the admin token"""
+    if is_admin(request.headers.get('X-Admin-Token')):
+        return None
+    return jsonify({'error': 'Admin token required'}), 403
+
+@api_bp.route('/api/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    """Toggle the sampling profiler and/or profile the next N requests"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        interval_ms = data.get('interval_ms')
+        if interval_ms is not None and (isinstance(interval_ms, bool) or not isinstance(interval_ms, (int, float))
+                                        or not MIN_SAMPLING_INTERVAL_MS <= interval_ms <= MAX_SAMPLING_INTERVAL_MS):
+            return jsonify({'error': f'interval_ms must be a number from {MIN_SAMPLING_INTERVAL_MS:g} '
+                                     f'to {MAX_SAMPLING_INTERVAL_MS:g}'}), 400
+        profile_next = data.get('profile_next')
+        if 'profile_next' in data and (isinstance(profile_next, bool) or not isinstance(profile_next, int)
+                                       or not 0 <= profile_next <= MAX_PROFILE_NEXT):
+            return jsonify({'error': f'profile_next must be an integer from 0 to {MAX_PROFILE_NEXT}'}), 400
+        
+        if data.get('enabled') is True:
+            sampling_profiler.start(interval_ms)
+        elif data.get('enabled') is False:
+            sampling_profiler.stop()
+        if data.get('reset'):
+            sampling_profiler.reset()
+        if 'profile_next' in data:
+            request_profiles.request_next(profile_next)
+    
+    return jsonify({
+        'sampling': sampling_profiler.stats(),
+        'profile_next': request_profiles.profile_next,
+        'profiles': request_profiles.list()[:20]
+    })
+
+@api_bp.route('/api/admin/profiler/stacks', methods=['GET'])
+def admin_profiler_stacks():
+    """Download the sampling profiler's collapsed stacks (for flamegraph.pl or speedscope)"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    response = Response(sampling_profiler.collapsed(), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f"attachment; filename=stacks-{os.getpid()}.txt"
+    return response
+
+@api_bp.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def admin_profile(profile_id):
+    """Download one request's .prof file, or a text report with ?format=text"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    path = request_profiles.path(profile_id)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('format') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'ncalls'):
+            return jsonify({'error': 'sort must be cumulative, tottime or ncalls'}), 400
+        report = request_profiles.report(profile_id, sort)
+        return Response(report, mimetype='text/plain')
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=f"{profile_id}.prof")
+
 @api_bp.route('/api/feedback', methods=['POST'])
 def submit_feedback():
     """Submit feedback for a question response"""
@@ -17,13 +17,15 @@ def load_env_file():
 
 load_env_file()
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging: JSON lines written by a background thread (see log_config.py)
+from log_config import setup_logging
+setup_logging()
 
 # Create the Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+# X-Forwarded-For hops to trust, so REMOTE_ADDR (used for rate limiting) is the real client
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ.get("TRUSTED_PROXY_HOPS", "1")), x_proto=1, x_host=1)
 
 # Initialize database
 from database import init_database
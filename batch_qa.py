@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Batch question answering for the TDS Virtual TA
+
+Server side, answer_batch() runs a whole batch through one embedding pass and one
+multi-query vector search, then fans the answer generation out over a bounded
+thread pool and yields results in input order. The /api/batch endpoint streams
+those results back as JSONL.
+
+From the command line, this script posts a JSONL file of questions to /api/batch
+and writes the streamed answers as they arrive.
+
+Usage:
+    python batch_qa.py questions.jsonl --url http://127.0.0.1:5000/api/batch --output answers.jsonl
+
+Each input line is {"question": ..., "id"?: ..., "image"?: ..., "filters"?: ...}.
+
+Author: TDS Virtual TA
+License: MIT
+"""
+
+import argparse
+import base64
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator
+
+import requests
+
+from local_index import parse_filters
+from openai_client import LatencyBudget
+
+logger = logging.getLogger(__name__)
+
+# Largest batch accepted in one request
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", "500"))
+# Answer generations in flight at once for one batch
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+# Budget for the shared embedding + retrieval pass, and for each answer once it starts
+BATCH_RETRIEVAL_BUDGET = float(os.environ.get("BATCH_RETRIEVAL_BUDGET", "120"))
+BATCH_ANSWER_BUDGET = float(os.environ.get("BATCH_ANSWER_BUDGET", "30"))
+
+NO_CONTEXT_ANSWER = ('I couldn\'t find relevant information in the TDS course materials to answer your question. '
+                     'Please try rephrasing your question or contact the teaching assistants directly.')
+
+
+def parse_batch(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """Validate JSONL batch input; raises ValueError naming the offending line"""
+    items = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {line_number}: invalid JSON ({e.msg})")
+        if not isinstance(data, dict) or not str(data.get('question', '')).strip():
+            raise ValueError(f"line {line_number}: 'question' is required")
+
+        image_base64 = data.get('image')
+        if image_base64:
+            try:
+                base64.b64decode(image_base64)
+            except Exception:
+                raise ValueError(f"line {line_number}: invalid base64 image data")
+        try:
+            filters = parse_filters(data.get('filters'))
+        except ValueError as e:
+            raise ValueError(f"line {line_number}: invalid filters ({e})")
+
+        items.append({
+            'id': data.get('id'),
+            'question': str(data['question']).strip(),
+            'image': image_base64,
+            'filters': filters
+        })
+        if len(items) > BATCH_MAX_QUESTIONS:
+            raise ValueError(f"batch exceeds {BATCH_MAX_QUESTIONS} questions")
+
+    if not items:
+        raise ValueError("batch contains no questions")
+    return items
+
+
+def answer_batch(items: List[Dict[str, Any]], vector_store, model_router,
+                 concurrency: int = BATCH_CONCURRENCY) -> Iterator[Dict[str, Any]]:
+    """Answer a parsed batch, yielding one result per item in input order
+
+    At most concurrency * 2 answers are queued ahead of the consumer. When the consumer stops
+    early (a streaming client disconnects), answers not yet started are cancelled.
+    """
+    started = time.time()
+    relevant_docs = vector_store.search_batch(
+        [item['question'] for item in items],
+        n_results=5,
+        budget=LatencyBudget(BATCH_RETRIEVAL_BUDGET),
+        filters=[item['filters'] for item in items]
+    )
+    retrieval_time = time.time() - started
+    logger.info(f"Retrieved context for {len(items)} questions in {retrieval_time:.2f} seconds")
+
+    def answer_one(index: int) -> Dict[str, Any]:
+        item, docs = items[index], relevant_docs[index]
+        answer_started = time.time()
+        record = {'index': index, 'id': item['id'], 'question': item['question'],
+                  'relevant_docs_count': len(docs or [])}
+        try:
+            if docs is None:
+                # Embedding failed: there was no retrieval, so "nothing relevant found" would be wrong
+                record.update(answer=None, links=[], error='Could not embed the question')
+            elif docs:
+                result = model_router.answer(item['question'], docs, item['image'],
+                                             budget=LatencyBudget(BATCH_ANSWER_BUDGET))
+                record.update(answer=result['answer'], links=result['links'], model=result.get('model'))
+            else:
+                record.update(answer=NO_CONTEXT_ANSWER, links=[], model=None)
+        except Exception as e:
+            logger.error(f"Error answering batch item {index}: {e}")
+            record.update(answer=None, links=[], error=str(e))
+        record['response_time'] = round(retrieval_time + time.time() - answer_started, 2)
+        return record
+
+    concurrency = max(1, concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    futures = deque()
+    submitted = 0
+    try:
+        # Results complete out of order; yielding in submission order keeps the stream aligned with the input
+        while submitted < len(items) or futures:
+            while submitted < len(items) and len(futures) < concurrency * 2:
+                # Each worker runs in a copy of the request's context so its log lines keep the request id
+                futures.append(executor.submit(contextvars.copy_context().run, answer_one, submitted))
+                submitted += 1
+            yield futures.popleft().result()
+        logger.info(f"Answered batch of {len(items)} questions in {time.time() - started:.2f} seconds")
+    finally:
+        # Normally nothing is left; after an early close this drops the queued answers
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Answer a JSONL file of questions through /api/batch')
+    parser.add_argument('questions', help='JSONL file with one {"question": ...} object per line')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/batch', help='Batch endpoint URL')
+    parser.add_argument('--output', default='answers.jsonl', help='Where to write the JSONL answers')
+    parser.add_argument('--timeout', type=float, default=600.0, help='Read timeout in seconds')
+
+    args = parser.parse_args()
+
+    with open(args.questions, 'rb') as f:
+        body = f.read()
+
+    started = time.time()
+    answered, failed = 0, 0
+    try:
+        with requests.post(args.url, data=body, headers={'Content-Type': 'application/x-ndjson'},
+                           stream=True, timeout=(10, args.timeout)) as response:
+            if response.status_code != 200:
+                logger.error(f"Batch rejected ({response.status_code}): {response.text[:500]}")
+                return 1
+            with open(args.output, 'w', encoding='utf-8') as out:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    out.write(line + '\n')
+                    if json.loads(line).get('error'):
+                        failed += 1
+                    else:
+                        answered += 1
+    except requests.RequestException as e:
+        logger.error(f"Batch request failed: {e}")
+        return 1
+
+    logger.info(f"Wrote {answered + failed} answers to {args.output} ({failed} failed) "
+                f"in {time.time() - started:.2f} seconds")
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
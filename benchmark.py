@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Retrieval benchmarks for the TDS Virtual TA
+
+Runs offline measurements against a ChromaDB directory (use a copy of chroma_db,
+ChromaDB rewrites its files when opened).
+
+Usage:
+    python benchmark.py rerank --chroma-path /tmp/chroma_db --queries queries.jsonl
+    python benchmark.py quantization --chroma-path /tmp/chroma_db
+    python benchmark.py snapshot --chroma-path /tmp/chroma_db
+    python benchmark.py embedders --chroma-path /tmp/chroma_db --backends openai local
+    python benchmark.py logging --requests 2000
+
+Queries files are JSONL with {"question": ..., "expected_url": ...} per line. Without
+one, known-item queries are sampled from the indexed documents themselves.
+
+Author: TDS Virtual TA
+License: MIT
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import time
+from typing import List, Dict, Any, Optional
+
+import chromadb
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_collection(path: str, name: str = "tds_knowledge_base"):
+    """Open a ChromaDB collection read for benchmarking"""
+    client = chromadb.PersistentClient(path=path)
+    return client.get_collection(name=name)
+
+
+def load_queries(path: Optional[str], collection, sample: int, seed: int) -> List[Dict[str, str]]:
+    """Labelled queries from JSONL, or known-item queries sampled from document text"""
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    rng = random.Random(seed)
+    data = collection.get(include=['documents', 'metadatas'])
+    queries = []
+    for document, metadata in zip(data['documents'], data['metadatas']):
+        words = document.split()
+        if len(words) < 20 or not metadata.get('url'):
+            continue
+        start = rng.randrange(0, len(words) - 12)
+        queries.append({'question': ' '.join(words[start:start + 12]), 'expected_url': metadata['url']})
+
+    rng.shuffle(queries)
+    return queries[:sample]
+
+
+def summarize_ms(values: List[float]) -> Dict[str, float]:
+    """p50/p95/max of a list of millisecond timings"""
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    array = np.array(values)
+    return {
+        'p50': round(float(np.percentile(array, 50)), 2),
+        'p95': round(float(np.percentile(array, 95)), 2),
+        'max': round(float(array.max()), 2),
+    }
+
+
+def rank_of(results: List[Dict[str, Any]], expected_url: str) -> Optional[int]:
+    """1-based rank of the first result whose URL matches, None if absent"""
+    for rank, result in enumerate(results, start=1):
+        if result['metadata'].get('url') == expected_url:
+            return rank
+    return None
+
+
+def quality(ranks: List[Optional[int]], k: int) -> Dict[str, float]:
+    """hit@k and MRR@k over a list of ranks"""
+    hits = [r for r in ranks if r is not None and r <= k]
+    return {
+        f'hit@{k}': round(len(hits) / len(ranks), 4) if ranks else 0.0,
+        f'mrr@{k}': round(sum(1.0 / r for r in hits) / len(ranks), 4) if ranks else 0.0,
+    }
+
+
+def bench_rerank(args) -> Dict[str, Any]:
+    """Compare distance-only top-k with reranked top-k over the same candidates"""
+    from openai_client import get_openai_client
+    from reranker import Reranker
+
+    collection = load_collection(args.chroma_path)
+    queries = load_queries(args.queries, collection, args.sample, args.seed)
+    if not queries:
+        raise ValueError("No queries available for the benchmark")
+
+    embeddings = get_openai_client().get_embeddings([q['question'] for q in queries])
+    reranker = Reranker(budget_ms=args.budget_ms)
+    n_candidates = min(args.candidates, collection.count())
+
+    baseline_ranks, reranked_ranks, rerank_ms = [], [], []
+    budget_exceeded = 0
+
+    for query, embedding in zip(queries, embeddings):
+        results = collection.query(query_embeddings=[embedding], n_results=n_candidates,
+                                   include=['documents', 'metadatas', 'distances'])
+        candidates = [
+            {'content': doc, 'metadata': meta, 'distance': dist}
+            for doc, meta, dist in zip(results['documents'][0], results['metadatas'][0], results['distances'][0])
+        ]
+
+        reranked, info = reranker.rerank(query['question'], candidates, args.top_k)
+        rerank_ms.append(info['rerank_ms'])
+        budget_exceeded += int(info['budget_exceeded'])
+
+        baseline_ranks.append(rank_of(candidates[:args.top_k], query['expected_url']))
+        reranked_ranks.append(rank_of(reranked, query['expected_url']))
+
+    return {
+        'queries': len(queries),
+        'candidates': n_candidates,
+        'top_k': args.top_k,
+        'baseline': quality(baseline_ranks, args.top_k),
+        'reranked': quality(reranked_ranks, args.top_k),
+        'rerank_latency_ms': summarize_ms(rerank_ms),
+        'budget_ms': args.budget_ms,
+        'budget_exceeded': budget_exceeded,
+    }
+
+
+def directory_size(path: str) -> int:
+    """Total size in bytes of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def bench_quantization(args) -> Dict[str, Any]:
+    """Memory and recall of compact vector storage against exact float32 search"""
+    from local_index import LocalIndex
+    from quantization import QuantizedMatrix, normalize
+
+    collection = load_collection(args.chroma_path)
+    data = collection.get(include=['embeddings'])
+    ids = data['ids']
+    matrix = normalize(np.asarray(data['embeddings'], dtype=np.float32))
+    if len(ids) < 2:
+        raise ValueError("The collection needs at least two documents")
+
+    # Stored vectors double as queries; a tiny perturbation keeps them from matching themselves exactly
+    rng = np.random.default_rng(args.seed)
+    sample = rng.choice(len(ids), size=min(args.sample, len(ids)), replace=False)
+    queries = normalize(matrix[sample] + rng.normal(0, 0.01, size=(len(sample), matrix.shape[1])).astype(np.float32))
+    k = min(args.top_k, len(ids))
+
+    exact_index = LocalIndex(ids, [{} for _ in ids], QuantizedMatrix('float32', None))
+    exact_index.vectors.extend(matrix)
+    truth = [{doc_id for doc_id, _ in exact_index.search(q, None, k)} for q in queries]
+
+    def fetch_vectors(doc_ids: List[str]) -> np.ndarray:
+        positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        return matrix[[positions[doc_id] for doc_id in doc_ids]]
+
+    configurations = [('float32', None)] + [(storage, None) for storage in ('float16', 'int8')]
+    configurations += [(storage, dims) for dims in args.dimensions for storage in ('float32', 'int8')
+                       if dims < matrix.shape[1]]
+
+    results = []
+    for storage, dims in configurations:
+        vectors = QuantizedMatrix(storage, dims)
+        vectors.extend(matrix)
+        for rescore in ([False] if vectors.exact else [False, True]):
+            index = LocalIndex(ids, [{} for _ in ids], vectors, fetch_vectors if rescore else None)
+            timings, recalls = [], []
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                found = {doc_id for doc_id, _ in index.search(query, None, k)}
+                timings.append((time.perf_counter() - started) * 1000)
+                recalls.append(len(found & expected) / len(expected))
+            results.append({
+                'storage': storage,
+                'dimensions': dims or matrix.shape[1],
+                'rescore': rescore,
+                'vector_bytes': vectors.nbytes,
+                'memory_ratio': round(vectors.nbytes / matrix.nbytes, 4),
+                f'recall@{k}': round(float(np.mean(recalls)), 4),
+                'search_latency_ms': summarize_ms(timings),
+            })
+
+    return {
+        'documents': len(ids),
+        'dimensions': matrix.shape[1],
+        'queries': len(queries),
+        'chroma_db_bytes': directory_size(args.chroma_path),
+        'float32_vector_bytes': matrix.nbytes,
+        'configurations': results,
+    }
+
+
+def bench_snapshot(args) -> Dict[str, Any]:
+    """Time to bring retrieval up from ChromaDB versus from a snapshot"""
+    import shutil
+    import tempfile
+    from local_index import LocalIndex
+    from snapshot import build_snapshot, Snapshot
+
+    started = time.perf_counter()
+    collection = load_collection(args.chroma_path)
+    index = LocalIndex.from_collection(collection)
+    from_collection_seconds = time.perf_counter() - started
+
+    root = tempfile.mkdtemp(prefix='snapshot-bench-')
+    try:
+        started = time.perf_counter()
+        version = build_snapshot(collection, root)
+        build_seconds = time.perf_counter() - started
+        path = os.path.join(root, version)
+
+        loads = {}
+        for verify_files in (True, False):
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                Snapshot(path, verify_files=verify_files)
+                timings.append((time.perf_counter() - started) * 1000)
+            loads['verified' if verify_files else 'unverified'] = summarize_ms(timings)
+
+        return {
+            'documents': index.count,
+            'collection_load_seconds': round(from_collection_seconds, 3),
+            'snapshot_build_seconds': round(build_seconds, 3),
+            'snapshot_bytes': directory_size(path),
+            'chroma_db_bytes': directory_size(args.chroma_path),
+            'snapshot_load_ms': loads,
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def bench_embedders(args) -> Dict[str, Any]:
+    """Indexing throughput, query latency and retrieval quality of each embedding backend"""
+    from embedders import create_embedder, SentenceTransformer
+    from quantization import normalize
+
+    collection = load_collection(args.chroma_path)
+    data = collection.get(include=['documents', 'metadatas'])
+    rng = random.Random(args.seed)
+    positions = list(range(len(data['ids'])))
+    rng.shuffle(positions)
+    positions = sorted(positions[:args.documents])
+    documents = [data['documents'][i] for i in positions]
+    metadatas = [data['metadatas'][i] for i in positions]
+    sampled_urls = {metadata.get('url') for metadata in metadatas}
+    queries = [q for q in load_queries(args.queries, collection, args.sample * 4, args.seed)
+               if q['expected_url'] in sampled_urls][:args.sample]
+    if not documents or not queries:
+        raise ValueError("No documents or queries available for the benchmark")
+    k = min(args.top_k, len(documents))
+
+    results = []
+    for backend in args.backends:
+        if backend == 'local' and SentenceTransformer is None:
+            results.append({'backend': backend, 'skipped': "sentence-transformers is not installed"})
+            continue
+        embedder = create_embedder(backend)
+        embedder.embed([queries[0]['question']])  # load the model / open the connection before timing
+
+        started = time.perf_counter()
+        matrix = normalize(np.asarray(embedder.embed(documents, batch_size=args.batch_size), dtype=np.float32))
+        index_seconds = time.perf_counter() - started
+
+        timings, ranks = [], []
+        for query in queries:
+            started = time.perf_counter()
+            embedding = np.asarray(embedder.embed([query['question']])[0], dtype=np.float32)
+            timings.append((time.perf_counter() - started) * 1000)
+            top = np.argsort(-(matrix @ embedding), kind='stable')[:k]
+            ranks.append(rank_of([{'metadata': metadatas[i]} for i in top], query['expected_url']))
+
+        results.append({
+            'backend': backend,
+            'model': embedder.model,
+            'dimensions': matrix.shape[1],
+            'index_docs_per_second': round(len(documents) / index_seconds, 1) if index_seconds else 0.0,
+            'query_embedding_ms': summarize_ms(timings),
+            **quality(ranks, k),
+        })
+
+    return {
+        'documents': len(documents),
+        'queries': len(queries),
+        'top_k': k,
+        'backends': results,
+    }
+
+
+# Log calls made while serving one /api/ request: (logger, level, message)
+REQUEST_LOG_PATTERN = [
+    ('api_routes', logging.INFO, "Processing question (84 chars)"),
+    ('openai_client', logging.DEBUG, "Processing embedding chunk 1/1 with 1 items"),
+    ('httpcore.connection', logging.DEBUG, "connect_tcp.started host='aipipe.org' port=443"),
+    ('httpcore.http11', logging.DEBUG, "send_request_headers.started request=<Request [b'POST']>"),
+    ('httpcore.http11', logging.DEBUG, "receive_response_headers.complete return_value=(b'HTTP/1.1', 200)"),
+    ('httpx', logging.INFO, 'HTTP Request: POST https://aipipe.org/openai/v1/embeddings "HTTP/1.1 200 OK"'),
+    ('openai_client', logging.INFO, "Generated 1 embeddings successfully"),
+    ('vector_store', logging.DEBUG, "Reranked 40 candidates in 3.1ms"),
+    ('vector_store', logging.INFO, "Found 5 relevant documents"),
+    ('httpcore.http11', logging.DEBUG, "send_request_body.complete"),
+    ('httpx', logging.INFO, 'HTTP Request: POST https://aipipe.org/openai/v1/chat/completions "HTTP/1.1 200 OK"'),
+    ('openai_client', logging.INFO, "gpt-4o-mini prompt: 2781 tokens, 2688 cached"),
+    ('model_router', logging.INFO, "Answered with gpt-4o-mini (route: simple)"),
+    ('api_routes', logging.DEBUG, "Stored question record with ID: 1234"),
+    ('api_routes', logging.INFO, "Question answered in 1.52 seconds"),
+]
+
+
+class LogSink:
+    """Where benchmark log lines go: a file, or a pipe drained by a reader (like stderr under a supervisor)"""
+
+    def __init__(self, kind: str, delay_ms: float = 0.0):
+        import tempfile
+        import threading
+        self.kind = kind
+        self.lines = 0
+        if kind == 'file':
+            self.stream = tempfile.TemporaryFile('w+', encoding='utf-8')
+            return
+        read_fd, write_fd = os.pipe()
+        self.stream = os.fdopen(write_fd, 'w', encoding='utf-8')
+
+        def drain():
+            with os.fdopen(read_fd, 'rb') as reader:
+                while True:
+                    chunk = reader.read1(65536)
+                    if not chunk:
+                        break
+                    self.lines += chunk.count(b'\n')
+                    if delay_ms:
+                        time.sleep(delay_ms / 1000)
+
+        self.reader = threading.Thread(target=drain, daemon=True)
+        self.reader.start()
+
+    def close(self) -> int:
+        """Close the sink and return the number of lines written"""
+        if self.kind == 'file':
+            self.stream.seek(0)
+            self.lines = sum(1 for _ in self.stream)
+            self.stream.close()
+        else:
+            self.stream.close()
+            self.reader.join()
+        return self.lines
+
+
+def bench_logging(args) -> Dict[str, Any]:
+    """Time spent on the request thread logging one request, synchronous versus queued"""
+    from log_config import build_queue_logging, parse_mapping, request_id_var, LOG_LEVELS, LOG_SAMPLE_RATES
+
+    sample_rates = {f"bench.{name}": float(rate) for name, rate in parse_mapping(LOG_SAMPLE_RATES).items()}
+    configurations = [
+        ('sync-debug', 'sync', logging.DEBUG, False, None),
+        ('sync-info', 'sync', logging.INFO, True, None),
+        ('queue-json', 'queue', logging.INFO, True, None),
+        ('queue-json-sampled', 'queue', logging.INFO, True, sample_rates),
+    ]
+
+    results = []
+    for label, mode, level, library_levels, rates in configurations:
+        root = logging.getLogger(f"bench.{label}")
+        loggers = {name: logging.getLogger(f"bench.{label}.{name}") for name, _, _ in REQUEST_LOG_PATTERN}
+        root.propagate = False
+        root.setLevel(level)
+        if library_levels:
+            for name, logger_level in parse_mapping(LOG_LEVELS).items():
+                logging.getLogger(f"bench.{label}.{name}").setLevel(logger_level.upper())
+
+        sink = LogSink(args.sink, args.sink_delay_ms)
+        if mode == 'sync':
+            handler = logging.StreamHandler(sink.stream)
+            handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+            listener = None
+        else:
+            prefixed = {name.replace('bench.', f"bench.{label}.", 1): rate for name, rate in (rates or {}).items()}
+            handler, listener = build_queue_logging(sink.stream, 'json', prefixed)
+        root.addHandler(handler)
+
+        timings = []
+        for i in range(args.requests):
+            request_id_var.set(f"{i:016x}")
+            started = time.perf_counter()
+            for name, record_level, message in REQUEST_LOG_PATTERN:
+                loggers[name].log(record_level, message)
+            timings.append((time.perf_counter() - started) * 1000)
+        request_id_var.set('-')
+
+        drain_started = time.perf_counter()
+        if listener:
+            listener.stop()
+        handler.flush()
+        root.removeHandler(handler)
+        lines = sink.close()
+        drain_seconds = time.perf_counter() - drain_started
+
+        results.append({
+            'configuration': label,
+            'request_thread_ms': summarize_ms(timings),
+            'mean_request_thread_us': round(float(np.mean(timings)) * 1000, 1),
+            'lines_per_request': round(lines / args.requests, 2),
+            'writer_drain_seconds': round(drain_seconds, 3),
+            'dropped_queue_full': getattr(handler, 'dropped', 0),
+        })
+
+    return {
+        'requests': args.requests,
+        'sink': args.sink,
+        'sink_delay_ms': args.sink_delay_ms,
+        'log_calls_per_request': len(REQUEST_LOG_PATTERN),
+        'configurations': results,
+    }
+
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Retrieval benchmarks for the TDS Virtual TA')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', help='Also write the report to this JSON file')
+
+    rerank = subparsers.add_parser('rerank', parents=[common], help='Latency and quality of the local reranking stage')
+    rerank.add_argument('--chroma-path', default='./chroma_db', help='ChromaDB directory (use a copy)')
+    rerank.add_argument('--queries', help='JSONL file with question/expected_url pairs')
+    rerank.add_argument('--sample', type=int, default=50, help='Known-item queries to sample without --queries')
+    rerank.add_argument('--candidates', type=int, default=50, help='Candidates fetched before reranking')
+    rerank.add_argument('--top-k', type=int, default=5, help='Results kept after reranking')
+    rerank.add_argument('--budget-ms', type=float, default=25.0, help='Per-query rerank CPU budget')
+    rerank.add_argument('--seed', type=int, default=42, help='Random seed for query sampling')
+    rerank.set_defaults(func=bench_rerank)
+
+    quantization = subparsers.add_parser('quantization', parents=[common],
+                                         help='Memory and recall of float16/int8/truncated vector storage')
+    quantization.add_argument('--chroma-path', default='./chroma_db', help='ChromaDB directory (use a copy)')
+    quantization.add_argument('--sample', type=int, default=200, help='Stored vectors used as queries')
+    quantization.add_argument('--top-k', type=int, default=10, help='k for recall@k')
+    quantization.add_argument('--dimensions', type=int, nargs='*', default=[512, 256], help='Truncated sizes to test')
+    quantization.add_argument('--seed', type=int, default=42, help='Random seed for query sampling')
+    quantization.set_defaults(func=bench_quantization)
+
+    snapshot = subparsers.add_parser('snapshot', parents=[common],
+                                     help='Startup time from ChromaDB versus from a snapshot')
+    snapshot.add_argument('--chroma-path', default='./chroma_db', help='ChromaDB directory (use a copy)')
+    snapshot.add_argument('--repeat', type=int, default=5, help='Snapshot loads to time')
+    snapshot.set_defaults(func=bench_snapshot)
+
+    embedders = subparsers.add_parser('embedders', parents=[common],
+                                      help='Throughput, latency and quality of the OpenAI and local embedders')
+    embedders.add_argument('--chroma-path', default='./chroma_db', help='ChromaDB directory (use a copy)')
+    embedders.add_argument('--backends', nargs='+', default=['openai', 'local'], choices=['openai', 'local'],
+                           help='Embedding backends to compare')
+    embedders.add_argument('--queries', help='JSONL file with question/expected_url pairs')
+    embedders.add_argument('--documents', type=int, default=500, help='Documents re-embedded by each backend')
+    embedders.add_argument('--sample', type=int, default=50, help='Queries to run')
+    embedders.add_argument('--batch-size', type=int, default=64, help='Documents per embedding batch')
+    embedders.add_argument('--top-k', type=int, default=5, help='k for hit@k/MRR@k')
+    embedders.add_argument('--seed', type=int, default=42, help='Random seed for sampling')
+    embedders.set_defaults(func=bench_embedders)
+
+    logging_parser = subparsers.add_parser('logging', parents=[common],
+                                           help='Per-request logging overhead, synchronous versus queued JSON')
+    logging_parser.add_argument('--requests', type=int, default=2000, help='Simulated requests per configuration')
+    logging_parser.add_argument('--sink', choices=['pipe', 'file'], default='pipe', help='Where log lines are written')
+    logging_parser.add_argument('--sink-delay-ms', type=float, default=0.0,
+                                help='Pause after each chunk the pipe reader drains, to model a slow log collector')
+    logging_parser.set_defaults(func=bench_logging)
+
+    args = parser.parse_args()
+    report = args.func(args)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved report to {args.json}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
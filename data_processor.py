@@ -1,16 +1,29 @@
 import json
 import logging
-from typing import List, Dict, Any
+import re
+from collections import defaultdict
+from typing import List, Dict, Any, Optional
 import os
+from dedup import Deduplicator
 
 logger = logging.getLogger(__name__)
 
+# Group Discourse posts into question-plus-answers windows before embedding
+AGGREGATE_THREADS = os.environ.get("AGGREGATE_THREADS", "true").lower() in ("1", "true", "yes")
+# Window size in characters; embeddings only see the first 2000 characters of a document
+THREAD_WINDOW_CHARS = int(os.environ.get("THREAD_WINDOW_CHARS", "2000"))
+# How much of the opening question is repeated at the top of later windows
+THREAD_QUESTION_CHARS = int(os.environ.get("THREAD_QUESTION_CHARS", "400"))
+
+TOPIC_URL_PATTERN = re.compile(r"/t/(?:[^/]+/)?(\d+)(?:/\d+)?/?$")
+
 class DataProcessor:
     """Process and prepare TDS course content and Discourse posts for indexing"""
     
     def __init__(self):
         self.course_content = []
         self.discourse_posts = []
+        self.deduplicator = Deduplicator()
         
     def load_data(self):
         """Load data from the provided JSON files"""
@@ -38,11 +51,26 @@ class DataProcessor:
                     combined_data = json.load(f)
                     logger.info(f"Loaded {len(combined_data)} combined content items")
                     self._process_combined_data(combined_data)
+            
+            # The three files overlap; drop repeated posts before anything is embedded
+            self._deduplicate()
                     
         except Exception as e:
             logger.error(f"Error loading data: {e}")
             raise
             
+    def _deduplicate(self):
+        """Remove exact and near-duplicate documents, keeping the first copy as canonical"""
+        self.course_content = self.deduplicator.dedupe(self.course_content, ('title', 'content'))
+        # Replies share their topic's title, so a post's place in its thread is part of the exact key
+        self.discourse_posts = self.deduplicator.dedupe(self.discourse_posts, ('title', 'content'),
+                                                        ('topic_id', 'post_number'))
+        
+        report = self.deduplicator.report()
+        logger.info(f"Deduplication removed {report['removed']} of {report.get('input', 0)} documents "
+                    f"({report.get('exact_id', 0)} by id, {report.get('content_hash', 0)} by content hash, "
+                    f"{report.get('near_duplicate', 0)} near-duplicates)")
+        
     def _process_merged_data(self, data: List[Dict]):
         """Process merged TDS discourse posts and course content"""
         for item in data:
@@ -84,6 +112,7 @@ class DataProcessor:
         """Add a discourse post to the collection"""
         discourse_post = {
             'id': str(item.get('id', '')),
+            'topic_id': item.get('topic_id'),
             'title': item.get('topic_title', ''),
             'content': item.get('content', ''),
             'url': item.get('url', ''),
@@ -91,11 +120,12 @@ class DataProcessor:
             'post_number': item.get('post_number', 0),
             'created_at': item.get('created_at', ''),
             'type': 'discourse_post',
+            'accepted_answer': bool(item.get('accepted_answer', False)),
             'context': item.get('context', [])
         }
         self.discourse_posts.append(discourse_post)
         
-    def get_all_documents(self, limit: int = None) -> List[Dict[str, Any]]:
+    def get_all_documents(self, limit: int = None, aggregate_threads: Optional[bool] = None) -> List[Dict[str, Any]]:
         """Get all processed documents for indexing"""
         all_docs = []
         
@@ -114,32 +144,125 @@ class DataProcessor:
                 })
         
         # Add discourse posts (prioritize recent ones)
-        sorted_posts = sorted(self.discourse_posts, key=lambda x: x['created_at'] or '', reverse=True)
-        for post in sorted_posts:
+        if aggregate_threads is None:
+            aggregate_threads = AGGREGATE_THREADS
+        discourse_docs = self._thread_documents() if aggregate_threads else self._post_documents(self.discourse_posts)
+        all_docs.extend(sorted(discourse_docs, key=lambda x: x['created_at'] or '', reverse=True))
+        
+        # Apply limit if specified (for testing with smaller datasets)
+        if limit and len(all_docs) > limit:
+            all_docs = all_docs[:limit]
+            logger.info(f"Limited to {limit} documents for testing")
+        
+        logger.info(f"Processed {len(all_docs)} documents total")
+        return all_docs
+    
+    def _post_documents(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """One document per Discourse post"""
+        docs = []
+        for post in posts:
             if post['content'].strip():  # Only add non-empty content
                 # Truncate content to avoid token issues
                 content = post['content'][:2000] if len(post['content']) > 2000 else post['content']
                 if post['title']:
                     content = f"{post['title']}\n\n{content}"
                     
-                all_docs.append({
+                docs.append({
                     'id': post['id'],
                     'content': content,
                     'title': post['title'],
                     'url': post['url'],
                     'type': post['type'],
                     'username': post['username'],
+                    'topic_id': post['topic_id'],
                     'created_at': post['created_at'],
+                    'accepted_answer': post['accepted_answer'],
                     'metadata': {
                         'post_number': post['post_number'],
                         'context': post['context']
                     }
                 })
+        return docs
+    
+    def _topic_key(self, post: Dict[str, Any]) -> Optional[str]:
+        """Topic id of a post, falling back to the one embedded in its URL"""
+        if post.get('topic_id'):
+            return str(post['topic_id'])
+        match = TOPIC_URL_PATTERN.search(post.get('url') or '')
+        return match.group(1) if match else None
+    
+    def _thread_documents(self) -> List[Dict[str, Any]]:
+        """Question-plus-answers windows, one or more per Discourse topic"""
+        threads = defaultdict(dict)
+        loose_posts = []
+        for post in self.discourse_posts:
+            if not post['content'].strip():
+                continue
+            topic = self._topic_key(post)
+            if topic is None:
+                loose_posts.append(post)
+            else:
+                # The same post can arrive from several source files; keep one copy per post number
+                threads[topic].setdefault(post['post_number'] or post['id'], post)
         
-        # Apply limit if specified (for testing with smaller datasets)
-        if limit and len(all_docs) > limit:
-            all_docs = all_docs[:limit]
-            logger.info(f"Limited to {limit} documents for testing")
+        docs = []
+        for topic, posts_by_number in threads.items():
+            posts = sorted(posts_by_number.values(), key=lambda p: (p['post_number'] or 0, p['created_at'] or ''))
+            docs.extend(self._thread_windows(topic, posts))
         
-        logger.info(f"Processed {len(all_docs)} documents total")
-        return all_docs
+        # Posts without a recoverable topic are embedded on their own
+        docs.extend(self._post_documents(loose_posts))
+        
+        logger.info(f"Aggregated {sum(len(p) for p in threads.values())} posts from {len(threads)} topics into {len(docs)} documents")
+        return docs
+    
+    def _thread_windows(self, topic: str, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Split one topic into windows that each start with the opening question"""
+        question = posts[0]
+        title = question['title']
+        question_text = question['content'].strip()
+        
+        # The first window carries most of the opening post; later ones repeat a short version
+        header = f"{title}\n\nQuestion ({question['username']}): {question_text[:THREAD_WINDOW_CHARS // 2]}"
+        later_header = f"{title}\n\nQuestion ({question['username']}): {question_text[:THREAD_QUESTION_CHARS]}"
+        
+        windows = []
+        current = [question]
+        text = header
+        replies_in_window = 0
+        for post in posts[1:]:
+            entry = f"\n\nReply #{post['post_number']} ({post['username']}): {post['content'].strip()}"
+            if replies_in_window >= 1 and len(text) + len(entry) > THREAD_WINDOW_CHARS:
+                windows.append((text, current))
+                current = []
+                text = later_header
+                replies_in_window = 0
+            # A reply too long for a window of its own is cut here rather than at embedding time
+            entry = entry[:max(0, THREAD_WINDOW_CHARS - len(text))]
+            current.append(post)
+            text += entry
+            replies_in_window += 1
+        windows.append((text, current))
+        
+        docs = []
+        for text, window_posts in windows:
+            if not window_posts:
+                continue
+            accepted = [p for p in window_posts if p['accepted_answer']]
+            docs.append({
+                'id': f"topic_{topic}_{window_posts[0]['post_number']}",
+                'content': text,
+                'title': title,
+                # Link the accepted answer when the window has one, otherwise where the window starts
+                'url': (accepted[0] if accepted else window_posts[0])['url'],
+                'type': 'discourse_post',
+                'username': question['username'],
+                'topic_id': topic,
+                'created_at': max(p['created_at'] or '' for p in window_posts),
+                'accepted_answer': bool(accepted),
+                'post_urls': [p['url'] for p in window_posts if p['url']],
+                'metadata': {
+                    'post_numbers': [p['post_number'] for p in window_posts]
+                }
+            })
+        return docs
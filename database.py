@@ -1,35 +1,172 @@
 import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any
+import numpy as np
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
 
+# Bind used by read-heavy analytics endpoints (/api/stats, /api/questions)
+ANALYTICS_BIND = 'analytics'
+
+# Pool per workload: the request path gets a pool of its own and a short checkout timeout
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+# Analytics reads use a small separate pool, optionally on a read replica
+ANALYTICS_DATABASE_URL = os.environ.get("ANALYTICS_DATABASE_URL")
+ANALYTICS_POOL_SIZE = int(os.environ.get("ANALYTICS_POOL_SIZE", "2"))
+ANALYTICS_MAX_OVERFLOW = int(os.environ.get("ANALYTICS_MAX_OVERFLOW", "0"))
+ANALYTICS_POOL_TIMEOUT = float(os.environ.get("ANALYTICS_POOL_TIMEOUT", "10"))
+# Server-side cap on analytics queries (PostgreSQL only)
+ANALYTICS_STATEMENT_TIMEOUT_MS = int(os.environ.get("ANALYTICS_STATEMENT_TIMEOUT_MS", "5000"))
+# Connections older than this are replaced on checkout
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "300"))
+
+# Pool wait samples kept per pool for percentiles
+POOL_WAIT_WINDOW = 1000
+
+class PoolWaitStats:
+    """Time spent waiting for a pooled connection, per pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waits = {}
+        self._counts = {}
+
+    def record(self, pool_name: str, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if pool_name not in self._waits:
+                self._waits[pool_name] = deque(maxlen=POOL_WAIT_WINDOW)
+                self._counts[pool_name] = {'checkouts': 0, 'timeouts': 0, 'max_wait_ms': 0.0}
+            counts = self._counts[pool_name]
+            counts['timeouts' if timed_out else 'checkouts'] += 1
+            counts['max_wait_ms'] = max(counts['max_wait_ms'], seconds * 1000)
+            self._waits[pool_name].append(seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            report = {}
+            for pool_name, waits in self._waits.items():
+                values = np.array(waits)
+                report[pool_name] = {
+                    **self._counts[pool_name],
+                    'max_wait_ms': round(self._counts[pool_name]['max_wait_ms'], 2),
+                    'p50_wait_ms': round(float(np.percentile(values, 50)), 2),
+                    'p95_wait_ms': round(float(np.percentile(values, 95)), 2),
+                }
+            return report
+
+pool_wait_stats = PoolWaitStats()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    pool_name = 'default'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_wait_stats.record(self.pool_name, time.perf_counter() - started, timed_out=True)
+            raise
+        pool_wait_stats.record(self.pool_name, time.perf_counter() - started)
+        return connection
+
+def _engine_options(url: str, pool_name: str, pool_size: int, max_overflow: int, pool_timeout: float,
+                    statement_timeout_ms: int = 0) -> Dict[str, Any]:
+    """Engine options for one workload's pool"""
+    # create_engine only forwards known pool arguments, so the pool name travels on a subclass
+    poolclass = type(f"{pool_name.title()}QueuePool", (InstrumentedQueuePool,), {'pool_name': pool_name})
+    if url.startswith('sqlite'):
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            return {}
+        # File databases have no network connection to keep alive
+        return {'poolclass': poolclass, 'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_timeout': pool_timeout}
+
+    # No pre-ping round trip on every checkout: TCP keepalives detect dead peers, pool_recycle retires
+    # connections before server/proxy idle timeouts, and LIFO checkout leaves surplus connections idle
+    # so they are the ones recycled
+    connect_args = {'keepalives': 1, 'keepalives_idle': 30, 'keepalives_interval': 10, 'keepalives_count': 3}
+    if statement_timeout_ms:
+        connect_args['options'] = f"-c statement_timeout={statement_timeout_ms}"
+    return {
+        'poolclass': poolclass,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_use_lifo': True,
+        'pool_pre_ping': False,
+        'connect_args': connect_args,
+    }
+
+def pool_status() -> Dict[str, Any]:
+    """Checkout wait percentiles plus current pool occupancy for every engine"""
+    report = pool_wait_stats.snapshot()
+    for bind_key, engine in db.engines.items():
+        pool_name = bind_key or 'default'
+        report.setdefault(pool_name, {})['status'] = engine.pool.status()
+    return report
+
+@contextmanager
+def analytics_session():
+    """Read-only session on the analytics pool, so reports never take connections from the request path"""
+    session = Session(bind=db.engines[ANALYTICS_BIND])
+    try:
+        yield session
+    finally:
+        session.close()
+
 def init_database(app):
     """Initialize database with Flask app"""
     # Check if DATABASE_URL is available
     database_url = os.environ.get("DATABASE_URL")
     if not database_url:
         raise ValueError("DATABASE_URL environment variable is required")
-    
+    analytics_url = ANALYTICS_DATABASE_URL or database_url
+
     # configure the database
     app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _engine_options(
+        database_url, 'default', DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT
+    )
+    app.config["SQLALCHEMY_BINDS"] = {
+        ANALYTICS_BIND: {
+            'url': analytics_url,
+            **_engine_options(analytics_url, ANALYTICS_BIND, ANALYTICS_POOL_SIZE, ANALYTICS_MAX_OVERFLOW,
+                              ANALYTICS_POOL_TIMEOUT, ANALYTICS_STATEMENT_TIMEOUT_MS)
+        }
     }
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    
+
     # initialize the app with the extension
     db.init_app(app)
-    
+
     with app.app_context():
         # Import models to register tables
-        from models import Question, SystemStats, DocumentIndex, UserFeedback
-        
-        # Create all tables
+        from models import Base as ModelBase, Question, SystemStats, DocumentIndex, UserFeedback
+        from question_log import ensure_indexes
+
+        # Create all tables (the models declare their own Base, so create those explicitly too)
         db.create_all()
-        
-    return db
\ No newline at end of file
+        ModelBase.metadata.create_all(db.engine)
+        ensure_indexes(db.engine)
+
+    logger.info(f"Database pools: request {DB_POOL_SIZE}+{DB_MAX_OVERFLOW}, analytics "
+                f"{ANALYTICS_POOL_SIZE}+{ANALYTICS_MAX_OVERFLOW}"
+                f"{' (replica)' if ANALYTICS_DATABASE_URL else ''}")
+    return db
@@ -0,0 +1,134 @@
+import os
+import re
+import hashlib
+import logging
+from collections import defaultdict
+from typing import List, Dict, Any, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# MinHash/LSH settings: 64 permutations in 16 bands of 4 rows finds most pairs above ~0.6 Jaccard
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_WORDS = 3
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+# Texts shorter than this are only deduplicated exactly ("Thanks!" in two topics is not a near-duplicate)
+MIN_NEAR_DUPLICATE_TOKENS = 20
+
+# Smallest prime above 2**32, modulus of the universal hash family
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20250618)
+_HASH_A = _rng.integers(1, 2**32 - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_HASH_B = _rng.integers(0, 2**32 - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+WORD_PATTERN = re.compile(r"\w+")
+
+def normalize_text(text: str) -> List[str]:
+    """Lowercase word tokens with HTML tags stripped"""
+    return WORD_PATTERN.findall(TAG_PATTERN.sub(' ', text or '').lower())
+
+def content_hash(tokens: List[str]) -> str:
+    """Hash of the normalised text, so whitespace and markup differences still match"""
+    return hashlib.sha1(' '.join(tokens).encode('utf-8')).hexdigest()
+
+def minhash_signature(tokens: List[str]) -> np.ndarray:
+    """MinHash signature over word shingles"""
+    shingles = {' '.join(tokens[i:i + SHINGLE_WORDS]) for i in range(max(1, len(tokens) - SHINGLE_WORDS + 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'big') for s in shingles],
+        dtype=np.uint64
+    )
+    # (a * h + b) mod p stays below 2**64 because a, h, b < 2**32
+    permuted = (_HASH_A[:, None] * hashes[None, :] + _HASH_B[:, None]) % _PRIME
+    return permuted.min(axis=1)
+
+class Deduplicator:
+    """Exact (id, content hash) and near-duplicate (MinHash/LSH) removal for ingested documents"""
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.stats = defaultdict(int)
+
+    def dedupe(self, docs: List[Dict[str, Any]], text_fields: Tuple[str, ...] = ('content',),
+               key_fields: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+        """Return docs with duplicates removed, keeping the first copy
+
+        key_fields are part of the exact-match key, so identical text at different places
+        (two "Thanks!" replies in one thread) is kept.
+        """
+        kept = []
+        seen_ids = set()
+        seen_hashes = set()
+        signatures = []
+
+        for doc in docs:
+            doc_id = str(doc.get('id', ''))
+            if doc_id and doc_id in seen_ids:
+                self.stats['exact_id'] += 1
+                continue
+
+            tokens = normalize_text(' '.join(str(doc.get(field) or '') for field in text_fields))
+            digest = (content_hash(tokens),) + tuple(str(doc.get(field)) for field in key_fields)
+            if digest in seen_hashes:
+                self.stats['content_hash'] += 1
+                continue
+
+            if doc_id:
+                seen_ids.add(doc_id)
+            seen_hashes.add(digest)
+            kept.append(doc)
+            signatures.append(minhash_signature(tokens) if len(tokens) >= MIN_NEAR_DUPLICATE_TOKENS else None)
+
+        removed = self._near_duplicates(kept, signatures)
+        unique = [doc for i, doc in enumerate(kept) if i not in removed]
+
+        self.stats['input'] += len(docs)
+        self.stats['output'] += len(unique)
+        return unique
+
+    def _near_duplicates(self, docs: List[Dict[str, Any]], signatures: List[np.ndarray]) -> set:
+        """Indices of documents that near-duplicate an earlier one"""
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        buckets = defaultdict(list)
+        for i, signature in enumerate(signatures):
+            if signature is None:
+                continue
+            for band in range(LSH_BANDS):
+                buckets[(band, signature[band * rows:(band + 1) * rows].tobytes())].append(i)
+
+        # Union-find over verified candidate pairs; the earliest document is canonical
+        parent = list(range(len(docs)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        checked = set()
+        for members in buckets.values():
+            for a_pos, a in enumerate(members):
+                for b in members[a_pos + 1:]:
+                    if (a, b) in checked:
+                        continue
+                    checked.add((a, b))
+                    similarity = float(np.mean(signatures[a] == signatures[b]))
+                    if similarity >= self.threshold:
+                        root_a, root_b = find(a), find(b)
+                        if root_a != root_b:
+                            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        removed = set()
+        for i in range(len(docs)):
+            root = find(i)
+            if root != i:
+                removed.add(i)
+                self.stats['near_duplicate'] += 1
+        return removed
+
+    def report(self) -> Dict[str, int]:
+        stats = dict(self.stats)
+        stats['removed'] = stats.get('input', 0) - stats.get('output', 0)
+        return stats
@@ -134,6 +134,7 @@ class DiscourseScraper:
                             'created_at': post_created,
                             'updated_at': post.get('updated_at'),
                             'reply_count': post.get('reply_count', 0),
+                            'accepted_answer': post.get('accepted_answer', False),
                             'like_count': post.get('actions_summary', [{}])[0].get('count', 0) if post.get('actions_summary') else 0
                         }
                         all_posts.append(processed_post)
@@ -0,0 +1,138 @@
+import os
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+from openai_client import get_openai_client, LatencyBudget, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+# Backend for new collections; existing collections keep the backend recorded in their metadata
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "openai").lower()
+# Local CPU model (sentence-transformers) and its runtime: "torch" or "onnx"
+LOCAL_EMBEDDING_MODEL = os.environ.get("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_RUNTIME = os.environ.get("LOCAL_EMBEDDING_RUNTIME", "torch").lower()
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.environ.get("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+# Intra-op threads for local inference (0 = runtime default, usually all cores)
+LOCAL_EMBEDDING_THREADS = int(os.environ.get("LOCAL_EMBEDDING_THREADS", "0"))
+
+EMBEDDING_BACKENDS = ('openai', 'local')
+
+class Embedder:
+    """Turns texts into vectors; documents and queries of one collection must share an embedder"""
+
+    backend = ''
+    model = ''
+
+    @property
+    def name(self) -> str:
+        return f"{self.backend}:{self.model}"
+
+    @property
+    def dimensions(self) -> int:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str], budget: Optional[LatencyBudget] = None,
+              batch_size: Optional[int] = None) -> List[List[float]]:
+        """One vector per text; failed items come back as zero vectors"""
+        raise NotImplementedError
+
+class OpenAIEmbedder(Embedder):
+    """text-embedding-3 through the OpenAI API (or AI Pipe)"""
+
+    backend = 'openai'
+    model = EMBEDDING_MODEL
+
+    def __init__(self):
+        self.openai_client = get_openai_client()
+
+    @property
+    def dimensions(self) -> int:
+        return EMBEDDING_DIMENSIONS
+
+    def embed(self, texts: List[str], budget: Optional[LatencyBudget] = None,
+              batch_size: Optional[int] = None) -> List[List[float]]:
+        if batch_size:
+            return self.openai_client.get_embeddings(texts, budget=budget, chunk_size=batch_size)
+        return self.openai_client.get_embeddings(texts, budget=budget)
+
+class LocalEmbedder(Embedder):
+    """Sentence-transformers model run on CPU in-process, with batched inference"""
+
+    backend = 'local'
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL, runtime: str = LOCAL_EMBEDDING_RUNTIME):
+        if SentenceTransformer is None:
+            raise RuntimeError("The local embedding backend needs the 'sentence-transformers' package "
+                               "(plus 'optimum[onnxruntime]' for the onnx runtime)")
+        self.model = model
+        self.runtime = runtime
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._encoder is None:
+            with self._lock:
+                if self._encoder is None:
+                    if self.runtime == 'torch' and LOCAL_EMBEDDING_THREADS:
+                        import torch
+                        torch.set_num_threads(LOCAL_EMBEDDING_THREADS)
+                    self._encoder = SentenceTransformer(self.model, device='cpu', backend=self.runtime)
+                    logger.info(f"Loaded local embedding model {self.model} ({self.runtime}, "
+                                f"{self._encoder.get_sentence_embedding_dimension()} dimensions)")
+        return self._encoder
+
+    @property
+    def dimensions(self) -> int:
+        return self._load().get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str], budget: Optional[LatencyBudget] = None,
+              batch_size: Optional[int] = None) -> List[List[float]]:
+        if not texts:
+            return []
+        # Budgets only bound upstream calls; local inference has no network wait to cut short
+        vectors = self._load().encode(
+            [text[:2000] for text in texts],
+            batch_size=batch_size or LOCAL_EMBEDDING_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.tolist()
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+def create_embedder(backend: str = EMBEDDING_BACKEND, model: Optional[str] = None) -> Embedder:
+    """Shared embedder instance for a backend (and local model)"""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND must be one of {', '.join(EMBEDDING_BACKENDS)}, got {backend!r}")
+    key = (backend, model if backend == 'local' else None)
+    with _embedders_lock:
+        if key not in _embedders:
+            _embedders[key] = OpenAIEmbedder() if backend == 'openai' else LocalEmbedder(model or LOCAL_EMBEDDING_MODEL)
+        return _embedders[key]
+
+def collection_metadata(embedder: Embedder) -> Dict[str, Any]:
+    """Metadata recording which embedder produced a collection's vectors"""
+    return {
+        'embedding_backend': embedder.backend,
+        'embedding_model': embedder.model,
+        'embedding_dimensions': embedder.dimensions
+    }
+
+def embedder_for_collection(metadata: Optional[Dict[str, Any]]) -> Embedder:
+    """The embedder a collection was built with (collections predating this metadata used OpenAI)"""
+    metadata = metadata or {}
+    backend = metadata.get('embedding_backend', 'openai')
+    model = metadata.get('embedding_model')
+    if backend != EMBEDDING_BACKEND:
+        logger.warning(f"Collection was embedded with the {backend} backend; using it instead of "
+                       f"EMBEDDING_BACKEND={EMBEDDING_BACKEND} so queries match the indexed vectors")
+    if backend == 'openai' and model and model != EMBEDDING_MODEL:
+        logger.error(f"Collection was embedded with {model} but EMBEDDING_MODEL is {EMBEDDING_MODEL}")
+    return create_embedder(backend, model)
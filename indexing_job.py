@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Documents embedded and committed to the vector store per batch
+INDEX_BATCH_SIZE = int(os.environ.get("INDEX_BATCH_SIZE", "25"))
+
+class IndexingJob:
+    """Chunked, cancellable background indexing run with progress reporting"""
+
+    def __init__(self, vector_store, documents: List[Dict[str, Any]], batch_size: int = INDEX_BATCH_SIZE):
+        self.vector_store = vector_store
+        self.documents = documents
+        self.batch_size = max(1, batch_size)
+        self.total = len(documents)
+
+        self.state = 'pending'
+        self.indexed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.batches_done = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Run the job on a daemon thread"""
+        self._thread = threading.Thread(target=self.run, name="indexing-job", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Ask the job to stop after the batch currently in flight"""
+        self._cancel_event.set()
+
+    def is_running(self) -> bool:
+        return self.state in ('pending', 'running')
+
+    def run(self):
+        """Embed and commit documents batch by batch until done or cancelled"""
+        self.started_at = time.time()
+        self.state = 'running'
+        logger.info(f"Indexing job started for {self.total} documents in batches of {self.batch_size}")
+
+        try:
+            for start in range(0, self.total, self.batch_size):
+                if self._cancel_event.is_set():
+                    self.state = 'cancelled'
+                    logger.info(f"Indexing job cancelled after {self.indexed} documents")
+                    return
+
+                batch = self.documents[start:start + self.batch_size]
+                result = self.vector_store.index_batch(batch)
+
+                with self._lock:
+                    self.indexed += result['indexed']
+                    self.skipped += result['skipped']
+                    self.failed += result['failed']
+                    self.batches_done += 1
+
+            self.state = 'completed'
+            logger.info(f"Indexing job completed: {self.indexed} indexed, {self.skipped} already present, {self.failed} failed")
+
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            logger.error(f"Indexing job failed after {self.indexed} documents: {e}")
+
+        finally:
+            self.finished_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        """Progress snapshot including throughput and ETA"""
+        with self._lock:
+            processed = self.indexed + self.skipped + self.failed
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            remaining = self.total - processed
+
+            return {
+                'state': self.state,
+                'total': self.total,
+                'processed': processed,
+                'indexed': self.indexed,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'batches_done': self.batches_done,
+                'batch_size': self.batch_size,
+                'progress': round(processed / self.total, 4) if self.total else 1.0,
+                'elapsed_seconds': round(elapsed, 1),
+                'docs_per_second': round(rate, 2),
+                'eta_seconds': round(remaining / rate, 1) if rate > 0 and self.is_running() else None,
+                'error': self.error
+            }
+
+_current_job = None
+_jobs_lock = threading.Lock()
+
+def start_indexing_job(vector_store, documents: List[Dict[str, Any]],
+                       batch_size: Optional[int] = None) -> Optional[IndexingJob]:
+    """Start a background indexing job unless one is already running"""
+    global _current_job
+
+    with _jobs_lock:
+        if _current_job is not None and _current_job.is_running():
+            return None
+        _current_job = IndexingJob(vector_store, documents, batch_size or INDEX_BATCH_SIZE)
+        _current_job.start()
+        return _current_job
+
+def get_current_job() -> Optional[IndexingJob]:
+    """The most recently started indexing job, if any"""
+    return _current_job
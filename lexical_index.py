@@ -0,0 +1,98 @@
+import os
+import json
+import logging
+from collections import Counter
+from typing import List, Tuple, Optional
+import numpy as np
+from reranker import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+class BM25Index:
+    """Inverted index with BM25 scoring, stored as flat numpy arrays (CSR by term) so it can be memory-mapped"""
+
+    def __init__(self, vocabulary: List[str], offsets: np.ndarray, postings: np.ndarray,
+                 frequencies: np.ndarray, doc_lengths: np.ndarray):
+        self.vocabulary = vocabulary
+        self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+        # Postings of term i are postings[offsets[i]:offsets[i + 1]], with matching term frequencies
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.doc_lengths = doc_lengths
+        self.count = len(doc_lengths)
+        self.avg_length = float(doc_lengths.mean()) if self.count else 0.0
+
+    @classmethod
+    def build(cls, texts: List[str]) -> 'BM25Index':
+        """Tokenize texts (positions follow list order) and build the index"""
+        term_postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[position] = sum(counts.values())
+            for term, frequency in counts.items():
+                term_postings.setdefault(term, []).append((position, frequency))
+
+        vocabulary = sorted(term_postings)
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        for i, term in enumerate(vocabulary):
+            offsets[i + 1] = offsets[i] + len(term_postings[term])
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        frequencies = np.empty(offsets[-1], dtype=np.float32)
+        for i, term in enumerate(vocabulary):
+            entries = np.asarray(term_postings[term])
+            postings[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            frequencies[offsets[i]:offsets[i + 1]] = entries[:, 1]
+        return cls(vocabulary, offsets, postings, frequencies, doc_lengths)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in ('offsets', 'postings', 'frequencies', 'doc_lengths'):
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.vocabulary, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'BM25Index':
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+                  for name in ('offsets', 'postings', 'frequencies', 'doc_lengths')}
+        with open(os.path.join(directory, 'vocabulary.json'), 'r', encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        return cls(vocabulary, **arrays)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query"""
+        scores = np.zeros(self.count, dtype=np.float32)
+        if not self.count:
+            return scores
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            positions = self.postings[start:end]
+            frequencies = self.frequencies[start:end]
+            document_frequency = end - start
+            idf = np.log(1.0 + (self.count - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths[positions] / self.avg_length)
+            scores[positions] += idf * frequencies * (BM25_K1 + 1.0) / (frequencies + norm)
+        return scores
+
+    def search(self, query: str, k: int, positions: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (position, score) pairs with a non-zero score, optionally restricted to positions"""
+        scores = self.scores(query)
+        if positions is not None:
+            restricted = np.zeros_like(scores)
+            restricted[positions] = scores[positions]
+            scores = restricted
+        matching = np.flatnonzero(scores > 0)
+        if k <= 0 or not len(matching):
+            return []
+        top = matching[np.argsort(-scores[matching], kind='stable')[:k]]
+        return [(int(p), float(scores[p])) for p in top]
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Load generator for the TDS Virtual TA /api/ endpoint
+
+Drives the endpoint at a target request rate using an open-loop arrival model:
+request start times are scheduled up front (Poisson or constant spacing) and do
+not wait for earlier responses, so a slow server shows up as growing latency and
+errors instead of a silently reduced request rate.
+
+Usage:
+    python load_test.py --url http://127.0.0.1:5000/api/ --rps 5 --duration 60
+    python load_test.py --rps 20 --duration 30 --questions questions.jsonl --json report.json
+
+Author: TDS Virtual TA
+License: MIT
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+import requests
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUESTIONS = [
+    "Should I use gpt-4o-mini or gpt-3.5-turbo-0125 for GA5?",
+    "If a student scores 10/10 on GA4 as well as a bonus, how would it appear on the dashboard?",
+    "I know Docker but have not used Podman before. Should I use Docker for this course?",
+    "When is the TDS Sep 2025 end-term exam?",
+    "How do I submit the project repository URL?",
+]
+
+
+def load_questions(path: Optional[str]) -> List[str]:
+    """Load questions from a JSONL file ({"question": ...} per line) or a plain text file"""
+    if not path:
+        return list(DEFAULT_QUESTIONS)
+
+    questions = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                questions.append(json.loads(line)['question'])
+            else:
+                questions.append(line)
+    return questions
+
+
+def arrival_schedule(rps: float, duration: float, arrival: str, rng: random.Random) -> List[float]:
+    """Offsets (seconds from start) at which requests are sent"""
+    offsets = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rps) if arrival == 'poisson' else 1.0 / rps
+        if t >= duration:
+            break
+        offsets.append(t)
+    return offsets
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadTest:
+    """Open-loop load generator and result collector"""
+
+    def __init__(self, url: str, questions: List[str], timeout: float, max_in_flight: int):
+        self.url = url
+        self.questions = questions
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_in_flight, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.results: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _send(self, index: int, scheduled_at: float):
+        question = self.questions[index % len(self.questions)]
+        started = time.perf_counter()
+        outcome = {'scheduled_at': scheduled_at, 'start_lag': started - scheduled_at}
+
+        try:
+            response = self.session.post(self.url, json={'question': question}, timeout=self.timeout)
+            outcome['status'] = str(response.status_code)
+            if response.status_code == 200:
+                outcome['server_time'] = response.json().get('response_time')
+        except requests.Timeout:
+            outcome['status'] = 'timeout'
+        except requests.RequestException as e:
+            outcome['status'] = type(e).__name__
+
+        outcome['latency'] = time.perf_counter() - started
+        with self._lock:
+            self._in_flight -= 1
+            self.results.append(outcome)
+
+    def run(self, offsets: List[float]) -> float:
+        """Fire requests at the scheduled offsets; returns the wall-clock duration"""
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        start = time.perf_counter()
+
+        for index, offset in enumerate(offsets):
+            scheduled_at = start + offset
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            with self._lock:
+                if self._in_flight >= self.max_in_flight:
+                    # The client itself is saturated; record it rather than delaying the arrival
+                    self.results.append({'scheduled_at': scheduled_at, 'start_lag': 0.0,
+                                         'status': 'client_saturated', 'latency': 0.0})
+                    continue
+                self._in_flight += 1
+
+            executor.submit(self._send, index, scheduled_at)
+
+        executor.shutdown(wait=True)
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float, offered: int, target_rps: float) -> Dict[str, Any]:
+        """Summarize throughput, latency percentiles and error breakdown"""
+        ok = sorted(r['latency'] for r in self.results if r['status'] == '200')
+        statuses = Counter(r['status'] for r in self.results)
+        server_times = sorted(r['server_time'] for r in self.results if r.get('server_time') is not None)
+
+        return {
+            'target_rps': target_rps,
+            'offered_requests': offered,
+            'completed_requests': len(self.results),
+            'successful_requests': len(ok),
+            'elapsed_seconds': round(elapsed, 2),
+            'offered_rps': round(offered / elapsed, 2) if elapsed else 0.0,
+            'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            'latency_seconds': {
+                'p50': round(percentile(ok, 50), 3),
+                'p90': round(percentile(ok, 90), 3),
+                'p95': round(percentile(ok, 95), 3),
+                'p99': round(percentile(ok, 99), 3),
+                'max': round(ok[-1], 3) if ok else 0.0,
+            },
+            'server_time_p50': round(percentile(server_times, 50), 3),
+            'max_start_lag': round(max((r['start_lag'] for r in self.results), default=0.0), 3),
+            'status_breakdown': dict(statuses),
+            'error_rate': round(1 - len(ok) / len(self.results), 4) if self.results else 0.0,
+        }
+
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Open-loop load generator for the /api/ endpoint')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/', help='Endpoint to load')
+    parser.add_argument('--rps', type=float, required=True, help='Target request rate (requests per second)')
+    parser.add_argument('--duration', type=float, default=60.0, help='Test duration in seconds')
+    parser.add_argument('--arrival', choices=['poisson', 'constant'], default='poisson', help='Arrival process')
+    parser.add_argument('--questions', help='JSONL or text file with questions (default: built-in sample)')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request client timeout in seconds')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Maximum concurrent client requests')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the arrival process')
+    parser.add_argument('--json', help='Also write the report to this JSON file')
+
+    args = parser.parse_args()
+
+    if args.rps <= 0:
+        logger.error("--rps must be positive")
+        return 1
+
+    questions = load_questions(args.questions)
+    if not questions:
+        logger.error("No questions to send")
+        return 1
+
+    offsets = arrival_schedule(args.rps, args.duration, args.arrival, random.Random(args.seed))
+    logger.info(f"Sending {len(offsets)} requests to {args.url} at ~{args.rps} rps ({args.arrival} arrivals)")
+
+    load_test = LoadTest(args.url, questions, args.timeout, args.max_in_flight)
+    elapsed = load_test.run(offsets)
+    report = load_test.report(elapsed, len(offsets), args.rps)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved report to {args.json}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import logging
+import threading
+from datetime import date, datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple, Callable
+import numpy as np
+from quantization import QuantizedMatrix, normalize, RESCORE_FACTOR
+
+logger = logging.getLogger(__name__)
+
+# Documents fetched from ChromaDB per page while building the index
+LOAD_PAGE_SIZE = 1000
+
+# A date-only date_to covers its whole day: it is moved to the last microsecond of that day
+END_OF_DAY = 86400 - 1e-6
+
+def parse_timestamp(value: Any) -> float:
+    """ISO date/datetime string to a UTC epoch timestamp, NaN if missing or invalid"""
+    if not value:
+        return np.nan
+    try:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return np.nan
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def is_date_only(value: Any) -> bool:
+    """True for a plain YYYY-MM-DD value without a time of day"""
+    try:
+        date.fromisoformat(str(value))
+    except ValueError:
+        return False
+    return True
+
+def parse_filters(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Validate structured search filters from an API request; raises ValueError
+
+    Both date bounds are inclusive. A date-only date_to includes every document from that day.
+    """
+    if not data:
+        return None
+    if not isinstance(data, dict):
+        raise ValueError("filters must be an object")
+
+    unknown = set(data) - {'type', 'date_from', 'date_to', 'topic_id'}
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+
+    filters = {}
+    if data.get('type'):
+        types = data['type'] if isinstance(data['type'], list) else [data['type']]
+        filters['type'] = [str(t) for t in types]
+    for key in ('date_from', 'date_to'):
+        if data.get(key):
+            timestamp = parse_timestamp(data[key])
+            if np.isnan(timestamp):
+                raise ValueError(f"{key} must be an ISO date (YYYY-MM-DD)")
+            if key == 'date_to' and is_date_only(data[key]):
+                timestamp += END_OF_DAY
+            filters[key] = timestamp
+    if data.get('topic_id') is not None:
+        topics = data['topic_id'] if isinstance(data['topic_id'], list) else [data['topic_id']]
+        try:
+            filters['topic_id'] = [int(t) for t in topics]
+        except (TypeError, ValueError):
+            raise ValueError("topic_id must be an integer or a list of integers")
+
+    return filters or None
+
+class LocalIndex:
+    """In-memory mirror of the collection: metadata filter indexes plus the embedding matrix"""
+
+    def __init__(self, ids: List[str], metadatas: List[Dict[str, Any]], vectors: QuantizedMatrix,
+                 fetch_vectors: Optional[Callable[[List[str]], np.ndarray]] = None):
+        self.ids = ids
+        self.count = len(ids)
+
+        # Unit vectors, possibly quantized/truncated; fetch_vectors returns exact float vectors for re-scoring
+        self.vectors = vectors
+        self.fetch_vectors = fetch_vectors
+
+        # Document type -> boolean bitmap
+        types = np.array([m.get('type', '') for m in metadatas], dtype=object)
+        self.type_bitmaps = {t: types == t for t in set(types.tolist())}
+
+        # created_at sorted once; range filters become two binary searches
+        self.created_at = np.array([parse_timestamp(m.get('created_at')) for m in metadatas], dtype=np.float64)
+        dated = np.flatnonzero(~np.isnan(self.created_at))
+        order = np.argsort(self.created_at[dated], kind='stable')
+        self.created_positions = dated[order]
+        self.created_sorted = self.created_at[self.created_positions]
+
+        # topic_id -> posting list of positions
+        topic_ids = np.array([int(m.get('topic_id', -1) or -1) for m in metadatas], dtype=np.int64)
+        self.topic_postings = {}
+        for topic in np.unique(topic_ids):
+            if topic >= 0:
+                self.topic_postings[int(topic)] = np.flatnonzero(topic_ids == topic)
+
+    @classmethod
+    def from_collection(cls, collection, vectors: Optional[QuantizedMatrix] = None) -> 'LocalIndex':
+        """Build the index by paging through every document in a ChromaDB collection"""
+        vectors = vectors or QuantizedMatrix()
+        vectors.reserve(collection.count())
+        ids, metadatas = [], []
+        offset = 0
+        while True:
+            page = collection.get(limit=LOAD_PAGE_SIZE, offset=offset, include=['metadatas', 'embeddings'])
+            if not page['ids']:
+                break
+            ids.extend(page['ids'])
+            metadatas.extend(page['metadatas'])
+            # Encode page by page so a full float32 copy of the collection is never held
+            vectors.extend(np.asarray(page['embeddings'], dtype=np.float32))
+            offset += len(page['ids'])
+
+        def fetch_vectors(doc_ids: List[str]) -> np.ndarray:
+            fetched = collection.get(ids=doc_ids, include=['embeddings'])
+            by_id = dict(zip(fetched['ids'], fetched['embeddings']))
+            return np.asarray([by_id[doc_id] for doc_id in doc_ids], dtype=np.float32)
+
+        logger.info(f"Built local index over {len(ids)} documents "
+                    f"({vectors.storage}, {vectors.nbytes / 1e6:.1f} MB of vectors)")
+        return cls(ids, metadatas, vectors, fetch_vectors)
+
+    def select(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Positions of documents matching every filter, computed from the precomputed indexes"""
+        mask = np.ones(self.count, dtype=bool)
+
+        if filters.get('type'):
+            type_mask = np.zeros(self.count, dtype=bool)
+            for doc_type in filters['type']:
+                bitmap = self.type_bitmaps.get(doc_type)
+                if bitmap is not None:
+                    type_mask |= bitmap
+            mask &= type_mask
+
+        if 'date_from' in filters or 'date_to' in filters:
+            low = np.searchsorted(self.created_sorted, filters.get('date_from', -np.inf), side='left')
+            high = np.searchsorted(self.created_sorted, filters.get('date_to', np.inf), side='right')
+            date_mask = np.zeros(self.count, dtype=bool)
+            date_mask[self.created_positions[low:high]] = True
+            mask &= date_mask
+
+        if filters.get('topic_id'):
+            topic_mask = np.zeros(self.count, dtype=bool)
+            for topic in filters['topic_id']:
+                postings = self.topic_postings.get(topic)
+                if postings is not None:
+                    topic_mask[postings] = True
+            mask &= topic_mask
+
+        return np.flatnonzero(mask)
+
+    def search(self, query_embedding: List[float], positions: Optional[np.ndarray], k: int) -> List[Tuple[str, float]]:
+        """Nearest neighbours among the given positions (None = all) as (id, squared L2 distance) pairs
+
+        Compact storage is scored approximately first; the best k * RESCORE_FACTOR
+        candidates are then re-scored with exact float vectors.
+        """
+        total = self.count if positions is None else len(positions)
+        if total == 0 or k <= 0:
+            return []
+
+        query = normalize(np.asarray(query_embedding, dtype=np.float32))
+        similarities = self.vectors.scores(query, positions)
+
+        rescore = not self.vectors.exact and self.fetch_vectors is not None
+        shortlist = min(total, k * RESCORE_FACTOR if rescore else k)
+        top = np.argpartition(-similarities, shortlist - 1)[:shortlist]
+        top_positions = top if positions is None else positions[top]
+
+        if rescore:
+            exact = normalize(self.fetch_vectors([self.ids[p] for p in top_positions]))
+            top_similarities = exact @ query
+        else:
+            top_similarities = similarities[top]
+
+        order = np.argsort(-top_similarities, kind='stable')[:k]
+
+        # Same scale as ChromaDB's default l2 space on unit vectors
+        return [(self.ids[top_positions[i]], float(2.0 - 2.0 * top_similarities[i])) for i in order]
+
+class LocalIndexHolder:
+    """Lazily (re)builds the LocalIndex when the collection changes"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._index = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._stale = True
+
+    def get(self) -> LocalIndex:
+        index = self._index
+        if index is not None and not self._stale and index.count == self.collection.count():
+            return index
+
+        with self._lock:
+            if self._index is None or self._stale or self._index.count != self.collection.count():
+                self._stale = False
+                self._index = LocalIndex.from_collection(self.collection)
+            return self._index
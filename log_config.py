@@ -0,0 +1,188 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+from zlib import crc32
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Root level plus per-logger overrides ("name=LEVEL,..."); chatty client libraries default to WARNING
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get(
+    "LOG_LEVELS", "httpx=WARNING,httpcore=WARNING,openai=WARNING,chromadb=WARNING,urllib3=WARNING"
+)
+# Fraction of DEBUG/INFO records kept per logger ("name=rate,..."); warnings and errors are never sampled
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "openai_client=0.1,vector_store=0.1")
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+# Records waiting for the writer thread; when full, records are dropped rather than blocking requests
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+
+# Id of the /api/ request being served, attached to every record logged while serving it
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+def parse_mapping(spec: str) -> Dict[str, str]:
+    """Parse "name=value,name=value" into a dict"""
+    mapping = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            mapping[name.strip()] = value.strip()
+    return mapping
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request id (runs on the calling thread, where the context lives)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of DEBUG/INFO records from high-volume loggers
+
+    Inside a request the decision is made per request id, so a sampled request keeps all its lines.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.dropped = 0
+
+    def _rate(self, name: str) -> float:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        request_id = getattr(record, 'request_id', '-')
+        if request_id != '-':
+            keep = (crc32(f"{record.name}:{request_id}".encode()) % 10000) < rate * 10000
+        else:
+            keep = random.random() < rate
+        if not keep:
+            self.dropped += 1
+        return keep
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        elif record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full and leaves formatting to the listener"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge args (they may be mutated after this call) and render tracebacks, which
+        # cannot be pickled or safely read later; JSON encoding and I/O happen on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener whose stop() waits for room in a full queue instead of raising"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+def build_queue_logging(stream=None, log_format: str = LOG_FORMAT, sample_rates: Optional[Dict[str, float]] = None,
+                        queue_size: int = LOG_QUEUE_SIZE) -> Tuple[NonBlockingQueueHandler, QueueListener]:
+    """Queue handler for the application side and a started listener writing to the stream"""
+    output = logging.StreamHandler(stream or sys.stderr)
+    if log_format == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(RequestIdFilter())
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+
+    listener = DrainingQueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    return handler, listener
+
+_listener = None
+_handler = None
+_setup_lock = threading.Lock()
+
+def setup_logging(level: str = LOG_LEVEL):
+    """Route all logging through a background writer thread (idempotent)"""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        sample_rates = {name: float(rate) for name, rate in parse_mapping(LOG_SAMPLE_RATES).items()}
+        _handler, _listener = build_queue_logging(sample_rates=sample_rates)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(_handler)
+        root.setLevel(level)
+        for name, logger_level in parse_mapping(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(logger_level.upper())
+
+        # Flush what is still queued on shutdown
+        atexit.register(_listener.stop)
+
+    logger.info(f"Logging: {LOG_FORMAT} at {level}, per-logger levels {LOG_LEVELS or 'none'}, "
+                f"sampling {LOG_SAMPLE_RATES or 'none'}")
+
+def logging_stats() -> Dict[str, Any]:
+    """Queue depth and records dropped by sampling or a full queue"""
+    if _handler is None:
+        return {'enabled': False}
+    sampled_out = sum(f.dropped for f in _handler.filters if isinstance(f, SamplingFilter))
+    return {
+        'enabled': True,
+        'queued': _handler.queue.qsize(),
+        'dropped_queue_full': _handler.dropped,
+        'sampled_out': sampled_out,
+    }
@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from openai_client import OpenAIClient, LatencyBudget, ANSWER_MODEL, answer_confidence
+from reranker import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Cheaper, faster tier for simple questions; ANSWER_MODEL (gpt-4o) is the strong tier
+FAST_MODEL = os.environ.get("ROUTER_FAST_MODEL", "gpt-4o-mini")
+FAST_MAX_TOKENS = int(os.environ.get("ROUTER_FAST_MAX_TOKENS", "800"))
+# Questions/contexts above these sizes go straight to the strong tier
+SIMPLE_QUESTION_WORDS = int(os.environ.get("ROUTER_SIMPLE_QUESTION_WORDS", "40"))
+SHORT_CONTEXT_CHARS = int(os.environ.get("ROUTER_SHORT_CONTEXT_CHARS", "6000"))
+# Fast-tier answers below this confidence are regenerated by the strong tier
+ESCALATE_CONFIDENCE = float(os.environ.get("ROUTER_ESCALATE_CONFIDENCE", "0.6"))
+# Latency SLO (seconds) after which a hedge request is sent to the fast tier
+HEDGE_AFTER = float(os.environ.get("ROUTER_HEDGE_AFTER", "8"))
+ROUTER_MAX_WORKERS = int(os.environ.get("ROUTER_MAX_WORKERS", "16"))
+
+# Per-tier latency samples kept for percentiles
+LATENCY_WINDOW = 500
+
+class ModelRouter:
+    """Routes answer generation across model tiers with hedging and a local extractive fallback"""
+
+    def __init__(self, openai_client: OpenAIClient):
+        self.openai_client = openai_client
+        self.executor = ThreadPoolExecutor(max_workers=ROUTER_MAX_WORKERS, thread_name_prefix="router")
+        self._lock = threading.Lock()
+        self._decisions = defaultdict(int)
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._failures = defaultdict(int)
+
+    def choose_tier(self, question: str, context_docs: List[Dict], image_base64: Optional[str]) -> Tuple[str, str]:
+        """Primary model and the reason it was picked"""
+        if image_base64:
+            return ANSWER_MODEL, 'image'
+        if len(question.split()) > SIMPLE_QUESTION_WORDS:
+            return ANSWER_MODEL, 'long_question'
+        if sum(min(len(doc['content']), 2000) for doc in context_docs) > SHORT_CONTEXT_CHARS:
+            return ANSWER_MODEL, 'long_context'
+        return FAST_MODEL, 'simple'
+
+    def _timed_call(self, model: str, question: str, context_docs: List[Dict],
+                    image_base64: Optional[str], budget: Optional[LatencyBudget]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            result = self.openai_client.complete_answer(
+                question, context_docs, image_base64, model=model,
+                max_tokens=FAST_MAX_TOKENS if model == FAST_MODEL else 1500,
+                budget=budget
+            )
+        except Exception:
+            with self._lock:
+                self._failures[model] += 1
+            raise
+        with self._lock:
+            self._latencies[model].append(time.perf_counter() - started)
+        return result
+
+    def _hedged_call(self, model: str, question: str, context_docs: List[Dict],
+                     image_base64: Optional[str], budget: Optional[LatencyBudget]) -> Optional[Dict[str, Any]]:
+        """Call the model; if it misses the SLO, race a fast-tier request and take the first success"""
+        # Workers run in a copy of the caller's context so their log lines keep the request id
+        futures = {self.executor.submit(contextvars.copy_context().run, self._timed_call,
+                                        model, question, context_docs, image_base64, budget): 'primary'}
+        # With less than HEDGE_AFTER left there is no time for a hedge to help; sending one
+        # straight away would only double upstream load when the service is already slow
+        if budget is not None and budget.remaining() < HEDGE_AFTER:
+            self._record('hedge_skipped')
+        else:
+            done, _ = wait(futures, timeout=HEDGE_AFTER)
+            if not done:
+                self._record('hedge_sent')
+                hedge = self.executor.submit(contextvars.copy_context().run, self._timed_call,
+                                             FAST_MODEL, question, context_docs, image_base64, budget)
+                futures[hedge] = 'hedge'
+
+        pending = set(futures)
+        while pending:
+            timeout = budget.remaining() if budget else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if futures[future] == 'hedge':
+                        self._record('hedge_won')
+                    return future.result()
+                logger.warning(f"{futures[future].capitalize()} answer request failed: {future.exception()}")
+        return None
+
+    def answer(self, question: str, context_docs: List[Dict], image_base64: Optional[str] = None,
+               budget: Optional[LatencyBudget] = None) -> Dict[str, Any]:
+        """Generate an answer, escalating and falling back across tiers as needed"""
+        model, reason = self.choose_tier(question, context_docs, image_base64)
+        self._record(f'route_{reason}')
+
+        result = self._hedged_call(model, question, context_docs, image_base64, budget)
+
+        # Low-confidence (or failed) fast answers get one strong-tier attempt if time allows
+        needs_escalation = result is None or (result.get('model') == FAST_MODEL and
+                                              answer_confidence(result) < ESCALATE_CONFIDENCE)
+        if needs_escalation and model != ANSWER_MODEL and (budget is None or budget.remaining() > 0):
+            self._record('escalated')
+            try:
+                escalated = self._timed_call(ANSWER_MODEL, question, context_docs, image_base64, budget)
+                result = escalated
+            except Exception as e:
+                logger.warning(f"Escalation to {ANSWER_MODEL} failed: {e}")
+
+        if result is None:
+            self._record('extractive_fallback')
+            result = self.extractive_answer(question, context_docs)
+
+        result['route'] = reason
+        logger.info(f"Answered with {result['model']} (route: {reason})")
+        return result
+
+    def extractive_answer(self, question: str, context_docs: List[Dict]) -> Dict[str, Any]:
+        """Answer built locally from the retrieved snippets when every upstream tier fails"""
+        query_terms = set(tokenize(question))
+        snippets = []
+        for doc in context_docs[:3]:
+            sentences = [s.strip() for s in doc['content'].replace('\n', ' ').split('. ') if s.strip()]
+            if not sentences:
+                continue
+            overlap = np.array([len(query_terms & set(tokenize(s))) for s in sentences])
+            best = int(overlap.argmax())
+            snippet = '. '.join(sentences[best:best + 2])[:400]
+            snippets.append(f"- {doc['metadata'].get('title', 'Source')}: {snippet}")
+
+        _, source_links = self.openai_client.build_context(context_docs)
+        answer = ("I couldn't reach the answer service right now, but these course sources look relevant:\n"
+                  + '\n'.join(snippets)) if snippets else \
+            'I apologize, but I encountered an error while processing your question. Please try again.'
+        return {
+            'answer': answer,
+            'confidence': 0.2 if snippets else 0.0,
+            'links': self.openai_client.select_links(source_links, []),
+            'model': 'extractive'
+        }
+
+    def _record(self, decision: str):
+        with self._lock:
+            self._decisions[decision] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing decision counts and per-tier latency percentiles"""
+        with self._lock:
+            tiers = {}
+            for model, samples in self._latencies.items():
+                values = np.array(samples)
+                tiers[model] = {
+                    'calls': len(values),
+                    'failures': self._failures[model],
+                    'p50_seconds': round(float(np.percentile(values, 50)), 3),
+                    'p95_seconds': round(float(np.percentile(values, 95)), 3),
+                }
+            for model, failures in self._failures.items():
+                tiers.setdefault(model, {'calls': 0, 'failures': failures})
+            return {'decisions': dict(self._decisions), 'tiers': tiers}
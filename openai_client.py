@@ -1,16 +1,238 @@
 import os
 import json
 import logging
+import random
+import threading
 import time
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import httpx
+from openai import OpenAI, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
 
 logger = logging.getLogger(__name__)
 
+# HTTP pool and deadline settings (seconds), shared by every OpenAIClient in the process
+MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", "90"))
+USE_HTTP2 = os.environ.get("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "3"))
+POOL_TIMEOUT = float(os.environ.get("OPENAI_POOL_TIMEOUT", "2"))
+EMBEDDING_READ_TIMEOUT = float(os.environ.get("OPENAI_EMBEDDING_TIMEOUT", "10"))
+CHAT_READ_TIMEOUT = float(os.environ.get("OPENAI_CHAT_TIMEOUT", "25"))
+MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY = float(os.environ.get("OPENAI_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("OPENAI_RETRY_MAX_DELAY", "8"))
+
+# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+# do not change this unless explicitly requested by the user
+ANSWER_MODEL = "gpt-4o"
+
+# text-embedding-3 models can return shortened vectors; 1536 is the full size of text-embedding-3-small
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "1536"))
+
+# Prompt templates are built once; the system prompt and context form a byte-stable prefix
+SYSTEM_PROMPT = """You are a virtual Teaching Assistant for the Tools in Data Science (TDS) course at IIT Madras.
+Your role is to help students by answering their questions based on the provided course content and Discourse posts.
+
+Guidelines:
+1. Answer questions accurately based on the provided context
+2. If the context doesn't contain enough information, say so clearly
+3. Be helpful, concise, and educational
+4. Reference specific sources when possible
+5. For coding questions, provide clear examples when available in the context
+6. Maintain a friendly but professional tone
+
+Always format your response as JSON with this structure:
+{
+    "answer": "Your detailed answer here",
+    "confidence": 0.8,
+    "sources_used": ["url1", "url2"]
+}"""
+CONTEXT_TEMPLATE = "Context from TDS course materials:\n{context}"
+QUESTION_TEMPLATE = "Question: {question}"
+IMAGE_INSTRUCTION = "\n\nPlease analyze the attached image if relevant to the question and provide a comprehensive answer."
+
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+class BudgetExceeded(Exception):
+    """Raised when a request's latency budget is used up before an upstream call can start"""
+    pass
+
+class LatencyBudget:
+    """Wall-clock deadline for one API request, shared by all upstream calls it makes"""
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)"""
+        return max(0.0, self.deadline - time.monotonic())
+    
+    def timeout(self, read_timeout: float) -> httpx.Timeout:
+        """Per-call httpx timeout: operation defaults capped by what is left of the budget"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise BudgetExceeded(f"Latency budget of {self.seconds:.1f}s exhausted")
+        return httpx.Timeout(
+            connect=min(CONNECT_TIMEOUT, remaining),
+            read=min(read_timeout, remaining),
+            write=min(read_timeout, remaining),
+            pool=min(POOL_TIMEOUT, remaining)
+        )
+
+class ConnectionStats:
+    """Counts requests, new connections and TLS handshake time via httpcore trace events"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.tls_handshake_seconds = 0.0
+        self.retries = 0
+        
+    def trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace callback installed on every outgoing request"""
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event_name == "connection.start_tls.started":
+            self._local.tls_started = time.perf_counter()
+        elif event_name == "connection.start_tls.complete":
+            started = getattr(self._local, 'tls_started', None)
+            if started is not None:
+                with self._lock:
+                    self.tls_handshakes += 1
+                    self.tls_handshake_seconds += time.perf_counter() - started
+                    
+    def on_request(self, request: httpx.Request):
+        """httpx request hook: count the request and attach the trace callback"""
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.trace
+        
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+            
+    def snapshot(self) -> Dict[str, Any]:
+        """Current counters plus derived connection reuse rate"""
+        with self._lock:
+            reuse_rate = 1 - self.new_connections / self.requests if self.requests else 0.0
+            return {
+                'requests': self.requests,
+                'new_connections': self.new_connections,
+                'connection_reuse_rate': round(max(0.0, reuse_rate), 4),
+                'tls_handshakes': self.tls_handshakes,
+                'tls_handshake_seconds': round(self.tls_handshake_seconds, 4),
+                'retries': self.retries,
+                'http2': USE_HTTP2
+            }
+
+connection_stats = ConnectionStats()
+
+class PromptCacheStats:
+    """Prompt and cached prompt token counts reported in chat completion usage"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        
+    def record(self, usage: Any) -> Dict[str, int]:
+        """Add one response's usage; returns the per-request token counts"""
+        details = getattr(usage, 'prompt_tokens_details', None)
+        counts = {
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'cached_tokens': getattr(details, 'cached_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0
+        }
+        with self._lock:
+            self.requests += 1
+            self.cache_hits += int(counts['cached_tokens'] > 0)
+            self.prompt_tokens += counts['prompt_tokens']
+            self.cached_tokens += counts['cached_tokens']
+            self.completion_tokens += counts['completion_tokens']
+        return counts
+        
+    def snapshot(self) -> Dict[str, Any]:
+        """Current counters plus the share of prompt tokens served from cache"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'cache_hits': self.cache_hits,
+                'prompt_tokens': self.prompt_tokens,
+                'cached_tokens': self.cached_tokens,
+                'completion_tokens': self.completion_tokens,
+                'cached_token_ratio': round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0
+            }
+
+prompt_cache_stats = PromptCacheStats()
+
+def _build_http_client() -> httpx.Client:
+    """Create the keep-alive pooled HTTP client shared by all OpenAI calls"""
+    http2 = USE_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("OPENAI_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+            
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            connect=CONNECT_TIMEOUT,
+            read=CHAT_READ_TIMEOUT,
+            write=CHAT_READ_TIMEOUT,
+            pool=POOL_TIMEOUT
+        ),
+        event_hooks={'request': [connection_stats.on_request]}
+    )
+
+def answer_confidence(result: Dict[str, Any]) -> float:
+    """The model's self-reported confidence as a float; missing or non-numeric values count as 0.0"""
+    try:
+        return float(result.get('confidence') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+def get_openai_client() -> 'OpenAIClient':
+    """Return the process-wide OpenAIClient, creating it on first use"""
+    global _shared_client
+    
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = OpenAIClient(http_client=_build_http_client())
+    return _shared_client
+
 class OpenAIClient:
     """OpenAI client for embeddings and chat completion"""
     
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, http_client: Optional[httpx.Client] = None):
+        # Retries are handled by _call_with_retries so they can respect the request budget
+        client_options = {'max_retries': 0}
+        if http_client is not None:
+            client_options['http_client'] = http_client
+        
+        # An explicit base URL (e.g. the local openai_stub.py server) overrides the provider default
+        self.base_url = base_url or os.environ.get("OPENAI_BASE_URL")
+        
         # Check for AI Pipe configuration first
         self.aipipe_token = os.environ.get("AIPIPE_TOKEN")
         
@@ -18,23 +240,69 @@ class OpenAIClient:
             # Use AI Pipe proxy
             self.client = OpenAI(
                 api_key=self.aipipe_token,
-                base_url="https://aipipe.org/openai/v1"
+                base_url=self.base_url or "https://aipipe.org/openai/v1",
+                **client_options
             )
-            logger.info("Using AI Pipe proxy for OpenAI services")
+            logger.info(f"Using AI Pipe proxy for OpenAI services at {self.client.base_url}")
         else:
             # Fallback to direct OpenAI
             self.api_key = os.environ.get("OPENAI_API_KEY")
             if not self.api_key:
-                raise ValueError("Either AIPIPE_TOKEN or OPENAI_API_KEY environment variable is required")
-            self.client = OpenAI(api_key=self.api_key)
-            logger.info("Using direct OpenAI API")
+                if not self.base_url:
+                    raise ValueError("Either AIPIPE_TOKEN or OPENAI_API_KEY environment variable is required")
+                # Local stub servers accept any key
+                self.api_key = "stub"
+            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, **client_options)
+            logger.info(f"Using direct OpenAI API at {self.client.base_url}")
+    
+    def _call_with_retries(self, operation: str, call: Callable[[httpx.Timeout], Any],
+                           read_timeout: float, budget: Optional[LatencyBudget] = None) -> Any:
+        """Run an upstream call with jittered exponential backoff, never outliving the budget"""
+        attempt = 0
+        while True:
+            if budget is not None:
+                timeout = budget.timeout(read_timeout)
+            else:
+                timeout = httpx.Timeout(connect=CONNECT_TIMEOUT, read=read_timeout,
+                                        write=read_timeout, pool=POOL_TIMEOUT)
+            try:
+                return call(timeout)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+                
+                # Full jitter, but honour an explicit Retry-After from a 429
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+                response = getattr(e, 'response', None)
+                retry_after = response.headers.get('retry-after') if response is not None else None
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                    
+                if budget is not None and delay >= budget.remaining():
+                    logger.warning(f"{operation} failed and the latency budget leaves no time to retry: {e}")
+                    raise
+                
+                attempt += 1
+                connection_stats.record_retry()
+                logger.warning(f"{operation} failed ({e}), retry {attempt}/{MAX_RETRIES} in {delay:.2f}s")
+                time.sleep(delay)
+        
+    def _embedding_options(self) -> Dict[str, Any]:
+        """Model (and shortened dimension, if configured) for embedding requests"""
+        options = {'model': EMBEDDING_MODEL}
+        if EMBEDDING_DIMENSIONS < 1536:
+            options['dimensions'] = EMBEDDING_DIMENSIONS
+        return options
         
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def get_embeddings(self, texts: List[str], budget: Optional[LatencyBudget] = None,
+                       chunk_size: int = 5) -> List[List[float]]:
         """Generate embeddings for a list of texts with chunking for AI Pipe limits"""
         try:
             # For AI Pipe, we need to chunk requests to stay under token limits
-            # Start with very small chunks and increase if successful
-            chunk_size = 5  # Process 5 texts at a time to stay under token limits
+            # The default of 5 texts per request suits 2000-character documents; short queries can go in larger chunks
             all_embeddings = []
             
             for i in range(0, len(texts), chunk_size):
@@ -42,35 +310,52 @@ class OpenAIClient:
                 # Truncate very long texts to avoid token limits
                 truncated_chunk = [text[:2000] if len(text) > 2000 else text for text in chunk]
                 
-                logger.info(f"Processing embedding chunk {i//chunk_size + 1}/{(len(texts) + chunk_size - 1)//chunk_size} with {len(chunk)} items")
+                logger.debug(f"Processing embedding chunk {i//chunk_size + 1}/{(len(texts) + chunk_size - 1)//chunk_size} with {len(chunk)} items")
                 
                 try:
-                    response = self.client.embeddings.create(
-                        input=truncated_chunk,
-                        model="text-embedding-3-small"
+                    response = self._call_with_retries(
+                        "Embedding request",
+                        lambda timeout: self.client.embeddings.create(
+                            input=truncated_chunk,
+                            timeout=timeout,
+                            **self._embedding_options()
+                        ),
+                        EMBEDDING_READ_TIMEOUT,
+                        budget
                     )
                     
                     chunk_embeddings = [embedding.embedding for embedding in response.data]
                     all_embeddings.extend(chunk_embeddings)
                     
                     # Small delay between chunks to avoid rate limiting
-                    time.sleep(1.0)
+                    if i + chunk_size < len(texts):
+                        time.sleep(1.0)
                     
+                except BudgetExceeded:
+                    raise
                 except Exception as chunk_error:
                     logger.warning(f"Error in chunk {i//chunk_size + 1}: {chunk_error}")
                     # Try individual items if chunk fails
                     for single_text in truncated_chunk:
                         try:
-                            response = self.client.embeddings.create(
-                                input=[single_text[:1000]],  # Further truncate for individual processing
-                                model="text-embedding-3-small"
+                            response = self._call_with_retries(
+                                "Embedding request",
+                                lambda timeout: self.client.embeddings.create(
+                                    input=[single_text[:1000]],  # Further truncate for individual processing
+                                    timeout=timeout,
+                                    **self._embedding_options()
+                                ),
+                                EMBEDDING_READ_TIMEOUT,
+                                budget
                             )
                             all_embeddings.extend([embedding.embedding for embedding in response.data])
                             time.sleep(0.5)
+                        except BudgetExceeded:
+                            raise
                         except Exception as single_error:
                             logger.error(f"Failed to process individual text: {single_error}")
                             # Add a zero vector as placeholder
-                            all_embeddings.append([0.0] * 1536)  # text-embedding-3-small dimension
+                            all_embeddings.append([0.0] * EMBEDDING_DIMENSIONS)
             
             logger.info(f"Generated {len(all_embeddings)} embeddings successfully")
             return all_embeddings
@@ -79,106 +364,122 @@ class OpenAIClient:
             logger.error(f"Error generating embeddings: {e}")
             raise
             
-    def generate_answer(self, question: str, context_docs: List[Dict], image_base64: Optional[str] = None) -> Dict[str, Any]:
-        """Generate an answer using GPT-4o with context"""
-        try:
-            # Prepare context from retrieved documents
-            context_text = ""
-            source_links = []
-            
-            for doc in context_docs:
-                metadata = doc['metadata']
-                context_text += f"\n--- Source: {metadata.get('title', 'Unknown')} ---\n"
-                context_text += doc['content'][:2000]  # Limit context length
-                context_text += "\n\n"
-                
-                # Collect source links
-                if metadata.get('url'):
-                    source_links.append({
-                        'url': metadata['url'],
-                        'text': metadata.get('title', 'Source'),
-                        'type': metadata.get('type', 'unknown')
-                    })
-            
-            # Prepare system prompt
-            system_prompt = """You are a virtual Teaching Assistant for the Tools in Data Science (TDS) course at IIT Madras. 
-            Your role is to help students by answering their questions based on the provided course content and Discourse posts.
-            
-            Guidelines:
-            1. Answer questions accurately based on the provided context
-            2. If the context doesn't contain enough information, say so clearly
-            3. Be helpful, concise, and educational
-            4. Reference specific sources when possible
-            5. For coding questions, provide clear examples when available in the context
-            6. Maintain a friendly but professional tone
-            
-            Always format your response as JSON with this structure:
-            {
-                "answer": "Your detailed answer here",
-                "confidence": 0.8,
-                "sources_used": ["url1", "url2"]
-            }"""
-            
-            # Prepare user message
-            user_content = []
-            
-            if image_base64:
-                user_content.append({
-                    "type": "text",
-                    "text": f"Question: {question}\n\nContext from TDS course materials:\n{context_text}\n\nPlease analyze the attached image if relevant to the question and provide a comprehensive answer."
-                })
-                user_content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                })
-            else:
-                user_content.append({
-                    "type": "text", 
-                    "text": f"Question: {question}\n\nContext from TDS course materials:\n{context_text}"
+    def build_context(self, context_docs: List[Dict]) -> Tuple[str, List[Dict[str, Any]]]:
+        """Context text for the prompt plus the candidate source links
+        
+        Sections are ordered by document id rather than by relevance, so the same retrieved set
+        always renders to the same prompt prefix; links keep relevance order.
+        """
+        context_text = ""
+        source_links = []
+        
+        for doc in sorted(context_docs, key=lambda d: str(d.get('id', ''))):
+            metadata = doc['metadata']
+            # Aggregated thread windows map back to the exact posts they contain
+            post_urls = json.loads(metadata.get('post_urls') or '[]')
+            context_text += f"\n--- Source: {metadata.get('title', 'Unknown')} ({metadata.get('url', '')}) ---\n"
+            if len(post_urls) > 1:
+                context_text += f"Post URLs: {', '.join(post_urls)}\n"
+            context_text += doc['content'][:2000]  # Limit context length
+            context_text += "\n\n"
+        
+        for doc in context_docs:
+            metadata = doc['metadata']
+            post_urls = json.loads(metadata.get('post_urls') or '[]')
+            # Collect source links
+            if metadata.get('url'):
+                source_links.append({
+                    'url': metadata['url'],
+                    'post_urls': post_urls,
+                    'text': metadata.get('title', 'Source'),
+                    'type': metadata.get('type', 'unknown')
                 })
+        
+        return context_text, source_links
+    
+    def select_links(self, source_links: List[Dict[str, Any]], sources_used: List[str]) -> List[Dict[str, Any]]:
+        """Filter and format source links"""
+        relevant_links = []
+        for link in source_links[:5]:  # Limit to top 5 sources
+            # Prefer the specific posts the model cited within a thread window
+            cited = [url for url in link['post_urls'] if url in sources_used] or [link['url']]
+            for url in cited:
+                if url not in [l['url'] for l in relevant_links]:
+                    relevant_links.append({'url': url, 'text': link['text'], 'type': link['type']})
+        return relevant_links
             
-            # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            # do not change this unless explicitly requested by the user
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+    def complete_answer(self, question: str, context_docs: List[Dict], image_base64: Optional[str] = None,
+                        model: str = ANSWER_MODEL, max_tokens: int = 1500,
+                        budget: Optional[LatencyBudget] = None) -> Dict[str, Any]:
+        """Generate an answer with the given chat model; upstream errors propagate"""
+        # Prepare context from retrieved documents
+        context_text, source_links = self.build_context(context_docs)
+        
+        # Stable prefix first (system prompt, then context) so repeated prefixes hit the provider's prompt cache;
+        # the question and image come last because they change on every request
+        user_content = [{"type": "text", "text": QUESTION_TEMPLATE.format(question=question)}]
+        if image_base64:
+            user_content[0]["text"] += IMAGE_INSTRUCTION
+            user_content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
+            })
+        
+        response = self._call_with_retries(
+            "Chat completion",
+            lambda timeout: self.client.chat.completions.create(
+                model=model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": CONTEXT_TEMPLATE.format(context=context_text)},
                     {"role": "user", "content": user_content}
                 ],
                 response_format={"type": "json_object"},
-                max_tokens=1500,
-                temperature=0.1
-            )
-            
-            # Parse the response
-            response_text = response.choices[0].message.content
-            try:
-                if response_text and isinstance(response_text, str):
-                    response_json = json.loads(response_text)
-                    answer = response_json.get('answer', response_text)
-                    confidence = response_json.get('confidence', 0.5)
-                    sources_used = response_json.get('sources_used', [])
-                else:
-                    answer = "I apologize, but I couldn't generate a response."
-                    confidence = 0.0
-                    sources_used = []
-            except (json.JSONDecodeError, TypeError):
-                # Fallback if JSON parsing fails
-                answer = response_text or "I apologize, but I couldn't generate a response."
-                confidence = 0.5
+                max_tokens=max_tokens,
+                temperature=0.1,
+                timeout=timeout
+            ),
+            CHAT_READ_TIMEOUT,
+            budget
+        )
+        
+        usage = prompt_cache_stats.record(response.usage)
+        logger.info(f"{model} prompt: {usage['prompt_tokens']} tokens, {usage['cached_tokens']} cached")
+        
+        # Parse the response
+        response_text = response.choices[0].message.content
+        try:
+            if response_text and isinstance(response_text, str):
+                response_json = json.loads(response_text)
+                answer = response_json.get('answer', response_text)
+                confidence = response_json.get('confidence', 0.5)
+                sources_used = response_json.get('sources_used', [])
+            else:
+                answer = "I apologize, but I couldn't generate a response."
+                confidence = 0.0
                 sources_used = []
+        except (json.JSONDecodeError, TypeError):
+            # Fallback if JSON parsing fails
+            answer = response_text or "I apologize, but I couldn't generate a response."
+            confidence = 0.5
+            sources_used = []
+        # Cited URLs are only trusted as a list of strings (the model sometimes sends null or one string)
+        if not isinstance(sources_used, list) or not all(isinstance(url, str) for url in sources_used):
+            sources_used = []
+        
+        return {
+            'answer': answer,
+            'confidence': confidence,
+            'links': self.select_links(source_links, sources_used),
+            'model': model,
+            'usage': usage
+        }
             
-            # Filter and format source links
-            relevant_links = []
-            for link in source_links[:5]:  # Limit to top 5 sources
-                if link['url'] and link['url'] not in [l['url'] for l in relevant_links]:
-                    relevant_links.append(link)
-            
-            return {
-                'answer': answer,
-                'confidence': confidence,
-                'links': relevant_links
-            }
+    def generate_answer(self, question: str, context_docs: List[Dict], image_base64: Optional[str] = None,
+                        budget: Optional[LatencyBudget] = None) -> Dict[str, Any]:
+        """Generate an answer using GPT-4o with context"""
+        try:
+            return self.complete_answer(question, context_docs, image_base64, budget=budget)
             
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
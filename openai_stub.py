@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub server
+
+Serves the embeddings and chat-completions endpoints used by OpenAIClient so the
+/api/ endpoint can be load tested without spending tokens or hitting AI Pipe
+rate limits. Latency, error rate and 429 injection are configurable per endpoint.
+
+Usage:
+    python openai_stub.py --port 8001 --chat-latency lognormal:1.2,0.4 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 gunicorn --bind 0.0.0.0:5000 main:app
+
+Latency specs (all values in seconds):
+    fixed:0.2            always 0.2s
+    uniform:0.1,0.5      uniform between 0.1s and 0.5s
+    normal:0.3,0.05      mean 0.3s, standard deviation 0.05s
+    lognormal:0.3,0.5    median 0.3s, sigma 0.5 of the underlying normal
+    exponential:0.3      mean 0.3s
+
+Author: TDS Virtual TA
+License: MIT
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List
+
+from flask import Flask, request, jsonify
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is a server dependency, but the stub still runs without it
+    BaseApplication = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Parse a latency spec like 'lognormal:0.3,0.5' into a sampler"""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v.strip()] if args else []
+
+    if kind == 'fixed':
+        delay = values[0] if values else 0.0
+        return lambda rng: delay
+    if kind == 'uniform':
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == 'normal':
+        mean, stddev = values
+        return lambda rng: max(0.0, rng.gauss(mean, stddev))
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    if kind == 'exponential':
+        mean = values[0]
+        return lambda rng: rng.expovariate(1.0 / mean)
+
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubBehaviour:
+    """Latency and fault injection settings for one endpoint"""
+
+    def __init__(self, latency: str, error_rate: float, rate_limit_rate: float, retry_after: float, seed: int):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> Dict[str, Any]:
+        """Decide the outcome of one call: delay plus an optional injected fault"""
+        with self._lock:
+            delay = self.sample_latency(self._rng)
+            roll = self._rng.random()
+
+        if roll < self.rate_limit_rate:
+            return {'delay': delay, 'fault': 429}
+        if roll < self.rate_limit_rate + self.error_rate:
+            return {'delay': delay, 'fault': 500}
+        return {'delay': delay, 'fault': None}
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic unit-length pseudo embedding derived from the text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (4 characters per token) for the usage block"""
+    return max(1, len(text) // 4)
+
+
+# Prompt caching as OpenAI documents it: prefixes of 1024+ tokens, matched in 128-token increments
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT_TOKENS = 128
+# Prefix digests remembered, least recently used evicted first (bounds memory on long runs)
+PREFIX_CACHE_SIZE = 100000
+
+
+def cached_prefix_tokens(messages: List[Dict[str, Any]], seen_prefixes: OrderedDict,
+                         max_prefixes: int = PREFIX_CACHE_SIZE) -> int:
+    """Tokens of the longest leading run of messages already seen, as a prompt cache would serve them"""
+    cached = 0
+    prefix = ''
+    for message in messages:
+        prefix += json.dumps(message, sort_keys=True)
+        digest = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+        if digest in seen_prefixes:
+            cached = approx_tokens(prefix)
+            seen_prefixes.move_to_end(digest)
+        else:
+            seen_prefixes[digest] = True
+            if len(seen_prefixes) > max_prefixes:
+                seen_prefixes.popitem(last=False)
+    if cached < CACHE_MIN_TOKENS:
+        return 0
+    return cached - cached % CACHE_INCREMENT_TOKENS
+
+
+def create_app(embeddings: StubBehaviour, chat: StubBehaviour, dimensions: int,
+               prefix_cache_size: int = PREFIX_CACHE_SIZE) -> Flask:
+    """Build the stub Flask app"""
+    app = Flask(__name__)
+    counters = {'embeddings': 0, 'chat': 0, '429': 0, '500': 0, 'cached_tokens': 0}
+    counters_lock = threading.Lock()
+    seen_prefixes = OrderedDict()
+
+    def apply_behaviour(behaviour: StubBehaviour, name: str):
+        outcome = behaviour.draw()
+        time.sleep(outcome['delay'])
+
+        with counters_lock:
+            counters[name] += 1
+            if outcome['fault']:
+                counters[str(outcome['fault'])] += 1
+
+        if outcome['fault'] == 429:
+            response = jsonify({'error': {'message': 'Rate limit reached (stub)', 'type': 'rate_limit_error'}})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(behaviour.retry_after)
+            return response
+        if outcome['fault'] == 500:
+            return jsonify({'error': {'message': 'Injected upstream failure (stub)', 'type': 'server_error'}}), 500
+        return None
+
+    @app.route('/v1/embeddings', methods=['POST'])
+    @app.route('/openai/v1/embeddings', methods=['POST'])
+    def create_embeddings():
+        fault = apply_behaviour(embeddings, 'embeddings')
+        if fault is not None:
+            return fault
+
+        data = request.get_json(force=True)
+        inputs = data.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dims = data.get('dimensions') or dimensions
+
+        return jsonify({
+            'object': 'list',
+            'model': data.get('model', 'text-embedding-3-small'),
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': fake_embedding(text, dims)}
+                for i, text in enumerate(inputs)
+            ],
+            'usage': {
+                'prompt_tokens': sum(approx_tokens(text) for text in inputs),
+                'total_tokens': sum(approx_tokens(text) for text in inputs)
+            }
+        })
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    @app.route('/openai/v1/chat/completions', methods=['POST'])
+    def create_chat_completion():
+        fault = apply_behaviour(chat, 'chat')
+        if fault is not None:
+            return fault
+
+        data = request.get_json(force=True)
+        prompt_text = json.dumps(data.get('messages', []))
+        content = json.dumps({
+            'answer': 'This is a stubbed answer generated for load testing.',
+            'confidence': 0.8,
+            'sources_used': []
+        })
+        prompt_tokens = approx_tokens(prompt_text)
+        completion_tokens = approx_tokens(content)
+        with counters_lock:
+            cached_tokens = min(prompt_tokens, cached_prefix_tokens(data.get('messages', []), seen_prefixes,
+                                                                        prefix_cache_size))
+            counters['cached_tokens'] += cached_tokens
+
+        return jsonify({
+            'id': f"chatcmpl-stub-{int(time.time() * 1000)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': data.get('model', 'gpt-4o'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+                'prompt_tokens_details': {'cached_tokens': cached_tokens}
+            }
+        })
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        with counters_lock:
+            return jsonify(dict(counters))
+
+    return app
+
+
+def serve(app: Flask, host: str, port: int, threads: int):
+    """Serve with gunicorn's threaded worker, which keeps client connections alive between requests
+
+    Werkzeug's development server closes every connection, so a load test against it would
+    always report a connection reuse rate of 0.
+    """
+    if BaseApplication is None:
+        logger.warning("gunicorn is not installed; the development server closes every connection, "
+                       "so connection reuse cannot be measured against this stub")
+        app.run(host=host, port=port, threaded=True)
+        return
+
+    class StubServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('worker_class', 'gthread')
+            # One process: counters and the prompt prefix cache live in its memory
+            self.cfg.set('workers', 1)
+            self.cfg.set('threads', threads)
+            self.cfg.set('keepalive', 75)
+            self.cfg.set('timeout', 0)
+
+        def load(self):
+            return app
+
+    StubServer().run()
+
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Run a local OpenAI-compatible stub server')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=8001, help='Port to listen on')
+    parser.add_argument('--embedding-latency', default='lognormal:0.15,0.3', help='Latency spec for /v1/embeddings')
+    parser.add_argument('--chat-latency', default='lognormal:1.5,0.4', help='Latency spec for /v1/chat/completions')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with HTTP 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of calls answered with HTTP 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After value sent with injected 429s')
+    parser.add_argument('--dimensions', type=int, default=1536, help='Default embedding dimension')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for latency and fault sampling')
+    parser.add_argument('--threads', type=int, default=64, help='Concurrent requests served (gunicorn threads)')
+    parser.add_argument('--prefix-cache-size', type=int, default=PREFIX_CACHE_SIZE,
+                        help='Prompt prefixes remembered for cached_tokens accounting')
+
+    args = parser.parse_args()
+
+    try:
+        embeddings = StubBehaviour(args.embedding_latency, args.error_rate, args.rate_limit_rate, args.retry_after, args.seed)
+        chat = StubBehaviour(args.chat_latency, args.error_rate, args.rate_limit_rate, args.retry_after, args.seed + 1)
+    except (ValueError, IndexError) as e:
+        logger.error(f"Invalid latency spec: {e}")
+        return 1
+
+    app = create_app(embeddings, chat, args.dimensions, args.prefix_cache_size)
+    logger.info(f"OpenAI stub listening on http://{args.host}:{args.port}/v1")
+    serve(app, args.host, args.port, args.threads)
+
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import os
+import io
+import sys
+import time
+import hmac
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+# Admin endpoints and per-request profiling are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Per-request cProfile output, newest PROFILE_KEEP files kept
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+# Continuous sampling profiler: on at startup or not, sampling interval, distinct stacks kept
+SAMPLING_PROFILER = os.environ.get("SAMPLING_PROFILER", "false").lower() == "true"
+SAMPLING_INTERVAL_MS = float(os.environ.get("SAMPLING_INTERVAL_MS", "10"))
+SAMPLING_MAX_STACKS = int(os.environ.get("SAMPLING_MAX_STACKS", "20000"))
+SAMPLING_MAX_DEPTH = 64
+# Intervals accepted from the admin endpoint; shorter ones cost too much, longer ones say little
+MIN_SAMPLING_INTERVAL_MS = 1.0
+MAX_SAMPLING_INTERVAL_MS = 1000.0
+# Upper bound for "profile the next N requests"
+MAX_PROFILE_NEXT = 1000
+
+# Innermost frames of threads parked waiting for work; their samples say nothing about hot spots
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socketserver.py', 'serve_forever'),
+    ('thread.py', '_worker'),
+}
+
+def is_admin(token: Optional[str]) -> bool:
+    """True when the token matches ADMIN_TOKEN (never when no token is configured)"""
+    # Compared as bytes: compare_digest rejects str values with non-ASCII characters
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+class RequestProfiles:
+    """cProfile captures of single requests, saved as .prof files
+
+    cProfile only sees the thread that serves the request; work handed to router or shard
+    workers shows up as time spent waiting on their futures.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self.profile_next = 0
+        # One capture at a time per worker: profiles of concurrent requests would interfere
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def request_next(self, count: int):
+        """Profile the next `count` requests regardless of headers"""
+        with self._lock:
+            self.profile_next = max(0, count)
+
+    def take_next(self) -> bool:
+        with self._lock:
+            if self.profile_next <= 0:
+                return False
+            self.profile_next -= 1
+            return True
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Start profiling the current thread, None if another capture is running"""
+        if not self._busy.acquire(blocking=False):
+            logger.warning("Profile requested while another capture is running; skipping")
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Another profiler (e.g. a debugger) owns the hook
+            self._busy.release()
+            logger.warning(f"Could not start profiling: {e}")
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, profile_id: str, endpoint: str, elapsed: float):
+        """Stop a capture and write it to PROFILE_DIR/<profile_id>.prof"""
+        try:
+            profile.disable()
+        finally:
+            self._busy.release()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+            logger.info(f"Saved profile {profile_id} of {endpoint} ({elapsed:.2f}s)")
+            self._prune()
+        except OSError as e:
+            logger.error(f"Error saving profile {profile_id}: {e}")
+
+    def _prune(self):
+        profiles = sorted(self.list(), key=lambda p: p['created_at'])
+        for entry in profiles[:max(0, len(profiles) - self.keep)]:
+            os.remove(self.path(entry['id']))
+
+    def path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{os.path.basename(profile_id)}.prof")
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.prof'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append({'id': name[:-len('.prof')], 'created_at': stat.st_mtime, 'bytes': stat.st_size})
+        return sorted(entries, key=lambda e: -e['created_at'])
+
+    def report(self, profile_id: str, sort: str = 'cumulative', limit: int = 40) -> str:
+        """pstats text report of a saved capture"""
+        output = io.StringIO()
+        stats = pstats.Stats(self.path(profile_id), stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+class SamplingProfiler:
+    """Wall-clock sampling of every thread's stack, aggregated as collapsed stacks
+
+    The output ("frame;frame;frame count" per line) feeds flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval_ms: float = SAMPLING_INTERVAL_MS, max_stacks: int = SAMPLING_MAX_STACKS):
+        self.interval = interval_ms / 1000.0
+        self.max_stacks = max_stacks
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.sampling_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None):
+        with self._lock:
+            if interval_ms is not None:
+                self.interval = interval_ms / 1000.0
+            if self.running:
+                return
+            self._stop.clear()
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:.0f}ms interval)")
+
+    def stop(self):
+        with self._lock:
+            if not self.running:
+                return
+            self._stop.set()
+            thread = self._thread
+        thread.join()
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+
+    def reset(self):
+        with self._lock:
+            self.stacks = Counter()
+            self.samples = 0
+            self.sampling_seconds = 0.0
+            self.started_at = time.time() if self.running else None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            started = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            collected = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                frames = []
+                while frame is not None and len(frames) < SAMPLING_MAX_DEPTH:
+                    code = frame.f_code
+                    frames.append(f"{os.path.basename(code.co_filename)[:-3]}:{code.co_name}")
+                    frame = frame.f_back
+                thread_name = names.get(thread_id, 'thread').split('-')[0]
+                collected.append(';'.join([thread_name] + frames[::-1]))
+            with self._lock:
+                for stack in collected:
+                    if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                        self.stacks[stack] += 1
+                    else:
+                        self.stacks['[other]'] += 1
+                self.samples += 1
+                self.sampling_seconds += time.perf_counter() - started
+
+    def collapsed(self) -> str:
+        """Aggregated stacks in collapsed format, hottest first"""
+        with self._lock:
+            return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.time() - self.started_at if self.started_at else 0.0
+            return {
+                'running': self.running,
+                'interval_ms': round(self.interval * 1000, 2),
+                'samples': self.samples,
+                'distinct_stacks': len(self.stacks),
+                # Share of wall time the sampler thread spent walking stacks
+                'overhead': round(self.sampling_seconds / elapsed, 5) if elapsed else 0.0,
+            }
+
+request_profiles = RequestProfiles()
+sampling_profiler = SamplingProfiler()
+if SAMPLING_PROFILER:
+    sampling_profiler.start()
@@ -0,0 +1,128 @@
+import os
+import logging
+from typing import Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# In-memory vector storage: float32 (exact), float16 or int8 (scalar quantized)
+VECTOR_STORAGE = os.environ.get("VECTOR_STORAGE", "float32").lower()
+# Keep only the first N dimensions in memory (text-embedding-3 vectors stay meaningful when truncated); 0 = all
+VECTOR_DIMENSIONS = int(os.environ.get("VECTOR_DIMENSIONS", "0"))
+# Candidates per requested result that get exact float re-scoring
+RESCORE_FACTOR = int(os.environ.get("RESCORE_FACTOR", "4"))
+
+STORAGE_TYPES = ('float32', 'float16', 'int8')
+
+# Rows widened to float32 at a time when scoring compact storage
+SCORE_BLOCK_ROWS = 4096
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """Unit-normalise rows (zero rows stay zero)"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+def truncate(matrix: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    """Keep the leading dimensions and renormalise, as the embeddings API does for `dimensions`"""
+    if dimensions and dimensions < matrix.shape[-1]:
+        matrix = matrix[..., :dimensions]
+    return normalize(matrix.astype(np.float32, copy=False))
+
+class QuantizedMatrix:
+    """Unit vectors stored as float32, float16 or per-row scaled int8"""
+
+    def __init__(self, storage: str = VECTOR_STORAGE, dimensions: Optional[int] = VECTOR_DIMENSIONS):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"VECTOR_STORAGE must be one of {', '.join(STORAGE_TYPES)}, got {storage!r}")
+        self.storage = storage
+        self.dimensions = dimensions or None
+        self.data = None
+        self.scales = None
+        # Preallocated rows that data and scales are views into, filled page by page by extend()
+        self._reserved = 0
+        self._data_buffer = None
+        self._scales_buffer = None
+
+    @property
+    def exact(self) -> bool:
+        """True when scores equal exact full-dimension cosine similarity"""
+        return self.storage == 'float32' and self.dimensions is None
+
+    @property
+    def nbytes(self) -> int:
+        # Count whole allocations, including rows reserved but not yet filled
+        data = self._data_buffer if self._data_buffer is not None else self.data
+        scales = self._scales_buffer if self._scales_buffer is not None else self.scales
+        return (data.nbytes if data is not None else 0) + (scales.nbytes if scales is not None else 0)
+
+    def __len__(self) -> int:
+        return 0 if self.data is None else self.data.shape[0]
+
+    def encode(self, matrix: np.ndarray):
+        """Encode a float matrix (rows are vectors); returns (data, scales)"""
+        vectors = truncate(np.asarray(matrix, dtype=np.float32), self.dimensions)
+        if self.storage == 'float32':
+            return vectors, None
+        if self.storage == 'float16':
+            return vectors.astype(np.float16), None
+
+        # Symmetric per-row int8: x ~= q * scale with q in [-127, 127]
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        data = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return data, scales
+
+    def reserve(self, rows: int):
+        """Expect about `rows` rows in total, so extend() fills one allocation instead of growing"""
+        self._reserved = max(self._reserved, rows)
+
+    def _append(self, buffer: Optional[np.ndarray], current: Optional[np.ndarray], rows: np.ndarray):
+        """Write rows after current into buffer, reallocating (at least doubling) when it is full"""
+        filled = 0 if current is None else current.shape[0]
+        needed = filled + rows.shape[0]
+        if buffer is None or needed > buffer.shape[0]:
+            buffer = np.empty((max(needed, self._reserved, 2 * filled),) + rows.shape[1:], dtype=rows.dtype)
+            if filled:
+                buffer[:filled] = current
+        buffer[filled:needed] = rows
+        return buffer, buffer[:needed]
+
+    def extend(self, matrix: np.ndarray):
+        """Encode and append rows, so large collections can be loaded page by page"""
+        data, scales = self.encode(matrix)
+        self._data_buffer, self.data = self._append(self._data_buffer, self.data, data)
+        if scales is not None:
+            self._scales_buffer, self.scales = self._append(self._scales_buffer, self.scales, scales)
+
+    def load_normalized(self, matrix: np.ndarray):
+        """Take rows that are already unit float32 vectors (e.g. a memory-mapped snapshot)
+
+        Exact storage keeps a reference instead of a copy; compact storage is encoded block by block.
+        """
+        if self.exact:
+            self.data = matrix
+            self._data_buffer = None
+            return
+        self.reserve(matrix.shape[0])
+        for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+            self.extend(matrix[start:start + SCORE_BLOCK_ROWS])
+
+    def scores(self, query: np.ndarray, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate cosine similarity of the query against all (or the given) rows"""
+        if self.data is None:
+            return np.zeros(0, dtype=np.float32)
+
+        query = truncate(np.asarray(query, dtype=np.float32), self.dimensions)
+        data = self.data if positions is None else self.data[positions]
+        if self.storage == 'float32':
+            return data @ query
+
+        # Widen compact rows block by block: float16/int8 matmuls are not BLAS accelerated
+        scores = np.empty(data.shape[0], dtype=np.float32)
+        for start in range(0, data.shape[0], SCORE_BLOCK_ROWS):
+            block = data[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_BLOCK_ROWS] = block @ query
+
+        if self.storage == 'int8':
+            scores *= self.scales if positions is None else self.scales[positions]
+        return scores
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Time-partitioned question log with archival to Parquet
+
+The questions table is treated as monthly partitions on created_at. Only recent
+months stay in the database ("hot"); the retention job moves each older month into
+compressed Parquet files ("cold"), laid out Hive-style so readers can prune by month:
+
+    question_archive/month=2025-03/part-20250601T020000.parquet
+
+query_questions() serves a newest-first page from hot rows first and falls back to the
+archive for older ones; load_archive() returns a pyarrow Table for offline analysis.
+
+Usage:
+    python question_log.py archive --keep-months 3
+    python question_log.py archive --keep-months 3 --dry-run
+    python question_log.py partitions
+
+Requires pyarrow for the archive (pip install pyarrow).
+
+Author: TDS Virtual TA
+License: MIT
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from sqlalchemy import Index
+
+from models import Question
+
+logger = logging.getLogger(__name__)
+
+QUESTION_ARCHIVE_DIR = os.environ.get("QUESTION_ARCHIVE_DIR", "./question_archive")
+# Months kept in the database, counting the current one
+QUESTION_RETENTION_MONTHS = int(os.environ.get("QUESTION_RETENTION_MONTHS", "3"))
+ARCHIVE_COMPRESSION = os.environ.get("ARCHIVE_COMPRESSION", "zstd")
+# Rows read, written and deleted per step, so a large month never sits in memory or one transaction
+ARCHIVE_BATCH_ROWS = int(os.environ.get("ARCHIVE_BATCH_ROWS", "5000"))
+
+# Range scans by month and newest-first pages both walk this index
+created_at_index = Index('ix_questions_created_at', Question.created_at)
+
+ARCHIVE_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('question_text', pa.string()),
+    ('has_image', pa.bool_()),
+    ('answer_text', pa.string()),
+    ('response_time', pa.float64()),
+    ('relevant_docs_count', pa.int32()),
+    ('links_provided', pa.string()),  # JSON text
+    ('created_at', pa.timestamp('us')),
+    ('user_ip', pa.string()),
+    ('user_agent', pa.string()),
+]) if pa is not None else None
+
+ARCHIVE_COLUMNS = [
+    'id', 'question_text', 'has_image', 'answer_text', 'response_time', 'relevant_docs_count',
+    'links_provided', 'created_at', 'user_ip', 'user_agent'
+]
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("The question archive needs the 'pyarrow' package (pip install pyarrow)")
+
+
+def ensure_indexes(engine):
+    """Create the created_at index on existing questions tables (create_all only indexes new tables)"""
+    created_at_index.create(bind=engine, checkfirst=True)
+
+
+def month_key(dt: datetime) -> str:
+    return dt.strftime('%Y-%m')
+
+
+def month_start(key: str) -> datetime:
+    return datetime.strptime(key, '%Y-%m')
+
+
+def next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+
+def retention_cutoff(keep_months: int, now: Optional[datetime] = None) -> datetime:
+    """Start of the oldest month that stays in the database"""
+    now = now or datetime.utcnow()
+    months = now.year * 12 + now.month - 1 - max(1, keep_months) + 1
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def question_row(question: Question) -> Dict[str, Any]:
+    """Plain dict of a Question row, in the same shape as archived rows"""
+    return {column: getattr(question, column) for column in ARCHIVE_COLUMNS}
+
+
+def archive_month(session, key: str, directory: str = QUESTION_ARCHIVE_DIR) -> int:
+    """Move one month of questions from the database into a Parquet part file
+
+    The file is written and fsynced under a temporary name and renamed into place before any
+    row is deleted, and only the archived ids are deleted. A crash in between leaves rows in
+    both places; readers drop those duplicates by id.
+    """
+    require_pyarrow()
+    start = month_start(key)
+    end = next_month(start)
+    partition_dir = os.path.join(directory, f"month={key}")
+    os.makedirs(partition_dir, exist_ok=True)
+    path = os.path.join(partition_dir, f"part-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.parquet")
+    tmp_path = f"{path}.tmp"
+
+    archived_ids = []
+    last_id = 0
+    with pq.ParquetWriter(tmp_path, ARCHIVE_SCHEMA, compression=ARCHIVE_COMPRESSION) as writer:
+        while True:
+            # Keyset pagination on id within the month
+            batch = session.query(Question).filter(
+                Question.created_at >= start, Question.created_at < end, Question.id > last_id
+            ).order_by(Question.id).limit(ARCHIVE_BATCH_ROWS).all()
+            if not batch:
+                break
+            rows = [question_row(q) for q in batch]
+            for row in rows:
+                row['links_provided'] = json.dumps(row['links_provided']) if row['links_provided'] is not None else None
+            writer.write_table(pa.Table.from_pylist(rows, schema=ARCHIVE_SCHEMA))
+            archived_ids.extend(q.id for q in batch)
+            last_id = batch[-1].id
+            session.expunge_all()
+
+    if not archived_ids:
+        os.remove(tmp_path)
+        return 0
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    for i in range(0, len(archived_ids), ARCHIVE_BATCH_ROWS):
+        session.query(Question).filter(
+            Question.id.in_(archived_ids[i:i + ARCHIVE_BATCH_ROWS])
+        ).delete(synchronize_session=False)
+        session.commit()
+
+    logger.info(f"Archived {len(archived_ids)} questions from {key} to {path}")
+    return len(archived_ids)
+
+
+def hot_months(session) -> Dict[str, int]:
+    """Row count per month still in the database"""
+    oldest = session.query(Question.created_at).order_by(Question.created_at).limit(1).scalar()
+    if oldest is None:
+        return {}
+    counts = {}
+    start = datetime(oldest.year, oldest.month, 1)
+    now = datetime.utcnow()
+    while start <= now:
+        end = next_month(start)
+        count = session.query(Question).filter(Question.created_at >= start, Question.created_at < end).count()
+        if count:
+            counts[month_key(start)] = count
+        start = end
+    return counts
+
+
+def run_retention(session, keep_months: int = QUESTION_RETENTION_MONTHS, dry_run: bool = False,
+                  directory: str = QUESTION_ARCHIVE_DIR) -> Dict[str, int]:
+    """Archive every month older than the retention window; returns rows moved per month"""
+    if not dry_run:
+        require_pyarrow()
+    cutoff = retention_cutoff(keep_months)
+    moved = {}
+    for key, count in hot_months(session).items():
+        if month_start(key) >= cutoff:
+            continue
+        if dry_run:
+            logger.info(f"Would archive {count} questions from {key}")
+            moved[key] = count
+        else:
+            moved[key] = archive_month(session, key, directory)
+    return moved
+
+
+def archive_summary(directory: str = QUESTION_ARCHIVE_DIR) -> Dict[str, Any]:
+    """Archived rows and bytes per month, read from Parquet footers only"""
+    months = {}
+    if pa is None or not os.path.isdir(directory):
+        return {'months': months, 'rows': 0, 'bytes': 0}
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith('month='):
+            continue
+        rows = size = 0
+        partition_dir = os.path.join(directory, name)
+        for part in os.listdir(partition_dir):
+            if part.endswith('.parquet'):
+                path = os.path.join(partition_dir, part)
+                rows += pq.ParquetFile(path).metadata.num_rows
+                size += os.path.getsize(path)
+        months[name[len('month='):]] = {'rows': rows, 'bytes': size}
+    return {
+        'months': months,
+        'rows': sum(m['rows'] for m in months.values()),
+        'bytes': sum(m['bytes'] for m in months.values()),
+    }
+
+
+def load_archive(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 columns: Optional[List[str]] = None, directory: str = QUESTION_ARCHIVE_DIR):
+    """Archived questions in [since, until) as a pyarrow Table, reading only the months involved"""
+    require_pyarrow()
+    if not os.path.isdir(directory):
+        return ARCHIVE_SCHEMA.empty_table().select(columns or ARCHIVE_COLUMNS)
+
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith('month='):
+            continue
+        start = month_start(name[len('month='):])
+        if (since and next_month(start) <= since) or (until and start >= until):
+            continue
+        partition_dir = os.path.join(directory, name)
+        paths.extend(os.path.join(partition_dir, p) for p in sorted(os.listdir(partition_dir)) if p.endswith('.parquet'))
+    if not paths:
+        return ARCHIVE_SCHEMA.empty_table().select(columns or ARCHIVE_COLUMNS)
+
+    condition = None
+    if since:
+        condition = ds.field('created_at') >= pa.scalar(since, pa.timestamp('us'))
+    if until:
+        upper = ds.field('created_at') < pa.scalar(until, pa.timestamp('us'))
+        condition = upper if condition is None else condition & upper
+    table = ds.dataset(paths, schema=ARCHIVE_SCHEMA, format='parquet').to_table(
+        columns=columns or ARCHIVE_COLUMNS, filter=condition
+    )
+    return table
+
+
+def query_questions(session, limit: int = 50, offset: int = 0, since: Optional[datetime] = None,
+                    until: Optional[datetime] = None, include_archive: bool = True,
+                    directory: str = QUESTION_ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    """Newest-first page of questions: hot rows from the database, older ones from the archive
+
+    Archived months are all older than the hot rows, so the archive is only read when the
+    page runs past the end of the database.
+    """
+    query = session.query(Question)
+    if since:
+        query = query.filter(Question.created_at >= since)
+    if until:
+        query = query.filter(Question.created_at < until)
+    rows = [question_row(q) for q in query.order_by(Question.created_at.desc()).offset(offset).limit(limit).all()]
+    if len(rows) >= limit or not include_archive or pa is None or not os.path.isdir(directory):
+        return rows
+
+    # The database is exhausted; continue month by month through the archive, newest first,
+    # skipping the part of the offset not already used up by database rows
+    skip = max(0, offset - query.count())
+    months = sorted((name[len('month='):] for name in os.listdir(directory) if name.startswith('month=')), reverse=True)
+    for key in months:
+        start = month_start(key)
+        if (until and start >= until) or (since and next_month(start) <= since):
+            continue
+        lower = max(since, start) if since else start
+        upper = min(until, next_month(start)) if until else next_month(start)
+        table = load_archive(lower, upper, directory=directory)
+        # Rows left in the database by an interrupted archive run were counted there already
+        hot_ids = [row_id for (row_id,) in session.query(Question.id).filter(
+            Question.created_at >= lower, Question.created_at < upper)]
+        if hot_ids:
+            table = table.filter(pc.invert(pc.is_in(table['id'], value_set=pa.array(hot_ids, table.schema.field('id').type))))
+        if skip >= table.num_rows:
+            skip -= table.num_rows
+            continue
+        table = table.sort_by([('created_at', 'descending')]).slice(skip, limit - len(rows))
+        skip = 0
+        for row in table.to_pylist():
+            row['links_provided'] = json.loads(row['links_provided']) if row['links_provided'] else None
+            rows.append(row)
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Archive and inspect the partitioned question log')
+    parser.add_argument('--archive-dir', default=QUESTION_ARCHIVE_DIR, help='Archive directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    archive_parser = subparsers.add_parser('archive', help='Move months past the retention window to Parquet')
+    archive_parser.add_argument('--keep-months', type=int, default=QUESTION_RETENTION_MONTHS,
+                                help='Months kept in the database, counting the current one')
+    archive_parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+    subparsers.add_parser('partitions', help='Row counts of hot and archived months')
+
+    args = parser.parse_args()
+
+    from app import app
+    from database import db
+
+    started = time.time()
+    try:
+        with app.app_context():
+            if args.command == 'archive':
+                moved = run_retention(db.session, args.keep_months, args.dry_run, args.archive_dir)
+                logger.info(f"{'Would archive' if args.dry_run else 'Archived'} {sum(moved.values())} questions "
+                            f"from {len(moved)} months in {time.time() - started:.1f} seconds")
+            elif args.command == 'partitions':
+                for key, count in hot_months(db.session).items():
+                    print(f"{key}  hot      {count} rows")
+                for key, info in archive_summary(args.archive_dir)['months'].items():
+                    print(f"{key}  archived {info['rows']} rows, {info['bytes']} bytes")
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os
+import math
+import time
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Token bucket per client IP: sustained requests per second and burst size
+RATE_LIMIT_RATE = float(os.environ.get("RATE_LIMIT_RATE", "0.5"))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", "10"))
+# Clients presenting one of these X-API-Key values get their own, larger bucket
+API_KEYS = {key.strip() for key in os.environ.get("API_KEYS", "").split(",") if key.strip()}
+API_KEY_RATE_LIMIT_RATE = float(os.environ.get("API_KEY_RATE_LIMIT_RATE", "5"))
+API_KEY_RATE_LIMIT_BURST = float(os.environ.get("API_KEY_RATE_LIMIT_BURST", "100"))
+# SQLite file shared by every worker process on the host
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "./rate_limit.sqlite3")
+
+# Load shedding: requests in flight across all workers, and time spent queued in front of them
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", "32"))
+MAX_QUEUE_WAIT = float(os.environ.get("MAX_QUEUE_WAIT", "5"))
+
+# Buckets idle this long are full again and can be deleted
+BUCKET_IDLE_SECONDS = 3600
+
+class SharedStore:
+    """Token buckets and per-process in-flight counts in a SQLite file shared across workers"""
+
+    def __init__(self, path: str = RATE_LIMIT_STORE):
+        self.path = path
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS in_flight (pid INTEGER PRIMARY KEY, requests INTEGER)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Refill and take `cost` tokens from a bucket; returns (allowed, seconds until enough tokens)
+        
+        A cost above `burst` is admitted once the bucket is full and leaves it in debt, so the
+        client waits for the whole cost to refill before its next request.
+        """
+        # Tokens that must be in the bucket before the request is admitted
+        needed = min(cost, burst)
+        now = time.time()
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so the read-refill-write is atomic across workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= needed
+            if allowed:
+                tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if now - self._last_cleanup > BUCKET_IDLE_SECONDS:
+            self._last_cleanup = now
+            conn.execute("DELETE FROM buckets WHERE updated < ?", (now - BUCKET_IDLE_SECONDS,))
+        return allowed, 0.0 if allowed else (needed - tokens) / rate
+
+    def set_in_flight(self, requests: int):
+        """Publish this process's in-flight request count"""
+        self._connection().execute(
+            "INSERT OR REPLACE INTO in_flight (pid, requests) VALUES (?, ?)", (os.getpid(), requests)
+        )
+
+    def total_in_flight(self) -> int:
+        """In-flight requests summed over live worker processes"""
+        conn = self._connection()
+        total = 0
+        for pid, requests in conn.execute("SELECT pid, requests FROM in_flight").fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                # Worker exited (or was killed mid-request); drop its stale count
+                conn.execute("DELETE FROM in_flight WHERE pid = ?", (pid,))
+                continue
+            except PermissionError:
+                pass
+            total += requests
+        return total
+
+class AdmissionController:
+    """Per-client token-bucket rate limiting plus queue-depth load shedding"""
+
+    def __init__(self, store: Optional[SharedStore] = None):
+        self.store = store or SharedStore()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # Smoothed request duration, used to suggest Retry-After when shedding
+        self._avg_seconds = 5.0
+        self._counts = defaultdict(int)
+
+    def client_key(self, remote_addr: Optional[str], api_key: Optional[str]) -> Tuple[str, float, float]:
+        """Bucket key and limits for a client; unknown API keys fall back to the IP bucket"""
+        if api_key and api_key in API_KEYS:
+            return f"key:{api_key}", API_KEY_RATE_LIMIT_RATE, API_KEY_RATE_LIMIT_BURST
+        return f"ip:{remote_addr or 'unknown'}", RATE_LIMIT_RATE, RATE_LIMIT_BURST
+
+    def queue_wait(self, request_start: Optional[str]) -> Optional[float]:
+        """Seconds since a proxy's X-Request-Start (t=<epoch s|ms|us>) header, if present"""
+        if not request_start:
+            return None
+        try:
+            value = float(request_start.replace('t=', '').strip())
+        except ValueError:
+            return None
+        # Scale ms/us timestamps down to seconds by magnitude
+        while value > 1e11:
+            value /= 1000.0
+        return max(0.0, time.time() - value)
+
+    def admit(self, remote_addr: Optional[str], api_key: Optional[str], request_start: Optional[str] = None,
+              cost: float = 1.0) -> Optional[Dict[str, Any]]:
+        """None if the request may proceed, otherwise a rejection with reason and retry_after seconds"""
+        try:
+            wait = self.queue_wait(request_start)
+            if wait is not None and wait > MAX_QUEUE_WAIT:
+                return self._reject('shed_queue_wait', self._avg_seconds)
+
+            in_flight = self.store.total_in_flight()
+            if in_flight >= MAX_IN_FLIGHT:
+                excess = in_flight - MAX_IN_FLIGHT + 1
+                return self._reject('shed_in_flight', self._avg_seconds * excess / max(1, MAX_IN_FLIGHT))
+
+            key, rate, burst = self.client_key(remote_addr, api_key)
+            allowed, retry_after = self.store.take(key, rate, burst, cost)
+            if not allowed:
+                return self._reject('rate_limited', retry_after)
+        except sqlite3.Error as e:
+            # Fail open: a broken limiter store must not take the API down
+            logger.error(f"Rate limiter store error: {e}")
+
+        with self._lock:
+            self._counts['admitted'] += 1
+            self._in_flight += 1
+            in_flight = self._in_flight
+        self._publish(in_flight)
+        return None
+
+    def release(self, elapsed: float):
+        """Mark an admitted request finished"""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * elapsed
+            in_flight = self._in_flight
+        self._publish(in_flight)
+
+    def _publish(self, in_flight: int):
+        try:
+            self.store.set_in_flight(in_flight)
+        except sqlite3.Error as e:
+            logger.error(f"Rate limiter store error: {e}")
+
+    def _reject(self, reason: str, retry_after: float) -> Dict[str, Any]:
+        with self._lock:
+            self._counts[reason] += 1
+        return {'reason': reason, 'retry_after': max(1, math.ceil(retry_after))}
+
+    def stats(self) -> Dict[str, Any]:
+        """This worker's admission counters"""
+        with self._lock:
+            return {
+                'enabled': RATE_LIMIT_ENABLED,
+                'in_flight': self._in_flight,
+                'max_in_flight': MAX_IN_FLIGHT,
+                'avg_request_seconds': round(self._avg_seconds, 3),
+                **dict(self._counts)
+            }
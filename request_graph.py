@@ -0,0 +1,217 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Any, List, Optional, Iterable
+import numpy as np
+from openai_client import LatencyBudget
+
+logger = logging.getLogger(__name__)
+
+# Workers shared by the stages of all in-flight requests
+REQUEST_GRAPH_WORKERS = int(os.environ.get("REQUEST_GRAPH_WORKERS", "32"))
+# Per-stage deadlines in seconds from the start of the request ("stage=seconds,..."); a consumer
+# stops waiting for a stage at its deadline. Stages without one are bounded by the request budget.
+STAGE_DEADLINES = {
+    name.strip(): float(seconds)
+    for name, seconds in (item.split('=', 1) for item in
+                          os.environ.get("STAGE_DEADLINES", "lexical=0.25").split(',') if '=' in item)
+}
+# Extra wait past the request budget, so a stage that itself stops at the budget can still hand
+# over its (fallback) result instead of being reported as timed out
+BUDGET_GRACE = float(os.environ.get("STAGE_BUDGET_GRACE", "0.5"))
+
+# Stage duration samples kept per stage for percentiles
+STAGE_WINDOW = 1000
+
+_NO_DEFAULT = object()
+
+class StageTimeout(Exception):
+    """A stage's result was not ready by its deadline"""
+
+class Stage:
+    """One unit of work in a request graph"""
+
+    def __init__(self, name: str, deps: List[str], deadline: Optional[float]):
+        self.name = name
+        self.deps = deps
+        self.deadline = deadline
+        self.future = Future()
+        self.status = 'pending'
+        self.started = None
+        self.finished = None
+        # Stages whose results this one consumed, hard dependencies or not
+        self.inputs = set(deps)
+
+_current_stage = threading.local()
+
+class RequestGraph:
+    """Stages of one request, each started on the shared executor as soon as its dependencies finish
+
+    Independent stages overlap, so a request takes about as long as its slowest chain of
+    dependent stages (the critical path) instead of the sum of all of them.
+    """
+
+    def __init__(self, budget: Optional[LatencyBudget] = None, executor: Optional[ThreadPoolExecutor] = None):
+        self.budget = budget
+        self.executor = executor or stage_executor
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, fn: Callable[[], Any], deps: Iterable[str] = (),
+            deadline: Optional[float] = None) -> 'RequestGraph':
+        """Register a stage; fn runs once every stage in deps has finished (successfully or not)"""
+        stage = Stage(name, list(deps), deadline if deadline is not None else STAGE_DEADLINES.get(name))
+        self.stages[name] = stage
+        # Each stage runs in its own copy of the caller's context (request id for logging)
+        context = contextvars.copy_context()
+
+        def run():
+            _current_stage.name = name
+            stage.started = time.perf_counter()
+            if stage.status == 'pending':
+                stage.status = 'running'
+            try:
+                result = fn()
+            except BaseException as e:
+                stage.finished = time.perf_counter()
+                stage.status = 'timed_out' if stage.status == 'timed_out' else 'failed'
+                stage.future.set_exception(e)
+            else:
+                stage.finished = time.perf_counter()
+                # A stage that finished after its consumers gave up on it stays timed out
+                stage.status = 'timed_out' if stage.status == 'timed_out' else 'done'
+                stage.future.set_result(result)
+            finally:
+                _current_stage.name = None
+
+        remaining = [len(stage.deps)]
+
+        def dependency_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                self.executor.submit(context.run, run)
+
+        if not stage.deps:
+            self.executor.submit(context.run, run)
+        for dep in stage.deps:
+            self.stages[dep].future.add_done_callback(dependency_done)
+        return self
+
+    def result(self, name: str, default: Any = _NO_DEFAULT) -> Any:
+        """Wait for a stage, up to its deadline and the request budget
+
+        With a default, a missed deadline or a failed stage returns the default instead of raising.
+        """
+        stage = self.stages[name]
+        consumer = getattr(_current_stage, 'name', None)
+        if consumer is not None and consumer in self.stages:
+            self.stages[consumer].inputs.add(name)
+
+        limits = []
+        if stage.deadline is not None:
+            limits.append(max(0.0, stage.deadline - (time.perf_counter() - self.started)))
+        if self.budget is not None:
+            limits.append(self.budget.remaining() + BUDGET_GRACE)
+        try:
+            return stage.future.result(timeout=min(limits) if limits else None)
+        except FutureTimeout:
+            if stage.status in ('pending', 'running'):
+                stage.status = 'timed_out'
+            # Its result was not used, so it cannot be on the consumer's critical path
+            if consumer is not None and consumer in self.stages and name not in self.stages[consumer].deps:
+                self.stages[consumer].inputs.discard(name)
+            if default is not _NO_DEFAULT:
+                logger.warning(f"Stage {name} missed its deadline; continuing without it")
+                return default
+            raise StageTimeout(f"Stage {name} not ready in time")
+        except Exception:
+            if default is not _NO_DEFAULT:
+                return default
+            raise
+
+    def critical_path(self, sink: str) -> List[str]:
+        """Chain of stages that determined when sink finished: at each step, the input that finished last"""
+        path = [sink]
+        stage = self.stages[sink]
+        while True:
+            finished = [self.stages[name] for name in stage.inputs
+                        if name in self.stages and name not in path and self.stages[name].finished is not None
+                        and (stage.finished is None or self.stages[name].finished <= stage.finished)]
+            if not finished:
+                break
+            stage = max(finished, key=lambda s: s.finished)
+            path.append(stage.name)
+        return path[::-1]
+
+    def timings(self, sink: str) -> Dict[str, Any]:
+        """Start/end offsets and durations per stage (ms from request start) plus the critical path"""
+        def offset(t: Optional[float]) -> Optional[float]:
+            return round((t - self.started) * 1000, 1) if t is not None else None
+
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = {
+                'status': stage.status,
+                'start_ms': offset(stage.started),
+                'end_ms': offset(stage.finished),
+                'ms': round((stage.finished - stage.started) * 1000, 1) if stage.finished and stage.started else None,
+            }
+        return {
+            'stages': stages,
+            'critical_path': self.critical_path(sink),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+    def server_timing(self, timings: Dict[str, Any]) -> str:
+        """Server-Timing header value: one entry per finished stage, the critical path and the total"""
+        entries = [f"{name};dur={info['ms']}" for name, info in timings['stages'].items() if info['ms'] is not None]
+        entries.append(f'critical;desc="{">".join(timings["critical_path"])}"')
+        entries.append(f"total;dur={timings['total_ms']}")
+        return ', '.join(entries)
+
+class StageStats:
+    """Per-stage duration percentiles, missed deadlines and how often each stage is on the critical path"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._counts = {}
+        self.requests = 0
+
+    def record(self, timings: Dict[str, Any]):
+        critical = set(timings['critical_path'])
+        with self._lock:
+            self.requests += 1
+            for name, info in timings['stages'].items():
+                if name not in self._counts:
+                    self._durations[name] = deque(maxlen=STAGE_WINDOW)
+                    self._counts[name] = {'runs': 0, 'timed_out': 0, 'failed': 0, 'critical': 0}
+                counts = self._counts[name]
+                counts['runs'] += 1
+                counts['critical'] += int(name in critical)
+                if info['status'] in ('timed_out', 'failed'):
+                    counts[info['status']] += 1
+                if info['ms'] is not None:
+                    self._durations[name].append(info['ms'])
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            report = {'requests': self.requests, 'stages': {}}
+            for name, counts in self._counts.items():
+                durations = np.array(self._durations[name]) if self._durations[name] else np.zeros(1)
+                report['stages'][name] = {
+                    **counts,
+                    'p50_ms': round(float(np.percentile(durations, 50)), 1),
+                    'p95_ms': round(float(np.percentile(durations, 95)), 1),
+                }
+            return report
+
+stage_executor = ThreadPoolExecutor(max_workers=REQUEST_GRAPH_WORKERS, thread_name_prefix="stage")
+stage_stats = StageStats()
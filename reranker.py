@@ -0,0 +1,124 @@
+import os
+import re
+import time
+import logging
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Candidates fetched from the vector index before reranking, and the CPU budget for scoring them
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "50"))
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "25"))
+RECENCY_HALF_LIFE_DAYS = float(os.environ.get("RERANK_RECENCY_HALF_LIFE_DAYS", "120"))
+
+# Feature weights: embedding similarity, lexical overlap, recency, course content, accepted answer
+DEFAULT_WEIGHTS = {
+    'similarity': 1.0,
+    'lexical': 0.6,
+    'recency': 0.15,
+    'course_content': 0.1,
+    'accepted_answer': 0.2,
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9_.+-]*")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from how i if in is it me my no not of on or should so
+that the this to use was we what when where which who why will with would you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def _age_days(created_at: str, now: datetime) -> float:
+    """Age of an ISO timestamp in days, NaN when missing or unparseable"""
+    if not created_at:
+        return np.nan
+    try:
+        dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    except ValueError:
+        return np.nan
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return max(0.0, (now - dt).total_seconds() / 86400.0)
+
+class Reranker:
+    """Feature-based CPU reranker for over-fetched vector search candidates"""
+
+    def __init__(self, weights: Dict[str, float] = None, budget_ms: float = RERANK_BUDGET_MS):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.budget_ms = budget_ms
+
+    def features(self, query: str, candidates: List[Dict[str, Any]], deadline: float) -> np.ndarray:
+        """Feature matrix (candidates x features); raises TimeoutError past the deadline"""
+        n = len(candidates)
+        metadatas = [c.get('metadata') or {} for c in candidates]
+
+        # Embedding similarity: Chroma returns squared L2 on unit vectors, i.e. 2 - 2cos
+        distances = np.array([c.get('distance', 2.0) for c in candidates], dtype=np.float32)
+        similarity = 1.0 - distances / 2.0
+
+        # Lexical overlap: IDF-weighted fraction of query terms present in each candidate
+        query_terms = sorted(set(tokenize(query)))
+        presence = np.zeros((n, len(query_terms)), dtype=np.float32)
+        if query_terms:
+            term_index = {term: j for j, term in enumerate(query_terms)}
+            for i, candidate in enumerate(candidates):
+                for term in term_index.keys() & set(tokenize(candidate['content'])):
+                    presence[i, term_index[term]] = 1.0
+                if time.perf_counter() > deadline:
+                    raise TimeoutError("Rerank budget exceeded during tokenization")
+            idf = np.log1p(n / (1.0 + presence.sum(axis=0)))
+            lexical = presence @ idf / max(idf.sum(), 1e-9)
+        else:
+            lexical = np.zeros(n, dtype=np.float32)
+
+        # Recency: exponential decay on created_at; undated content (handbook) is neutral
+        now = datetime.now(timezone.utc)
+        ages = np.array([_age_days(m.get('created_at', ''), now) for m in metadatas], dtype=np.float64)
+        recency = np.where(np.isnan(ages), 0.5, np.exp2(-np.nan_to_num(ages) / RECENCY_HALF_LIFE_DAYS))
+
+        course_content = np.array([m.get('type') == 'course_content' for m in metadatas], dtype=np.float32)
+        accepted = np.array([bool(m.get('accepted_answer')) for m in metadatas], dtype=np.float32)
+
+        return np.column_stack([similarity, lexical, recency, course_content, accepted]).astype(np.float32)
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]], top_k: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Score candidates in one vectorized pass and keep the best top_k"""
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000.0
+        info = {'candidates': len(candidates), 'budget_exceeded': False}
+
+        if len(candidates) <= 1:
+            info['rerank_ms'] = 0.0
+            return candidates[:top_k], info
+
+        try:
+            features = self.features(query, candidates, deadline)
+        except TimeoutError:
+            # Out of CPU budget: keep the vector index's own ordering
+            info['budget_exceeded'] = True
+            info['rerank_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            logger.warning(f"Rerank budget of {self.budget_ms}ms exceeded, using distance order")
+            return candidates[:top_k], info
+
+        weights = np.array([
+            self.weights['similarity'],
+            self.weights['lexical'],
+            self.weights['recency'],
+            self.weights['course_content'],
+            self.weights['accepted_answer'],
+        ], dtype=np.float32)
+        scores = features @ weights
+
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        reranked = []
+        for i in order:
+            result = dict(candidates[i])
+            result['rerank_score'] = float(scores[i])
+            reranked.append(result)
+
+        info['rerank_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return reranked, info
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Source-sharded retrieval indexes
+
+Course content and Discourse posts are split into separate ChromaDB collections, one
+per source (Discourse by course term, or by year), each named
+tds_knowledge_base__<shard>. Shards are built from the main collection by copying the
+stored embeddings, so nothing is re-embedded, and each shard can be rebuilt on its own.
+Queries fan out to the shards in parallel; per-shard results are merged on normalized
+scores, with per-shard quotas so course content is not crowded out by forum threads.
+
+Usage:
+    python shards.py build --chroma-path ./chroma_db
+    python shards.py build --shard discourse_2025_jan
+    python shards.py list
+    python shards.py drop discourse_2024_sep
+
+Author: TDS Virtual TA
+License: MIT
+"""
+
+import argparse
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+
+from local_index import LocalIndexHolder, parse_timestamp, LOAD_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "tds_knowledge_base"
+SHARD_PREFIX = f"{COLLECTION_NAME}__"
+
+# Search the per-source shards when they exist (built with `python shards.py build`)
+SHARDED_RETRIEVAL = os.environ.get("SHARDED_RETRIEVAL", "true").lower() == "true"
+# Discourse shard granularity: "term" (Jan/May/Sep terms) or "year"
+SHARD_DISCOURSE_BY = os.environ.get("SHARD_DISCOURSE_BY", "term").lower()
+# Result slots reserved per shard ("shard_or_prefix=count,..."); discourse matches every discourse_* shard
+SHARD_QUOTAS = os.environ.get("SHARD_QUOTAS", "course=2")
+# Quota slots only go to results whose similarity is within this margin of the best result
+SHARD_QUOTA_MARGIN = float(os.environ.get("SHARD_QUOTA_MARGIN", "0.15"))
+SHARD_MAX_WORKERS = int(os.environ.get("SHARD_MAX_WORKERS", "8"))
+# How often the set of shard collections is re-read, so rebuilt shards are picked up
+SHARD_REFRESH_SECONDS = float(os.environ.get("SHARD_REFRESH_SECONDS", "30"))
+
+# Per-shard latency samples kept for percentiles
+SHARD_LATENCY_WINDOW = 1000
+
+# Course terms start in January, May and September
+TERMS = ((1, 'jan'), (5, 'may'), (9, 'sep'))
+
+
+def term_of(created_at: str) -> Optional[str]:
+    """Shard suffix for a Discourse post date: "2025_jan" by term, "2025" by year, None if undated"""
+    timestamp = parse_timestamp(created_at)
+    if np.isnan(timestamp):
+        return None
+    dt = datetime.fromtimestamp(timestamp, timezone.utc)
+    if SHARD_DISCOURSE_BY == 'year':
+        return str(dt.year)
+    term = [name for month, name in TERMS if dt.month >= month][-1]
+    return f"{dt.year}_{term}"
+
+
+def term_range(suffix: str) -> Dict[str, float]:
+    """created_at bounds (epoch seconds) covered by a Discourse shard suffix"""
+    parts = suffix.split('_')
+    year = int(parts[0])
+    if len(parts) == 1:
+        start, end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    else:
+        months = [month for month, _ in TERMS]
+        index = [name for _, name in TERMS].index(parts[1])
+        start = datetime(year, months[index], 1)
+        end = datetime(year, months[index + 1], 1) if index + 1 < len(months) else datetime(year + 1, 1, 1)
+    return {'date_from': start.replace(tzinfo=timezone.utc).timestamp(),
+            'date_to': end.replace(tzinfo=timezone.utc).timestamp()}
+
+
+def shard_for(metadata: Dict[str, Any]) -> str:
+    """Shard a document belongs to, from its type and created_at"""
+    if metadata.get('type') == 'course_content':
+        return 'course'
+    if metadata.get('type') == 'discourse_post':
+        term = term_of(metadata.get('created_at', ''))
+        return f"discourse_{term}" if term else 'discourse_undated'
+    return metadata.get('type') or 'other'
+
+
+def shard_metadata(name: str, base_metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Collection metadata for a shard: the embedder of the main collection plus what the shard covers"""
+    metadata = {key: value for key, value in (base_metadata or {}).items() if key.startswith('embedding_')}
+    metadata['shard'] = name
+    if name == 'course':
+        metadata['doc_type'] = 'course_content'
+    elif name.startswith('discourse_'):
+        metadata['doc_type'] = 'discourse_post'
+        suffix = name[len('discourse_'):]
+        if suffix != 'undated':
+            metadata.update(term_range(suffix))
+    return metadata
+
+
+def parse_quotas(spec: str) -> Dict[str, int]:
+    quotas = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, count = item.split('=', 1)
+            quotas[name.strip()] = int(count)
+    return quotas
+
+
+def quota_key(shard: str, quotas: Dict[str, int]) -> Optional[str]:
+    """The quota entry covering a shard: its exact name, else its source prefix"""
+    if shard in quotas:
+        return shard
+    prefix = shard.split('_')[0]
+    return prefix if prefix in quotas else None
+
+
+def apply_quotas(results: List[Dict[str, Any]], n_results: int, quotas: Dict[str, int],
+                 margin: float = SHARD_QUOTA_MARGIN) -> List[Dict[str, Any]]:
+    """Top n_results of a ranked list, reserving quota slots for shards with close-enough results
+
+    Results keep their relative order; reserved results displace the lowest-ranked others.
+    """
+    if not results or not quotas:
+        return results[:n_results]
+    best = max(1.0 - r['distance'] / 2.0 for r in results)
+    reserved, used = [], {}
+    for i, result in enumerate(results):
+        key = quota_key(result.get('shard', ''), quotas)
+        if key is None or used.get(key, 0) >= quotas[key]:
+            continue
+        if 1.0 - result['distance'] / 2.0 >= best - margin:
+            reserved.append(i)
+            used[key] = used.get(key, 0) + 1
+    reserved = set(reserved[:n_results])
+    chosen = set(reserved)
+    for i in range(len(results)):
+        if len(chosen) >= n_results:
+            break
+        chosen.add(i)
+    return [results[i] for i in sorted(chosen)]
+
+
+class Shard:
+    """One source shard: its collection, an in-memory index over it, and what it covers"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.metadata = collection.metadata or {}
+        self.name = self.metadata.get('shard', collection.name[len(SHARD_PREFIX):])
+        self.local_index = LocalIndexHolder(collection)
+        # Document count, re-read on shard refresh and upsert rather than on every query
+        self.count = collection.count()
+
+    def matches(self, filters: Optional[Dict[str, Any]]) -> bool:
+        """False when the filters rule out every document in the shard, so it need not be searched"""
+        if not filters:
+            return True
+        doc_type = self.metadata.get('doc_type')
+        if filters.get('type') and doc_type and doc_type not in filters['type']:
+            return False
+        if 'date_from' in self.metadata:
+            if filters.get('date_from', -np.inf) >= self.metadata['date_to']:
+                return False
+            if filters.get('date_to', np.inf) < self.metadata['date_from']:
+                return False
+        return True
+
+
+class ShardLatencyStats:
+    """Per-shard query latency, pruning and timeouts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._counts = {}
+
+    def record(self, shard: str, event: str, seconds: Optional[float] = None):
+        with self._lock:
+            if shard not in self._counts:
+                self._latencies[shard] = deque(maxlen=SHARD_LATENCY_WINDOW)
+                self._counts[shard] = {'queries': 0, 'pruned': 0, 'empty': 0, 'timeouts': 0, 'errors': 0}
+            self._counts[shard][event] += 1
+            if seconds is not None:
+                self._latencies[shard].append(seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            report = {}
+            for shard, counts in self._counts.items():
+                latencies = np.array(self._latencies[shard]) if self._latencies[shard] else np.zeros(1)
+                report[shard] = {
+                    **counts,
+                    'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+                    'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+                }
+            return report
+
+
+class ShardSet:
+    """The shard collections of a ChromaDB client, searched in parallel"""
+
+    def __init__(self, client, embedder, base_metadata: Optional[Dict[str, Any]] = None):
+        self.client = client
+        self.embedder = embedder
+        self.base_metadata = base_metadata or {}
+        self.quotas = parse_quotas(SHARD_QUOTAS)
+        self.latency = ShardLatencyStats()
+        self.executor = ThreadPoolExecutor(max_workers=SHARD_MAX_WORKERS, thread_name_prefix="shard")
+        self._shards = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        shards = {}
+        for collection in self.client.list_collections():
+            if not collection.name.startswith(SHARD_PREFIX) or collection.name.endswith('__building'):
+                continue
+            backend = (collection.metadata or {}).get('embedding_backend', 'openai')
+            model = (collection.metadata or {}).get('embedding_model', self.embedder.model)
+            if f"{backend}:{model}" != self.embedder.name:
+                logger.error(f"Ignoring shard {collection.name}: embedded with {backend}:{model}, "
+                             f"queries use {self.embedder.name}")
+                continue
+            existing = self._shards.get(collection.name)
+            if existing and existing.collection.id == collection.id:
+                existing.count = existing.collection.count()
+                shards[collection.name] = existing
+            else:
+                shards[collection.name] = Shard(collection)
+        if set(shards) != set(self._shards):
+            logger.info(f"Serving {len(shards)} retrieval shards: {', '.join(sorted(s.name for s in shards.values()))}")
+        self._shards = shards
+        self._loaded_at = time.time()
+
+    def shards(self) -> List[Shard]:
+        """Current shards, re-read from ChromaDB every SHARD_REFRESH_SECONDS"""
+        if time.time() - self._loaded_at > SHARD_REFRESH_SECONDS:
+            with self._lock:
+                if time.time() - self._loaded_at > SHARD_REFRESH_SECONDS:
+                    try:
+                        self._refresh()
+                    except Exception as e:
+                        logger.error(f"Error listing retrieval shards: {e}")
+                        self._loaded_at = time.time()
+        return list(self._shards.values())
+
+    @property
+    def enabled(self) -> bool:
+        return SHARDED_RETRIEVAL and bool(self.shards())
+
+    def search(self, query_fn: Callable[[Shard], Dict[str, Any]], filters: Optional[Dict[str, Any]],
+               n_candidates: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Query every shard the filters allow in parallel and merge on normalized scores
+
+        query_fn(shard) returns a ChromaDB-shaped result for one shard. Each candidate's
+        similarity is z-scored against its own shard's candidates, so shards of different size
+        and density compete fairly; each quota shard's best candidates are always kept. Shards
+        still running at the timeout are left out.
+        """
+        eligible = []
+        for shard in self.shards():
+            if not shard.matches(filters):
+                self.latency.record(shard.name, 'pruned')
+            elif shard.count == 0:
+                # Nothing to find, and ChromaDB rejects a query for n_results=0
+                self.latency.record(shard.name, 'empty')
+            else:
+                eligible.append(shard)
+
+        def timed(shard: Shard) -> Dict[str, Any]:
+            started = time.perf_counter()
+            results = query_fn(shard)
+            self.latency.record(shard.name, 'queries', time.perf_counter() - started)
+            return results
+
+        # Workers run in a copy of the caller's context so their log lines keep the request id
+        futures = {self.executor.submit(contextvars.copy_context().run, timed, shard): shard for shard in eligible}
+        done, not_done = wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+            self.latency.record(futures[future].name, 'timeouts')
+
+        candidates, guaranteed = [], []
+        for future in done:
+            shard = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.error(f"Error searching shard {shard.name}: {e}")
+                self.latency.record(shard.name, 'errors')
+                continue
+            distances = np.asarray(results['distances'][0], dtype=np.float64)
+            if not len(distances):
+                continue
+            similarities = 1.0 - distances / 2.0
+            scores = (similarities - similarities.mean()) / max(float(similarities.std()), 0.02)
+            key = quota_key(shard.name, self.quotas)
+            for i in range(len(distances)):
+                candidate = (float(scores[i]), shard.name, results['ids'][0][i], results['documents'][0][i],
+                             results['metadatas'][0][i], float(distances[i]))
+                if key is not None and i < self.quotas[key]:
+                    guaranteed.append(candidate)
+                else:
+                    candidates.append(candidate)
+
+        candidates.sort(key=lambda c: -c[0])
+        merged = guaranteed + candidates[:max(0, n_candidates - len(guaranteed))]
+        merged.sort(key=lambda c: -c[0])
+        return {
+            'ids': [[c[2] for c in merged]],
+            'documents': [[c[3] for c in merged]],
+            'metadatas': [[c[4] for c in merged]],
+            'distances': [[c[5] for c in merged]],
+            'shards': [[c[1] for c in merged]],
+            'shard_scores': [[round(c[0], 4) for c in merged]],
+        }
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]],
+               embeddings: List[List[float]]):
+        """Route newly indexed documents to their shards, creating shards for new terms"""
+        groups = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(shard_for(metadata), []).append(i)
+        for name, positions in groups.items():
+            collection = self.client.get_or_create_collection(
+                name=f"{SHARD_PREFIX}{name}", metadata=shard_metadata(name, self.base_metadata)
+            )
+            collection.upsert(
+                ids=[ids[i] for i in positions],
+                documents=[documents[i] for i in positions],
+                metadatas=[metadatas[i] for i in positions],
+                embeddings=[embeddings[i] for i in positions]
+            )
+            shard = self._shards.get(collection.name)
+            if shard is not None:
+                shard.count = collection.count()
+                shard.local_index.invalidate()
+        # Pick up shards created just now on the next search
+        self._loaded_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        shards = self.shards()
+        latency = self.latency.snapshot()
+        return {
+            'enabled': SHARDED_RETRIEVAL and bool(shards),
+            'quotas': self.quotas,
+            'shards': {shard.name: {'documents': shard.collection.count(), **latency.get(shard.name, {})}
+                       for shard in sorted(shards, key=lambda s: s.name)},
+        }
+
+
+def build_shards(client, only: Optional[List[str]] = None) -> Dict[str, int]:
+    """(Re)build shard collections from the main collection, copying stored embeddings
+
+    With `only`, just those shards are rebuilt and the others are left untouched. Each shard
+    is written to a staging collection first and renamed into place when complete.
+    """
+    source = client.get_collection(name=COLLECTION_NAME)
+    staged = {}
+    counts = {}
+    offset = 0
+    while True:
+        page = source.get(limit=LOAD_PAGE_SIZE, offset=offset, include=['documents', 'metadatas', 'embeddings'])
+        if not page['ids']:
+            break
+        offset += len(page['ids'])
+        groups = {}
+        for i, metadata in enumerate(page['metadatas']):
+            name = shard_for(metadata)
+            if only is None or name in only:
+                groups.setdefault(name, []).append(i)
+        for name, positions in groups.items():
+            if name not in staged:
+                staging_name = f"{SHARD_PREFIX}{name}__building"
+                try:
+                    client.delete_collection(name=staging_name)
+                except Exception:
+                    pass
+                staged[name] = client.create_collection(name=staging_name,
+                                                        metadata=shard_metadata(name, source.metadata))
+            staged[name].add(
+                ids=[page['ids'][i] for i in positions],
+                documents=[page['documents'][i] for i in positions],
+                metadatas=[page['metadatas'][i] for i in positions],
+                embeddings=np.asarray(page['embeddings'])[positions].tolist()
+            )
+            counts[name] = counts.get(name, 0) + len(positions)
+
+    for name, collection in staged.items():
+        try:
+            client.delete_collection(name=f"{SHARD_PREFIX}{name}")
+        except Exception:
+            pass
+        collection.modify(name=f"{SHARD_PREFIX}{name}")
+        logger.info(f"Built shard {name} with {counts[name]} documents")
+
+    for name in sorted(set(only or []) - set(counts)):
+        logger.warning(f"No documents in the main collection belong to shard {name}")
+    return counts
+
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO)
+    import chromadb
+
+    parser = argparse.ArgumentParser(description='Build and manage source-sharded retrieval indexes')
+    parser.add_argument('--chroma-path', default='./chroma_db', help='ChromaDB directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Build shards from the main collection')
+    build_parser.add_argument('--shard', action='append', help='Only rebuild this shard (repeatable)')
+    subparsers.add_parser('list', help='List shards and their sizes')
+    drop_parser = subparsers.add_parser('drop', help='Delete a shard')
+    drop_parser.add_argument('shard')
+
+    args = parser.parse_args()
+    client = chromadb.PersistentClient(path=args.chroma_path)
+
+    try:
+        if args.command == 'build':
+            counts = build_shards(client, args.shard)
+            for name, count in sorted(counts.items()):
+                print(f"{name}: {count}")
+        elif args.command == 'list':
+            for collection in sorted(client.list_collections(), key=lambda c: c.name):
+                if collection.name.startswith(SHARD_PREFIX) and not collection.name.endswith('__building'):
+                    print(f"{collection.name[len(SHARD_PREFIX):]}: {collection.count()}")
+        elif args.command == 'drop':
+            client.delete_collection(name=f"{SHARD_PREFIX}{args.shard}")
+    except Exception as e:
+        logger.error(str(e))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Versioned snapshots of the retrieval state
+
+A snapshot is one directory holding everything search needs, built from an
+indexed ChromaDB collection without re-embedding anything:
+
+    snapshots/<version>/
+        manifest.json     format, embedder, counts, sha256 of every file
+        corpus.jsonl      id, document and metadata per line
+        embeddings.npy    unit-normalised float32 matrix, rows in corpus order
+        bm25/             BM25 inverted index (lexical_index.BM25Index)
+    snapshots/CURRENT     name of the active version
+
+Workers memory-map the active snapshot at startup and poll CURRENT, switching to a
+new version in the background without a restart. Ship a new index to replicas by
+copying the version directory and then flipping CURRENT.
+
+Usage:
+    python snapshot.py build --chroma-path /tmp/chroma_db --activate
+    python snapshot.py list
+    python snapshot.py activate 20250618-101500-1a2b3c4d
+    python snapshot.py verify 20250618-101500-1a2b3c4d
+    python snapshot.py restore 20250618-101500-1a2b3c4d --chroma-path ./chroma_db
+
+Author: TDS Virtual TA
+License: MIT
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from lexical_index import BM25Index
+from local_index import LocalIndex, LOAD_PAGE_SIZE
+from quantization import QuantizedMatrix, normalize
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "./snapshots")
+# How often workers check CURRENT for a new version
+SNAPSHOT_POLL_SECONDS = float(os.environ.get("SNAPSHOT_POLL_SECONDS", "30"))
+# Check file checksums against the manifest before switching to a snapshot
+SNAPSHOT_VERIFY = os.environ.get("SNAPSHOT_VERIFY", "true").lower() == "true"
+
+SNAPSHOT_FORMAT = 1
+CURRENT_FILE = 'CURRENT'
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_files(path: str) -> List[str]:
+    """Data files of a snapshot directory, relative to it (everything except the manifest)"""
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            relative = os.path.relpath(os.path.join(root, name), path)
+            if relative != 'manifest.json':
+                files.append(relative)
+    return sorted(files)
+
+
+def write_atomic(path: str, text: str):
+    """Write a small file so readers see either the old or the new content"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def build_snapshot(collection, root: str = SNAPSHOT_DIR) -> str:
+    """Export a ChromaDB collection into a new snapshot version; returns the version name"""
+    from embedders import embedder_for_collection
+
+    embedder = embedder_for_collection(collection.metadata)
+    os.makedirs(root, exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=root, prefix='.build-')
+    try:
+        total = collection.count()
+        embeddings = None
+        texts = []
+        offset = 0
+        with open(os.path.join(work_dir, 'corpus.jsonl'), 'w', encoding='utf-8') as corpus:
+            while offset < total:
+                page = collection.get(limit=LOAD_PAGE_SIZE, offset=offset,
+                                      include=['documents', 'metadatas', 'embeddings'])
+                if not page['ids']:
+                    break
+                vectors = normalize(np.asarray(page['embeddings'], dtype=np.float32))
+                if embeddings is None:
+                    embeddings = np.lib.format.open_memmap(os.path.join(work_dir, 'embeddings.npy'), mode='w+',
+                                                           dtype=np.float32, shape=(total, vectors.shape[1]))
+                embeddings[offset:offset + len(vectors)] = vectors
+                for doc_id, document, metadata in zip(page['ids'], page['documents'], page['metadatas']):
+                    corpus.write(json.dumps({'id': doc_id, 'document': document, 'metadata': metadata}) + '\n')
+                    texts.append(document)
+                offset += len(page['ids'])
+
+        if embeddings is None or offset != total:
+            raise ValueError(f"Collection changed or is empty while exporting ({offset}/{total} documents)")
+        dimensions = embeddings.shape[1]
+        embeddings.flush()
+        del embeddings
+
+        BM25Index.build(texts).save(os.path.join(work_dir, 'bm25'))
+
+        checksums = {name: file_sha256(os.path.join(work_dir, name)) for name in snapshot_files(work_dir)}
+        content_hash = hashlib.sha256(json.dumps(checksums, sort_keys=True).encode('utf-8')).hexdigest()
+        version = f"{datetime.now(timezone.utc):%Y%m%d-%H%M%S}-{content_hash[:8]}"
+        manifest = {
+            'format': SNAPSHOT_FORMAT,
+            'version': version,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'embedding_backend': embedder.backend,
+            'embedding_model': embedder.model,
+            'dimensions': dimensions,
+            'documents': total,
+            'files': {name: {'sha256': checksum, 'bytes': os.path.getsize(os.path.join(work_dir, name))}
+                      for name, checksum in checksums.items()}
+        }
+        with open(os.path.join(work_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        # The version directory only appears once it is complete
+        os.rename(work_dir, os.path.join(root, version))
+        logger.info(f"Built snapshot {version} with {total} documents")
+        return version
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+
+def current_version(root: str = SNAPSHOT_DIR) -> Optional[str]:
+    """Active version named in CURRENT, None if no snapshot has been activated"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def activate(version: str, root: str = SNAPSHOT_DIR):
+    """Point CURRENT at a version; workers pick it up on their next poll"""
+    if not os.path.exists(os.path.join(root, version, 'manifest.json')):
+        raise ValueError(f"No snapshot {version} in {root}")
+    write_atomic(os.path.join(root, CURRENT_FILE), version + '\n')
+    logger.info(f"Activated snapshot {version}")
+
+
+def verify(path: str) -> Dict[str, Any]:
+    """Manifest of a snapshot directory; raises ValueError if any file is missing or corrupt"""
+    with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')}")
+    for name, expected in manifest['files'].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise ValueError(f"Snapshot file {name} is missing")
+        if file_sha256(file_path) != expected['sha256']:
+            raise ValueError(f"Checksum mismatch for snapshot file {name}")
+    return manifest
+
+
+class Snapshot:
+    """A loaded snapshot: corpus, memory-mapped embeddings, filter indexes and BM25"""
+
+    def __init__(self, path: str, verify_files: bool = SNAPSHOT_VERIFY):
+        started = time.perf_counter()
+        if verify_files:
+            self.manifest = verify(path)
+        else:
+            with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        self.version = self.manifest['version']
+
+        self.ids, self.documents, self.metadatas = [], [], []
+        with open(os.path.join(path, 'corpus.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record['id'])
+                self.documents.append(record['document'])
+                self.metadatas.append(record['metadata'])
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+
+        self.embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r')
+        vectors = QuantizedMatrix()
+        vectors.load_normalized(self.embeddings)
+        self.index = LocalIndex(self.ids, self.metadatas, vectors, self._fetch_vectors)
+        self.lexical = BM25Index.load(os.path.join(path, 'bm25'))
+
+        self.load_seconds = time.perf_counter() - started
+        logger.info(f"Loaded snapshot {self.version} ({len(self.ids)} documents) in {self.load_seconds:.2f} seconds")
+
+    def _fetch_vectors(self, doc_ids: List[str]) -> np.ndarray:
+        return np.asarray(self.embeddings[[self.positions[doc_id] for doc_id in doc_ids]])
+
+    def distances(self, positions: List[int], query_embedding: List[float]) -> List[float]:
+        """Exact squared L2 distances (unit vectors) of the given documents to the query"""
+        query = normalize(np.asarray(query_embedding, dtype=np.float32))
+        similarities = np.asarray(self.embeddings[positions]) @ query
+        return [float(2.0 - 2.0 * s) for s in similarities]
+
+
+class SnapshotHolder:
+    """Keeps the active snapshot loaded and switches to new versions without blocking searches"""
+
+    def __init__(self, root: str = SNAPSHOT_DIR, embedder=None):
+        self.root = root
+        # Queries are embedded by this embedder, so snapshots from any other one are refused
+        self.embedder = embedder
+        self._snapshot = None
+        self._checked = 0.0
+        self._loading = False
+        self._lock = threading.Lock()
+        self.switches = 0
+        self.last_error = None
+
+        # The first load is synchronous so a fresh worker serves from the snapshot immediately
+        version = current_version(root)
+        if version:
+            self._load(version)
+
+    def _load(self, version: str):
+        try:
+            snapshot = Snapshot(os.path.join(self.root, version))
+            if self.embedder is not None:
+                built_with = f"{snapshot.manifest.get('embedding_backend', 'openai')}:{snapshot.manifest['embedding_model']}"
+                if built_with != self.embedder.name or snapshot.manifest['dimensions'] != self.embedder.dimensions:
+                    raise ValueError(f"snapshot was embedded with {built_with} ({snapshot.manifest['dimensions']} "
+                                     f"dimensions), queries use {self.embedder.name} ({self.embedder.dimensions})")
+            # Single reference assignment: in-flight searches keep the snapshot they started with
+            self._snapshot = snapshot
+            self.switches += 1
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"{version}: {e}"
+            logger.error(f"Error loading snapshot {version}: {e}")
+        finally:
+            self._loading = False
+
+    def current(self) -> Optional[Snapshot]:
+        """Active snapshot (None if there is none); starts a background switch when CURRENT changes"""
+        now = time.monotonic()
+        if now - self._checked >= SNAPSHOT_POLL_SECONDS:
+            with self._lock:
+                if now - self._checked >= SNAPSHOT_POLL_SECONDS and not self._loading:
+                    self._checked = now
+                    version = current_version(self.root)
+                    loaded = self._snapshot.version if self._snapshot else None
+                    if version and version != loaded and not (self.last_error or '').startswith(f"{version}:"):
+                        logger.info(f"Switching snapshot {loaded} -> {version}")
+                        self._loading = True
+                        threading.Thread(target=self._load, args=(version,), daemon=True).start()
+        return self._snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version if snapshot else None,
+            'documents': len(snapshot.ids) if snapshot else 0,
+            'load_seconds': round(snapshot.load_seconds, 3) if snapshot else None,
+            'switches': self.switches,
+            'last_error': self.last_error
+        }
+
+
+def restore_metadata(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Collection metadata for restoring a snapshot: the embedder recorded in its manifest"""
+    if not manifest.get('embedding_model'):
+        raise ValueError(f"snapshot {manifest.get('version')} does not record its embedder; "
+                         f"rebuild it instead of restoring it")
+    return {
+        'description': 'TDS course content and discourse posts',
+        # Snapshots from before pluggable embedders only record the (OpenAI) model
+        'embedding_backend': manifest.get('embedding_backend', 'openai'),
+        'embedding_model': manifest['embedding_model'],
+        'embedding_dimensions': manifest['dimensions']
+    }
+
+
+def restore(path: str, collection):
+    """Load a snapshot's documents and embeddings into a ChromaDB collection (no re-embedding)"""
+    snapshot = Snapshot(path)
+    for start in range(0, len(snapshot.ids), LOAD_PAGE_SIZE):
+        end = start + LOAD_PAGE_SIZE
+        collection.upsert(
+            ids=snapshot.ids[start:end],
+            documents=snapshot.documents[start:end],
+            metadatas=snapshot.metadatas[start:end],
+            embeddings=np.asarray(snapshot.embeddings[start:end]).tolist()
+        )
+    logger.info(f"Restored {len(snapshot.ids)} documents from snapshot {snapshot.version}")
+
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO)
+    import chromadb
+
+    parser = argparse.ArgumentParser(description='Build and manage retrieval snapshots')
+    parser.add_argument('--root', default=SNAPSHOT_DIR, help='Snapshot directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Export the ChromaDB collection into a new snapshot')
+    build_parser.add_argument('--chroma-path', default='./chroma_db', help='ChromaDB directory')
+    build_parser.add_argument('--activate', action='store_true', help='Make the new snapshot current')
+    subparsers.add_parser('list', help='List snapshot versions')
+    for name, help_text in (('activate', 'Make a version current'), ('verify', 'Check a version against its manifest')):
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument('version')
+    restore_parser = subparsers.add_parser('restore', help='Load a version into a ChromaDB collection')
+    restore_parser.add_argument('version')
+    restore_parser.add_argument('--chroma-path', default='./chroma_db', help='ChromaDB directory')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'build':
+            collection = chromadb.PersistentClient(path=args.chroma_path).get_collection(name="tds_knowledge_base")
+            version = build_snapshot(collection, args.root)
+            if args.activate:
+                activate(version, args.root)
+            print(version)
+        elif args.command == 'list':
+            active = current_version(args.root)
+            if os.path.isdir(args.root):
+                for name in sorted(os.listdir(args.root)):
+                    if os.path.exists(os.path.join(args.root, name, 'manifest.json')):
+                        print(f"{'*' if name == active else ' '} {name}")
+        elif args.command == 'activate':
+            activate(args.version, args.root)
+        elif args.command == 'verify':
+            manifest = verify(os.path.join(args.root, args.version))
+            print(f"{args.version}: OK ({manifest['documents']} documents)")
+        elif args.command == 'restore':
+            path = os.path.join(args.root, args.version)
+            with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+                metadata = restore_metadata(json.load(f))
+            client = chromadb.PersistentClient(path=args.chroma_path)
+            collection = client.get_or_create_collection(name="tds_knowledge_base", metadata=metadata)
+            # get_or_create keeps an existing collection's metadata; it must name the snapshot's embedder
+            recorded = {key: (collection.metadata or {}).get(key) for key in metadata if key.startswith('embedding_')}
+            expected = {key: metadata[key] for key in recorded}
+            if recorded != expected:
+                if collection.count():
+                    raise ValueError(f"collection holds vectors from {recorded}, snapshot from {expected}; "
+                                     f"restore into an empty --chroma-path")
+                collection.modify(metadata=metadata)
+            restore(path, collection)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -1,19 +1,39 @@
 import chromadb
+import hashlib
+import json
 import logging
-from typing import List, Dict, Any
-from openai_client import OpenAIClient
+from typing import List, Dict, Any, Optional, Tuple
+from openai_client import get_openai_client, LatencyBudget, EMBEDDING_DIMENSIONS
+from embedders import create_embedder, embedder_for_collection, collection_metadata
+from indexing_job import IndexingJob
+from reranker import Reranker, RERANK_CANDIDATES
+from local_index import LocalIndexHolder
+from quantization import VECTOR_STORAGE, VECTOR_DIMENSIONS
+from snapshot import Snapshot, SnapshotHolder, SNAPSHOT_DIR
+from shards import Shard, ShardSet, apply_quotas
 import os
 
 logger = logging.getLogger(__name__)
 
+# Queries embedded per request by search_batch (queries are short, unlike indexed documents)
+QUERY_EMBEDDING_BATCH_SIZE = int(os.environ.get("QUERY_EMBEDDING_BATCH_SIZE", "100"))
+# BM25 matches added to the rerank candidates when searching a snapshot (0 = vector search only)
+LEXICAL_CANDIDATES = int(os.environ.get("LEXICAL_CANDIDATES", "10"))
+
 class VectorStore:
     """ChromaDB-based vector store for semantic search"""
     
     def __init__(self):
         self.client = chromadb.PersistentClient(path="./chroma_db")
         self.collection = None
-        self.openai_client = OpenAIClient()
+        self.openai_client = get_openai_client()
+        self.reranker = Reranker()
         self._initialize_collection()
+        self.local_index = LocalIndexHolder(self.collection)
+        # A versioned snapshot, when one is active, serves searches instead of the collection
+        self.snapshots = SnapshotHolder(SNAPSHOT_DIR, self.embedder)
+        # Per-source shard collections, searched in parallel when they exist (see shards.py)
+        self.shards = ShardSet(self.client, self.embedder, self.collection.metadata)
         
     def _initialize_collection(self):
         """Initialize or get the ChromaDB collection"""
@@ -22,130 +42,280 @@ class VectorStore:
             self.collection = self.client.get_collection(name="tds_knowledge_base")
             logger.info("Found existing ChromaDB collection")
         except:
-            # Create new collection
+            # Create new collection, recording the embedder so queries always use the same vector space
             self.collection = self.client.create_collection(
                 name="tds_knowledge_base",
-                metadata={"description": "TDS course content and discourse posts"}
+                metadata={
+                    "description": "TDS course content and discourse posts",
+                    **collection_metadata(create_embedder())
+                }
             )
             logger.info("Created new ChromaDB collection")
+        
+        self.embedder = embedder_for_collection(self.collection.metadata)
+        logger.info(f"Using embedder {self.embedder.name}")
+        
+        dimensions = (self.collection.metadata or {}).get('embedding_dimensions', 1536)
+        if self.embedder.backend == 'openai' and dimensions != EMBEDDING_DIMENSIONS:
+            logger.error(f"Collection holds {dimensions}-dimensional embeddings but EMBEDDING_DIMENSIONS is "
+                         f"{EMBEDDING_DIMENSIONS}; reindex into a fresh chroma_db before changing it")
+            
+    def _document_metadata(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Prepare metadata (ChromaDB doesn't support nested dicts)"""
+        return {
+            'title': doc.get('title', ''),
+            'url': doc.get('url', ''),
+            'type': doc.get('type', ''),
+            'username': doc.get('username', ''),
+            'created_at': doc.get('created_at', ''),
+            'accepted_answer': bool(doc.get('accepted_answer', False)),
+            'topic_id': int(doc.get('topic_id') or -1),
+            # Exact post URLs behind an aggregated thread window
+            'post_urls': json.dumps(doc.get('post_urls') or [])
+        }
+        
+    def index_batch(self, documents: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Embed one batch of documents and commit it to the collection"""
+        ids = [str(doc.get('id') or f"doc_{hashlib.md5(doc['content'].encode('utf-8')).hexdigest()}")
+               for doc in documents]
+        
+        # Skip documents already committed by an earlier (possibly interrupted) run
+        existing = set(self.collection.get(ids=ids, include=[])['ids'])
+        pending = [(doc_id, doc) for doc_id, doc in zip(ids, documents) if doc_id not in existing]
+        if not pending:
+            return {'indexed': 0, 'skipped': len(documents), 'failed': 0}
+        
+        contents = [doc['content'] for _, doc in pending]
+        embeddings = self.embedder.embed(contents)
+        
+        # The embedder pads failed items with zero vectors; never commit those
+        keep = [i for i, embedding in enumerate(embeddings) if any(embedding)]
+        failed = len(pending) - len(keep)
+        if failed:
+            logger.warning(f"Skipping {failed} documents whose embeddings could not be generated")
+        
+        if keep:
+            batch = {
+                'ids': [pending[i][0] for i in keep],
+                'documents': [contents[i] for i in keep],
+                'metadatas': [self._document_metadata(pending[i][1]) for i in keep],
+                'embeddings': [embeddings[i] for i in keep]
+            }
+            self.collection.upsert(**batch)
+            self.local_index.invalidate()
+            # Keep the source shards in step with the main collection once they have been built
+            if self.shards.shards():
+                self.shards.upsert(**batch)
+        
+        return {'indexed': len(keep), 'skipped': len(existing), 'failed': failed}
             
     def index_documents(self, documents: List[Dict[str, Any]]):
-        """Index documents in the vector store"""
+        """Index documents in the vector store, blocking until every batch is committed"""
         if not documents:
             logger.warning("No documents to index")
             return
+        
+        job = IndexingJob(self, documents)
+        job.run()
+        if job.state == 'failed':
+            raise Exception(f"Indexing failed: {job.error}")
             
-        # Check if collection already has documents
-        existing_count = self.collection.count()
-        if existing_count > 0:
-            logger.info(f"Collection already has {existing_count} documents, skipping indexing")
-            return
-            
-        logger.info(f"Indexing {len(documents)} documents...")
-        
-        # Prepare data for ChromaDB
-        ids = []
-        contents = []
-        metadatas = []
-        
-        for doc in documents:
-            # Use document ID or generate one
-            doc_id = doc.get('id') or f"doc_{len(ids)}"
-            ids.append(str(doc_id))
-            contents.append(doc['content'])
+    def lexical_lookup(self, query: str, filters: Optional[Dict[str, Any]] = None) -> Optional[Tuple[Snapshot, List[int]]]:
+        """BM25 matches in the active snapshot, computed ahead of the vector search (None without a snapshot)"""
+        snapshot = self.snapshots.current()
+        if snapshot is None or not query or not LEXICAL_CANDIDATES:
+            return None
+        positions = snapshot.index.select(filters) if filters else None
+        return snapshot, [p for p, _ in snapshot.lexical.search(query, LEXICAL_CANDIDATES, positions)]
+    
+    def lexical_search(self, query: str, lexical_hits: Optional[Tuple[Optional[Snapshot], List[int]]],
+                       n_results: int = 5, rerank: bool = True) -> List[Dict[str, Any]]:
+        """Results from lexical_lookup hits alone, for when the query could not be embedded"""
+        if not lexical_hits or lexical_hits[0] is None or not lexical_hits[1]:
+            return []
+        snapshot, positions = lexical_hits
+        results = {
+            'ids': [[snapshot.ids[p] for p in positions]],
+            'documents': [[snapshot.documents[p] for p in positions]],
+            'metadatas': [[snapshot.metadatas[p] for p in positions]],
+            # No embedding similarity to report. Chroma's l2 distance is squared, so cosine similarity is
+            # 1 - d/2 (as in shards.py and reranker.py); 2.0 reads as similarity 0, not the -1 of 4.0
+            'distances': [[2.0] * len(positions)]
+        }
+        formatted_results = self._format_results(query, results, 0, n_results, rerank)
+        logger.info(f"Found {len(formatted_results)} relevant documents by lexical match only")
+        return formatted_results
+    
+    def _local_query(self, query_embedding: List[float], filters: Optional[Dict[str, Any]], n_candidates: int,
+                     query: str = '', snapshot: Optional[Snapshot] = None, shard: Optional[Shard] = None,
+                     lexical_hits: Optional[Tuple[Optional[Snapshot], List[int]]] = None) -> Dict[str, Any]:
+        """Search the in-memory index, restricted to documents selected by the metadata filter indexes
+        
+        With a snapshot, documents come from its corpus and the best BM25 matches join the candidates
+        (lexical_hits, from lexical_lookup, supplies them precomputed; hits for another snapshot are dropped).
+        With a shard, its own collection and index are searched instead of the main collection.
+        """
+        collection = shard.collection if shard else self.collection
+        index = snapshot.index if snapshot else (shard.local_index if shard else self.local_index).get()
+        positions = index.select(filters) if filters else None
+        neighbours = index.search(query_embedding, positions, n_candidates)
+        if positions is not None:
+            logger.debug(f"Filters matched {len(positions)}/{index.count} documents")
+        
+        if snapshot is not None:
+            if query and LEXICAL_CANDIDATES:
+                found = {doc_id for doc_id, _ in neighbours}
+                if lexical_hits is not None:
+                    hits = lexical_hits[1] if lexical_hits[0] is snapshot else []
+                else:
+                    hits = [p for p, _ in snapshot.lexical.search(query, LEXICAL_CANDIDATES, positions)]
+                lexical = [p for p in hits if snapshot.ids[p] not in found]
+                if lexical:
+                    neighbours += zip([snapshot.ids[p] for p in lexical], snapshot.distances(lexical, query_embedding))
+            hits = [(doc_id, (snapshot.documents[snapshot.positions[doc_id]], snapshot.metadatas[snapshot.positions[doc_id]]),
+                     distance) for doc_id, distance in neighbours]
+        elif neighbours:
+            ids = [doc_id for doc_id, _ in neighbours]
+            fetched = collection.get(ids=ids, include=['documents', 'metadatas'])
+            by_id = {doc_id: (doc, meta) for doc_id, doc, meta in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])}
+            hits = [(doc_id, by_id[doc_id], distance) for doc_id, distance in neighbours if doc_id in by_id]
+        else:
+            hits = []
+        
+        return {
+            'ids': [[doc_id for doc_id, _, _ in hits]],
+            'documents': [[doc for _, (doc, _), _ in hits]],
+            'metadatas': [[meta for _, (_, meta), _ in hits]],
+            'distances': [[distance for _, _, distance in hits]]
+        }
             
-            # Prepare metadata (ChromaDB doesn't support nested dicts)
-            metadata = {
-                'title': doc.get('title', ''),
-                'url': doc.get('url', ''),
-                'type': doc.get('type', ''),
-                'username': doc.get('username', ''),
-                'created_at': doc.get('created_at', '')
+    def _uses_local_index(self, filters: Optional[Dict[str, Any]]) -> bool:
+        # Compact (quantized or truncated) vectors are only searchable through the local index
+        return bool(filters) or VECTOR_STORAGE != 'float32' or bool(VECTOR_DIMENSIONS)
+    
+    def _shard_query(self, shard: Shard, query_embedding: List[float], filters: Optional[Dict[str, Any]],
+                     n_candidates: int, query: str) -> Dict[str, Any]:
+        """Candidates from one shard, through its local index when filters or compact vectors need it"""
+        if self._uses_local_index(filters):
+            return self._local_query(query_embedding, filters, n_candidates, query, shard=shard)
+        return shard.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=min(n_candidates, shard.collection.count()),
+            include=['documents', 'metadatas', 'distances']
+        )
+    
+    def _sharded_search(self, query: str, query_embedding: List[float], n_results: int, n_candidates: int,
+                        rerank: bool, filters: Optional[Dict[str, Any]],
+                        budget: Optional[LatencyBudget]) -> List[Dict[str, Any]]:
+        """Fan out to the source shards, merge, rerank, then apply the per-shard quotas"""
+        results = self.shards.search(
+            lambda shard: self._shard_query(shard, query_embedding, filters, n_candidates, query),
+            filters, n_candidates, timeout=budget.remaining() if budget else None
+        )
+        formatted_results = self._format_results(query, results, 0, n_candidates, rerank)
+        return apply_quotas(formatted_results, n_results, self.shards.quotas)
+    
+    def _format_results(self, query: str, results: Dict[str, Any], row: int, n_results: int,
+                        rerank: bool) -> List[Dict[str, Any]]:
+        """Turn one row of a ChromaDB-shaped result into result dicts, reranked if enabled"""
+        formatted_results = []
+        for i in range(len(results['documents'][row])):
+            result = {
+                'id': results['ids'][row][i],
+                'content': results['documents'][row][i],
+                'metadata': results['metadatas'][row][i],
+                'distance': results['distances'][row][i]
             }
-            metadatas.append(metadata)
+            if 'shards' in results:
+                result['shard'] = results['shards'][row][i]
+            formatted_results.append(result)
         
-        # Generate embeddings using OpenAI with timeout protection
-        try:
-            import threading
-            import queue
-            
-            def generate_embeddings_thread():
-                try:
-                    return self.openai_client.get_embeddings(contents)
-                except Exception as e:
-                    logger.error(f"Error in embedding thread: {e}")
-                    return None
+        if rerank:
+            formatted_results, rerank_info = self.reranker.rerank(query, formatted_results, n_results)
+            logger.debug(f"Reranked {rerank_info['candidates']} candidates in {rerank_info['rerank_ms']}ms")
+        return formatted_results[:n_results]
             
-            # Use a separate thread with timeout for embedding generation
-            result_queue = queue.Queue()
-            
-            def worker():
-                result = generate_embeddings_thread()
-                result_queue.put(result)
-            
-            thread = threading.Thread(target=worker)
-            thread.daemon = True
-            thread.start()
-            
-            # Wait for embeddings with timeout
-            try:
-                embeddings = result_queue.get(timeout=120)  # 2 minute timeout
-                if embeddings is None:
-                    raise Exception("Failed to generate embeddings")
-            except queue.Empty:
-                logger.error("Embedding generation timed out")
-                raise Exception("Embedding generation timed out")
-            
-            # Add to ChromaDB
-            self.collection.add(
-                ids=ids,
-                documents=contents,
-                metadatas=metadatas,
-                embeddings=embeddings
-            )
-            
-            logger.info(f"Successfully indexed {len(documents)} documents")
-            
-        except Exception as e:
-            logger.error(f"Error indexing documents: {e}")
-            # Add basic documents without embeddings for fallback
-            try:
-                self.collection.add(
-                    ids=ids,
-                    documents=contents,
-                    metadatas=metadatas
-                )
-                logger.info(f"Added {len(documents)} documents without embeddings as fallback")
-            except Exception as fallback_error:
-                logger.error(f"Fallback indexing also failed: {fallback_error}")
-                raise
-            
-    def search(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant documents"""
+    def search(self, query: str, n_results: int = 5, budget: Optional[LatencyBudget] = None,
+               rerank: bool = True, filters: Optional[Dict[str, Any]] = None,
+               query_embedding: Optional[List[float]] = None,
+               lexical_hits: Optional[Tuple[Optional[Snapshot], List[int]]] = None) -> List[Dict[str, Any]]:
+        """Search for relevant documents, over-fetching and reranking locally when enabled
+        
+        filters (see local_index.parse_filters) restrict the search by document type,
+        created_at range and topic id before any similarity scoring happens. Pass
+        query_embedding when the caller has already embedded the query, and lexical_hits
+        when it has already run lexical_lookup ((None, []) skips the lexical candidates).
+        """
         try:
             # Generate embedding for the query
-            query_embedding = self.openai_client.get_embeddings([query])[0]
+            if query_embedding is None:
+                query_embedding = self.embedder.embed([query], budget=budget)[0]
             
-            # Search in ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=['documents', 'metadatas', 'distances']
-            )
+            n_candidates = max(n_results, RERANK_CANDIDATES) if rerank else n_results
+            snapshot = self.snapshots.current()
+            if snapshot is None and self.shards.enabled:
+                formatted_results = self._sharded_search(query, query_embedding, n_results, n_candidates,
+                                                         rerank, filters, budget)
+                logger.info(f"Found {len(formatted_results)} relevant documents across shards")
+                return formatted_results
+            if snapshot is not None or self._uses_local_index(filters):
+                results = self._local_query(query_embedding, filters, n_candidates, query, snapshot,
+                                            lexical_hits=lexical_hits)
+            else:
+                # Search in ChromaDB
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_candidates,
+                    include=['documents', 'metadatas', 'distances']
+                )
             
-            # Format results
-            formatted_results = []
-            for i in range(len(results['documents'][0])):
-                result = {
-                    'content': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'distance': results['distances'][0][i]
-                }
-                formatted_results.append(result)
-                
+            formatted_results = self._format_results(query, results, 0, n_results, rerank)
             logger.info(f"Found {len(formatted_results)} relevant documents")
             return formatted_results
             
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
             return []
+    
+    def search_batch(self, queries: List[str], n_results: int = 5, budget: Optional[LatencyBudget] = None,
+                     rerank: bool = True, filters: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Optional[List[Dict[str, Any]]]]:
+        """Search for many queries at once: one batched embedding pass and one ChromaDB query
+        
+        filters, if given, holds one filter dict (or None) per query. Raises on embedding errors
+        so the caller can fail the whole batch; a query whose own embedding failed gets None.
+        """
+        if not queries:
+            return []
+        filters = filters or [None] * len(queries)
+        query_embeddings = self.embedder.embed(queries, budget=budget, batch_size=QUERY_EMBEDDING_BATCH_SIZE)
+        n_candidates = max(n_results, RERANK_CANDIDATES) if rerank else n_results
+        
+        batch_results = [[] if any(embedding) else None for embedding in query_embeddings]
+        snapshot = self.snapshots.current()
+        sharded = snapshot is None and self.shards.enabled
+        # Unfiltered exact searches share one multi-query ChromaDB call
+        shared = [i for i in range(len(queries))
+                  if snapshot is None and not sharded and not self._uses_local_index(filters[i])
+                  and any(query_embeddings[i])]
+        if shared:
+            results = self.collection.query(
+                query_embeddings=[query_embeddings[i] for i in shared],
+                n_results=n_candidates,
+                include=['documents', 'metadatas', 'distances']
+            )
+            for row, i in enumerate(shared):
+                batch_results[i] = self._format_results(queries[i], results, row, n_results, rerank)
+        
+        shared_set = set(shared)
+        for i in range(len(queries)):
+            if i in shared_set or not any(query_embeddings[i]):
+                continue
+            if sharded:
+                batch_results[i] = self._sharded_search(queries[i], query_embeddings[i], n_results, n_candidates,
+                                                        rerank, filters[i], budget)
+                continue
+            results = self._local_query(query_embeddings[i], filters[i], n_candidates, queries[i], snapshot)
+            batch_results[i] = self._format_results(queries[i], results, 0, n_results, rerank)
+        
+        logger.info(f"Batch search for {len(queries)} queries complete")
+        return batch_results
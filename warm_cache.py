@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Warm answer cache for frequent questions
+
+The build job reads recent questions from the question log, clusters their
+embeddings (spherical k-means) and pre-generates a vetted answer for each of the
+most frequent intents. UserFeedback on answers served from the cache decides
+which entries are kept, regenerated or evicted on the next build. Workers load
+the resulting file at startup and answer matching questions without calling the
+chat model.
+
+Usage:
+    python warm_cache.py build --days 30 --clusters 50
+    python warm_cache.py show
+
+Author: TDS Virtual TA
+License: MIT
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from dedup import normalize_text
+from quantization import normalize
+
+logger = logging.getLogger(__name__)
+
+WARM_CACHE_PATH = os.environ.get("WARM_CACHE_PATH", "./warm_cache.npz")
+WARM_CACHE_ENABLED = os.environ.get("WARM_CACHE_ENABLED", "true").lower() == "true"
+# Queries less similar than this (cosine) to a centroid never match it, whatever the cluster's spread
+WARM_CACHE_MIN_SIMILARITY = float(os.environ.get("WARM_CACHE_MIN_SIMILARITY", "0.9"))
+# Only intents asked at least this often get a cached answer
+WARM_CACHE_MIN_CLUSTER_SIZE = int(os.environ.get("WARM_CACHE_MIN_CLUSTER_SIZE", "5"))
+# Generated answers below this confidence are not cached
+WARM_CACHE_MIN_CONFIDENCE = float(os.environ.get("WARM_CACHE_MIN_CONFIDENCE", "0.7"))
+# Feedback needed before it can regenerate or evict an entry, and the bar it must clear
+WARM_CACHE_MIN_FEEDBACK = int(os.environ.get("WARM_CACHE_MIN_FEEDBACK", "3"))
+WARM_CACHE_MIN_HELPFUL = float(os.environ.get("WARM_CACHE_MIN_HELPFUL", "0.6"))
+# Entries still rated badly after this many regenerations are evicted
+WARM_CACHE_MAX_REGENERATIONS = 1
+
+KMEANS_ITERATIONS = 25
+
+
+def normalize_question(text: str) -> str:
+    """Key for exact (case/punctuation-insensitive) question matches"""
+    return ' '.join(normalize_text(text))
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """Cluster unit vectors by cosine similarity; returns (centroids, labels)"""
+    rng = np.random.default_rng(seed)
+    # k-means++ seeding on cosine distance
+    centroids = [vectors[rng.integers(len(vectors))]]
+    for _ in range(1, k):
+        distance = 1.0 - np.max(vectors @ np.array(centroids).T, axis=1)
+        distance = np.clip(distance, 0.0, None)
+        if distance.sum() == 0:
+            break
+        centroids.append(vectors[rng.choice(len(vectors), p=distance / distance.sum())])
+    centroids = np.array(centroids, dtype=np.float32)
+
+    labels = np.zeros(len(vectors), dtype=np.int64)
+    for iteration in range(KMEANS_ITERATIONS):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if iteration and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(len(centroids)):
+            members = vectors[labels == c]
+            if len(members):
+                centroids[c] = normalize(members.sum(axis=0))
+    return centroids, labels
+
+
+class WarmCache:
+    """Pre-generated answers for frequent question intents, matched by text or nearest centroid"""
+
+    def __init__(self, entries: List[Dict[str, Any]], centroids: np.ndarray, embedder: str):
+        self.entries = entries
+        # Name of the embedder behind the centroids; lookups must embed with the same one
+        self.embedder = embedder
+        self.centroids = centroids.astype(np.float32)
+        self.thresholds = np.array([entry['threshold'] for entry in entries], dtype=np.float32)
+        self.by_text = {}
+        for position, entry in enumerate(entries):
+            for question in entry['questions']:
+                self.by_text[normalize_question(question)] = position
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+
+    @classmethod
+    def load(cls, path: str = WARM_CACHE_PATH) -> Optional['WarmCache']:
+        """Load the cache file, None if it is missing or unreadable"""
+        if not os.path.exists(path):
+            logger.info(f"No warm cache at {path}")
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                cache = cls(json.loads(str(data['entries'])), data['centroids'], str(data['embedder']))
+        except Exception as e:
+            logger.error(f"Error loading warm cache from {path}: {e}")
+            return None
+        logger.info(f"Loaded warm cache with {len(cache.entries)} answers from {path}")
+        return cache
+
+    def save(self, path: str = WARM_CACHE_PATH):
+        """Write the cache atomically, so workers never load a partial file"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, entries=np.array(json.dumps(self.entries)),
+                 embedder=np.array(self.embedder))
+        os.replace(tmp_path, path)
+        logger.info(f"Saved warm cache with {len(self.entries)} answers to {path}")
+
+    def lookup_text(self, question: str) -> Optional[Dict[str, Any]]:
+        """Entry whose recorded questions include this one, without any embedding call"""
+        position = self.by_text.get(normalize_question(question))
+        self._record('text_hit' if position is not None else 'text_miss')
+        return self.entries[position] if position is not None else None
+
+    def lookup(self, query_embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Entry whose centroid is nearest to the query, if within that cluster's threshold"""
+        if not self.entries:
+            return None
+        similarities = self.centroids @ normalize(np.asarray(query_embedding, dtype=np.float32))
+        position = int(np.argmax(similarities))
+        if similarities[position] < self.thresholds[position]:
+            self._record('miss')
+            return None
+        self._record('embedding_hit')
+        return self.entries[position]
+
+    def _record(self, outcome: str):
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self.entries), **dict(self._counts)}
+
+
+def feedback_summary(feedback: List[Any]) -> Dict[str, Any]:
+    """Vote count and helpful share, counting ratings of 4-5 as helpful when is_helpful is unset"""
+    votes = []
+    for item in feedback:
+        if item.is_helpful is not None:
+            votes.append(bool(item.is_helpful))
+        elif item.rating is not None:
+            votes.append(item.rating >= 4)
+    return {'votes': len(votes), 'helpful': round(sum(votes) / len(votes), 3) if votes else None}
+
+
+def build(args) -> int:
+    """Cluster recent questions and (re)generate the warm answer set"""
+    from app import app
+    from database import db
+    from models import Question, UserFeedback
+    from openai_client import get_openai_client, answer_confidence, ANSWER_MODEL
+    from vector_store import VectorStore
+
+    previous = WarmCache.load(args.path)
+    previous_by_answer = {entry['answer']: entry for entry in previous.entries} if previous else {}
+
+    with app.app_context():
+        cutoff = datetime.utcnow() - timedelta(days=args.days)
+        rows = db.session.query(Question.id, Question.question_text, Question.answer_text).filter(
+            Question.created_at >= cutoff,
+            Question.has_image.is_(False),
+            Question.relevant_docs_count > 0
+        ).all()
+        rows = [row for row in rows if row.answer_text and not row.answer_text.startswith('ERROR')]
+        logger.info(f"Clustering {len(rows)} questions from the last {args.days} days")
+        if len(rows) < WARM_CACHE_MIN_CLUSTER_SIZE:
+            logger.error("Not enough questions to build a warm cache")
+            return 1
+
+        # Feedback on answers previously served from the cache, keyed by the cached answer text
+        served_ids = defaultdict(list)
+        for row in rows:
+            if row.answer_text in previous_by_answer:
+                served_ids[row.answer_text].append(row.id)
+        all_served = [question_id for ids in served_ids.values() for question_id in ids]
+        feedback_by_question = defaultdict(list)
+        if all_served:
+            for item in db.session.query(UserFeedback).filter(UserFeedback.question_id.in_(all_served)).all():
+                feedback_by_question[item.question_id].append(item)
+
+    openai_client = get_openai_client()
+    vector_store = VectorStore()
+    embeddings = vector_store.embedder.embed([row.question_text for row in rows], batch_size=100)
+    vectors = normalize(np.asarray(embeddings, dtype=np.float32))
+    valid = np.flatnonzero(np.linalg.norm(vectors, axis=1) > 0)
+    vectors = vectors[valid]
+    rows = [rows[i] for i in valid]
+
+    k = max(1, min(args.clusters * 2, len(rows) // WARM_CACHE_MIN_CLUSTER_SIZE))
+    centroids, labels = spherical_kmeans(vectors, k, args.seed)
+    sizes = np.bincount(labels, minlength=len(centroids))
+    frequent = [c for c in np.argsort(-sizes) if sizes[c] >= WARM_CACHE_MIN_CLUSTER_SIZE][:args.clusters]
+    logger.info(f"{len(frequent)} of {len(centroids)} clusters have at least {WARM_CACHE_MIN_CLUSTER_SIZE} questions")
+
+    entries, kept_centroids = [], []
+    counts = defaultdict(int)
+    for c in frequent:
+        members = np.flatnonzero(labels == c)
+        similarities = vectors[members] @ centroids[c]
+        # Accept queries as close to the centroid as most of the cluster's own questions
+        threshold = max(WARM_CACHE_MIN_SIMILARITY, float(np.percentile(similarities, 10)))
+        representative = rows[members[int(np.argmax(similarities))]].question_text
+        # Only questions inside the threshold become exact-text keys (k-means also assigns outliers)
+        questions = sorted({rows[m].question_text for m, sim in zip(members, similarities) if sim >= threshold})
+
+        # Reuse the previous answer for this intent unless its feedback says otherwise
+        reused = None
+        for m in members:
+            old = previous_by_answer.get(rows[m].answer_text)
+            if old is not None:
+                reused = old
+                break
+        regenerations = 0
+        if reused is not None:
+            feedback = [item for question_id in served_ids[reused['answer']] for item in feedback_by_question[question_id]]
+            summary = feedback_summary(feedback)
+            badly_rated = summary['votes'] >= WARM_CACHE_MIN_FEEDBACK and summary['helpful'] < WARM_CACHE_MIN_HELPFUL
+            if not badly_rated:
+                entries.append({**reused, 'questions': questions, 'size': int(sizes[c]),
+                                'threshold': threshold, 'feedback': summary})
+                kept_centroids.append(centroids[c])
+                counts['kept'] += 1
+                continue
+            if reused.get('regenerations', 0) >= WARM_CACHE_MAX_REGENERATIONS:
+                logger.info(f"Evicting cached answer for '{representative[:60]}' (helpful {summary['helpful']})")
+                counts['evicted'] += 1
+                continue
+            regenerations = reused.get('regenerations', 0) + 1
+            counts['regenerated'] += 1
+
+        docs = vector_store.search(representative, n_results=5)
+        if not docs:
+            counts['no_context'] += 1
+            continue
+        try:
+            result = openai_client.complete_answer(representative, docs, model=ANSWER_MODEL)
+        except Exception as e:
+            logger.error(f"Error generating warm answer for '{representative[:60]}': {e}")
+            counts['failed'] += 1
+            continue
+        confidence = answer_confidence(result)
+        if confidence < WARM_CACHE_MIN_CONFIDENCE:
+            counts['low_confidence'] += 1
+            continue
+
+        entries.append({
+            'question': representative,
+            'questions': questions,
+            'answer': result['answer'],
+            'links': result['links'],
+            # Documents the answer was generated from, logged for questions served from the cache
+            'relevant_docs_count': len(docs),
+            'confidence': confidence,
+            'size': int(sizes[c]),
+            'threshold': threshold,
+            'regenerations': regenerations,
+            'generated_at': datetime.utcnow().isoformat(),
+            'feedback': {'votes': 0, 'helpful': None}
+        })
+        kept_centroids.append(centroids[c])
+        counts['generated'] += 1
+
+    dimensions = vectors.shape[1]
+    cache = WarmCache(entries, np.array(kept_centroids, dtype=np.float32).reshape(-1, dimensions),
+                      vector_store.embedder.name)
+    cache.save(args.path)
+    logger.info(f"Warm cache build: {dict(counts)}")
+    return 0
+
+
+def show(args) -> int:
+    """Print the cached intents with their traffic share and feedback"""
+    cache = WarmCache.load(args.path)
+    if cache is None:
+        return 1
+    for entry in cache.entries:
+        print(json.dumps({key: entry[key] for key in ('question', 'size', 'threshold', 'confidence', 'feedback')
+                          if key in entry}))
+    return 0
+
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Build or inspect the warm answer cache')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Cluster recent questions and pre-generate answers')
+    build_parser.add_argument('--days', type=int, default=30, help='Question log window in days')
+    build_parser.add_argument('--clusters', type=int, default=50, help='Most frequent intents to cache')
+    build_parser.add_argument('--seed', type=int, default=42, help='k-means seed')
+    build_parser.add_argument('--path', default=WARM_CACHE_PATH, help='Cache file to write')
+    build_parser.set_defaults(func=build)
+
+    show_parser = subparsers.add_parser('show', help='List cached intents')
+    show_parser.add_argument('--path', default=WARM_CACHE_PATH, help='Cache file to read')
+    show_parser.set_defaults(func=show)
+
+    args = parser.parse_args()
+    started = time.time()
+    status = args.func(args)
+    logger.info(f"Done in {time.time() - started:.1f} seconds")
+    return status
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())